@@ -0,0 +1,515 @@
+#=========================================================================
+# Timing and consistency checks for the optimised parts of the
+# post-processing pipeline. Each benchmark compares the current
+# implementation against the original one it replaced and prints
+# the timings and a short consistency report.
+#
+# Usage: python benchmarks.py jitter --num 1000000
+#        python benchmarks.py peters --num 5000000
+#        python benchmarks.py storage --num 1000000
+#        python benchmarks.py reader --num 3000000
+#        python benchmarks.py foreground --num 3000000
+#        python benchmarks.py gwcirc --num 100000
+#        python benchmarks.py skyframe --num 5000000
+#        python benchmarks.py photometry --num 5000000
+#        python benchmarks.py ratios --num 1000000
+#        python benchmarks.py startup --num 4
+#=========================================================================
+
+import os
+import sys
+import time
+import subprocess
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+import jitter
+import peters
+import lbandio
+import foreground
+import gwcirc
+import skyframe
+import functions
+import massratio
+import postproc as pp
+from population import Population
+
+
+def timed(func, *args, **kwargs):
+    '''
+    Calls func and returns its result and the wall time in seconds.
+    '''
+    t0 = time.perf_counter()
+    out = func(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+#=========================================================================
+# Position jitter
+#=========================================================================
+
+def random_sphere_loop(R, num):
+    '''
+    The original rejection sampler of postproc.random_sphere,
+    one point per loop iteration.
+    '''
+    X = []
+    Y = []
+    Z = []
+    while len(X) < num:
+        x = np.random.uniform(-R, R)
+        y = np.random.uniform(-R, R)
+        z = np.random.uniform(-R, R)
+        r = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+        if r > R:
+            continue
+        if r <= R:
+            X.append(x)
+            Y.append(y)
+            Z.append(z)
+    X = np.array(X)
+    Y = np.array(Y)
+    Z = np.array(Z)
+    return X, Y, Z
+
+
+def bench_jitter(num):
+    (x0, y0, z0), t_loop = timed(random_sphere_loop, 1.0, num)
+    r0 = np.sqrt(x0 ** 2 + y0 ** 2 + z0 ** 2)
+    print('{:>14s}: {:8.3f} s, <r> = {:.4f}, <r^2> = {:.4f}'.format('loop', t_loop, r0.mean(), (r0 ** 2).mean()))
+    # <r> and <r^2> of a uniform unit sphere are 3/4 and 3/5
+    for profile in jitter.profiles:
+        (x, y, z), t = timed(jitter.sample_offsets, 1.0, num, profile)
+        r = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+        print('{:>14s}: {:8.3f} s, <r> = {:.4f}, <r^2> = {:.4f}, speed-up {:.0f}x'.format(
+            profile, t, r.mean(), (r ** 2).mean(), t_loop / t))
+
+
+#=========================================================================
+# Peters evolution
+#=========================================================================
+
+def random_population(num):
+    '''
+    A synthetic population of formed DWDs spanning merged, Roche-lobe
+    overflowing and detached systems at their FIRE age.
+    '''
+    mass_1 = np.random.uniform(0.2, 1.3, num)
+    mass_2 = np.random.uniform(0.15, 1.0, num) * mass_1
+    tphys = np.random.uniform(10, 13000, num)
+    return Population({'mass_1': mass_1, 'mass_2': mass_2, 
+                       'sep': 10 ** np.random.uniform(-2, 1, num), 
+                       'rad_1': pp.rad_WD(mass_1), 'rad_2': pp.rad_WD(mass_2), 
+                       'tphys': tphys, 'age': np.random.uniform(tphys / 1000, 13.7)})
+
+
+def helper_cuts(pop):
+    '''
+    The merger and RLOF cuts and GW evolution with the separate
+    helpers in postproc, as filter_population used to apply them.
+    '''
+    pop, pop_merge = pp.merging_pop(pop)
+    pop, pop_RLOF = pp.RLOF_pop(pop)
+    return pp.evolve(pop)
+
+
+def fused_cuts(pop, use_numba):
+    status, t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw = peters.evolve_population(
+        pop.mass_1, pop.mass_2, pop.sep, pop.rad_2, pop.tphys, pop.age, use_numba=use_numba)
+    alive = np.flatnonzero(status == peters.ALIVE)
+    pop.take(alive)
+    for name, arr in zip(['t_delay', 't_RLOF', 't_evol', 'sep_f', 'porb_f', 'f_gw'], 
+                         [t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw]):
+        pop[name] = arr[alive]
+    return pop
+
+
+def bench_peters(num):
+    base = random_population(num)
+    copy = lambda: base.subset(slice(None))
+    ref, t_ref = timed(helper_cuts, copy())
+    print('{:>14s}: {:8.3f} s, {} of {} systems detached'.format('helpers', t_ref, len(ref), num))
+    variants = [('numpy', False)]
+    if peters.numba is not None:
+        fused_cuts(random_population(10), True)  # compile
+        variants.append(('numba', True))
+    for name, use_numba in variants:
+        out, t = timed(fused_cuts, copy(), use_numba)
+        same = len(out) == len(ref) and all(np.array_equal(ref[col], out[col], equal_nan=True) 
+                                            for col in ref.columns)
+        print('{:>14s}: {:8.3f} s, speed-up {:.1f}x, identical to helpers: {}'.format(name, t, t_ref / t, same))
+        if not same and len(out) == len(ref):
+            for col in ref.columns:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    err = np.nanmax(np.abs(out[col] / ref[col] - 1))
+                print('{:>20s}: max relative difference {:.2e}'.format(col, err))
+
+
+#=========================================================================
+# Lband storage
+#=========================================================================
+
+def random_Lband(num, chunk_rows):
+    '''
+    Synthetic Lband chunks with the columns and value ranges of
+    postproc.save_Lband output.
+    '''
+    chunks = []
+    for start in range(0, num, chunk_rows):
+        n = min(chunk_rows, num - start)
+        pop = random_population(n)
+        Lband = pd.DataFrame({col: pop[col] for col in pop.columns})
+        for col in ['kstar_1', 'kstar_2']:
+            Lband[col] = np.random.choice([10., 11., 12.], n)
+        for col in ['bin_num', 'FIRE_index']:
+            Lband[col] = np.random.randint(0, 2 ** 24, n)
+        for col in ['met', 'kern_len', 'porb', 't_delay', 't_RLOF', 't_evol', 'sep_f', 'porb_f', 
+                    'xGx', 'yGx', 'zGx', 'X', 'Y', 'Z', 'dist_sun']:
+            Lband[col] = np.random.uniform(-20, 20, n)
+        Lband['f_gw'] = 10 ** np.random.uniform(-4, -1, n)
+        chunks.append(Lband)
+    return chunks
+
+
+def dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def bench_storage(num, chunk_rows=100000):
+    chunks = random_Lband(num, chunk_rows)
+    tmp = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmp, 'Lband.hdf')
+        _, t_write = timed(lambda: [lbandio.write_Lband(chunk, fname) for chunk in chunks])
+        _, t_read = timed(lbandio.read_Lband, fname)
+        _, t_cols = timed(lbandio.read_Lband, fname, columns=['met', 'f_gw'])
+        print('{:>14s}: write {:7.3f} s, {:8.1f} MB, read {:7.3f} s, read met+f_gw {:7.3f} s'.format(
+            'hdf', t_write, dir_size(fname) / 1e6, t_read, t_cols))
+        if lbandio.pa is None:
+            print('pyarrow is not installed, skipping the parquet backend')
+            return
+        for codec in lbandio.codecs:
+            root = os.path.join(tmp, codec)
+            _, t_write = timed(lambda: [lbandio.write_Lband_parquet(chunk, root, '10_10', 0.5, 0.0001, k, codec=codec) 
+                                        for k, chunk in enumerate(chunks)])
+            _, t_read = timed(lbandio.read_Lband_dataset, root)
+            _, t_cols = timed(lbandio.read_Lband_dataset, root, columns=['met', 'f_gw'])
+            print('{:>14s}: write {:7.3f} s, {:8.1f} MB, read {:7.3f} s, read met+f_gw {:7.3f} s'.format(
+                'parquet ' + codec, t_write, dir_size(root) / 1e6, t_read, t_cols))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def append_loop(filenames):
+    '''
+    The original way of loading many Lband files: growing one
+    dataframe file by file (DataFrame.append, which current pandas
+    no longer has, was a concat of the two frames).
+    '''
+    dat = pd.DataFrame()
+    for f in filenames:
+        dat = pd.concat([dat, pd.read_hdf(f, key='Lband')])
+    return dat
+
+
+def bench_reader(num, n_files=30):
+    chunks = random_Lband(num, -(-num // n_files))
+    tmp = tempfile.mkdtemp()
+    try:
+        files = [os.path.join(tmp, 'Lband_{}.hdf'.format(k)) for k in range(len(chunks))]
+        for f, chunk in zip(files, chunks):
+            lbandio.write_Lband(chunk, f)
+        ref, t_ref = timed(append_loop, files)
+        print('{:>14s}: {:8.3f} s, {} rows'.format('append loop', t_ref, len(ref)))
+        for nthreads in [1, 4]:
+            out, t = timed(lbandio.read_Lband_files, files, nthreads=nthreads)
+            same = np.array_equal(out.values, ref.values)
+            print('{:>14s}: {:8.3f} s, speed-up {:.1f}x, identical: {}'.format(
+                'threads={}'.format(nthreads), t, t_ref / t, same))
+        out, t = timed(lbandio.read_Lband_files, files, columns=['met', 'f_gw'], 
+                       predicate=lambda Lband: Lband.f_gw > 1e-3)
+        print('{:>14s}: {:8.3f} s, speed-up {:.1f}x, {} rows'.format('met+f_gw cut', t, t_ref / t, len(out)))
+    finally:
+        shutil.rmtree(tmp)
+
+
+#=========================================================================
+# Foreground power spectrum
+#=========================================================================
+
+def dense_foreground(f_gw, power, window):
+    '''
+    The original foreground: groupby sum into the dense spectrum and
+    its rolling median over all the 1/Tobs bins.
+    '''
+    bins = foreground.lisa_bins()
+    dat = pd.DataFrame({'power': power, 'digits': np.digitize(f_gw, bins)})
+    summed = dat.groupby('digits').power.sum()
+    power_foreground = np.zeros(len(bins))
+    power_foreground[np.array(summed.index.astype(int))] = summed
+    power_dat = pd.DataFrame(np.vstack([bins, power_foreground]).T, columns=['f_gw', 'strain_2'])
+    return power_dat, power_dat.rolling(window).median()
+
+
+def bench_foreground(num, window=1000):
+    f_gw = 10**np.random.normal(-3.3, 0.5, num)
+    f_gw = f_gw[f_gw < foreground.f_max]
+    power = 10**np.random.normal(-44, 1, len(f_gw))
+    # build the bins and compile the numba loop outside the timings
+    foreground.lisa_bins()
+    foreground.running_median(np.arange(3), np.ones(3), 10, 2)
+    (power_dat, median), t_ref = timed(dense_foreground, f_gw, power, window)
+    print('{:>14s}: {:8.3f} s'.format('dense', t_ref))
+    (occupied, summed), t_sum = timed(foreground.bin_power, f_gw, power)
+    (start, stop, values), t_med = timed(foreground.running_median, occupied, summed, len(power_dat), window)
+    print('{:>14s}: {:8.3f} s, speed-up {:.1f}x, {} occupied bins'.format(
+        'sparse', t_sum + t_med, t_ref / (t_sum + t_med), len(occupied)))
+    dense = foreground.total_power(occupied, summed).strain_2.values
+    print('power: max relative difference {:.2e}'.format(
+        np.max(np.abs(dense - power_dat.strain_2.values) / np.where(dense > 0, dense, 1))))
+    ref = foreground.total_power(occupied, summed).rolling(window).median().strain_2.values
+    ref[:window - 1] = 0
+    out = np.zeros(len(ref))
+    for a, b, value in zip(start, stop, values):
+        out[a:b] = value
+    print('running median identical on the same spectrum: {}'.format(np.array_equal(out, ref)))
+
+
+#=========================================================================
+# Circular GW fast path
+#=========================================================================
+
+def bench_gwcirc(num, rtol=1e-6):
+    '''
+    gwcirc against a legwork Source without interpolation, for the
+    stat_tol of get_resolvedDWDs (most binaries evolving) and the
+    legwork default (most stationary). tests/test_gwcirc.py asserts
+    the agreement; this reports it with the timings.
+    '''
+    import astropy.units as u
+    import legwork.source as source
+    from legwork import psd, utils
+
+    m_1 = np.random.uniform(0.2, 1.2, num)
+    m_2 = np.random.uniform(0.2, 1.2, num)
+    f_gw = 10**np.random.uniform(-4, -1.3, num)
+    dist = np.random.uniform(0.1, 30, num)
+    t_obs = 4 * u.yr
+    t_obs_s = t_obs.to(u.s).value
+    def lisa_psd(f):
+        return psd.power_spectral_density(f * u.Hz, t_obs=t_obs, approximate_R=True, 
+                                          confusion_noise=None).to(u.Hz**(-1)).value
+    for stat_tol in [1/t_obs_s, 1e-2]:
+        sources = source.Source(m_1=m_1 * u.Msun, m_2=m_2 * u.Msun, ecc=np.zeros(num), 
+                                dist=dist * u.kpc, f_orb=f_gw/2 * u.Hz, stat_tol=stat_tol, 
+                                interpolate_g=False, interpolate_sc=False, 
+                                sc_params={"instrument": "LISA", "t_obs": t_obs, "approximate_R": True, 
+                                           "confusion_noise": None})
+        ref, t_ref = timed(sources.get_snr, t_obs=t_obs)
+        snr, t = timed(gwcirc.SNR_circ, m_1, m_2, f_gw, dist, lisa_psd, t_obs=t_obs_s, stat_tol=stat_tol)
+        err = np.max(np.abs(snr / ref - 1))
+        print('SNR, stat_tol {:.1e}: legwork {:.3f} s, gwcirc {:.3f} s, speed-up {:.1f}x, '
+              'max relative difference {:.1e} (< {:.0e}: {})'.format(
+              stat_tol, t_ref, t, t_ref / t, err, rtol, err < rtol))
+    h_0 = u.Quantity(sources.get_h_0_n(harmonics=[2])).to('').value.flatten()
+    err = np.max(np.abs(gwcirc.h_2(m_1, m_2, f_gw, dist) / h_0 - 1))
+    print('h_0: max relative difference {:.1e} (< {:.0e}: {})'.format(err, rtol, err < rtol))
+    chirp = utils.fn_dot(sources.m_c, sources.f_orb, sources.ecc, n=2).to(u.Hz / u.s).value
+    err = np.max(np.abs(gwcirc.chirp_circ(m_1, m_2, f_gw) / chirp - 1))
+    print('chirp: max relative difference {:.1e} (< {:.0e}: {})'.format(err, rtol, err < rtol))
+
+
+#=========================================================================
+# Ecliptic sky positions
+#=========================================================================
+
+def bench_skyframe(num, tol_uas=1):
+    '''
+    skyframe's matrix product against SkyCoord.transform_to for a
+    jittered galaxy around the Galactic centre. The difference is
+    given as an angle on the sky in micro-arcseconds, for all systems
+    and for those further than 10 pc from the Sun, where round-off of
+    the positions in kpc is far below a micro-arcsecond.
+    '''
+    X, Y, Z = jitter.sample_offsets(15, num, 'uniform')
+    Z = Z / 10
+    # build the transform outside the timings
+    skyframe.galactocentric_to_ecliptic()
+    (colat_ref, lon_ref), t_ref = timed(skyframe.astropy_colat_lon, X, Y, Z)
+    (colat, lon), t = timed(skyframe.ecliptic_colat_lon, X, Y, Z)
+    print('astropy {:.3f} s, matrix product {:.3f} s, speed-up {:.1f}x'.format(t_ref, t, t_ref / t))
+    # small angle between the directions
+    sep = np.hypot(colat - colat_ref, np.sin(colat_ref) * np.angle(np.exp(1j * (lon - lon_ref))))
+    sep_uas = np.degrees(sep) * 3600e6
+    R, offset = skyframe.galactocentric_to_ecliptic()
+    dist = np.linalg.norm(R @ np.vstack([X, Y, Z]) + offset[:, np.newaxis], axis=0)
+    far = dist > 0.01
+    print('max difference {:.2e} uas, beyond 10 pc {:.2e} uas (< {} uas: {})'.format(
+        sep_uas.max(), sep_uas[far].max(), tol_uas, sep_uas[far].max() < tol_uas))
+
+
+#=========================================================================
+# WD photometry
+#=========================================================================
+
+def mag_both_branches(data, i, m_lim):
+    '''
+    The original ZTF selection: mag_bol from both Mestel branches of
+    every WD, then WD_Cooling and T_eff again for the selected rows.
+    '''
+    def L_both(kstar, M, t):
+        A = functions.A_val(kstar)
+        Z = functions.met_arr[i+1] * np.ones(len(t))
+        L = 300 * (9000 * A) ** 5.3 * M * Z ** 0.4 / (A * (t + 0.1)) ** 6.48
+        L_young = 300 * M * Z ** 0.4 / (A * (t + 0.1)) ** 1.18
+        L[t < 9000.0] = L_young[t < 9000.0]
+        return L * functions.L_sol
+
+    def cooling(data):
+        return (L_both(data.kstar_1.values, data.mass_1.values, data.t_evol_1.values),
+                L_both(data.kstar_2.values, data.mass_2.values, data.t_evol_2.values))
+
+    L1, L2 = cooling(data)
+    d = data.dist_sun.values * 1000
+    m1 = 4.8 - 2.5 * np.log10(L1 / functions.L_sol) + 5 * np.log10(d / 10)
+    m2 = 4.8 - 2.5 * np.log10(L2 / functions.L_sol) + 5 * np.log10(d / 10)
+    m_tot = -2.5 * np.log10(10 ** (-0.4 * m1) + 10 ** (-0.4 * m2))
+    selected = data[m_tot <= m_lim]
+    L1, L2 = cooling(selected)
+    return m_tot, functions.T_eff(L1, L2, selected)
+
+
+def bench_photometry(num, m_lim=23, i=5, rtol=1e-12, n_runs=5):
+    mass_1 = np.random.uniform(0.2, 1.3, num)
+    mass_2 = np.random.uniform(0.15, 1.0, num) * mass_1
+    pop = pd.DataFrame({'mass_1': mass_1, 'mass_2': mass_2, 
+                        'rad_1': pp.rad_WD(mass_1), 'rad_2': pp.rad_WD(mass_2), 
+                        'kstar_1': np.random.choice([10, 11, 12], num), 
+                        'kstar_2': np.random.choice([10, 11, 12], num), 
+                        't_evol_1': np.random.uniform(0, 13000, num), 
+                        't_evol_2': np.random.uniform(0, 13000, num), 
+                        'dist_sun': np.random.uniform(0.01, 30, num)})
+    # best of n_runs, single timings of these short calls are noisy
+    t_ref = min(timed(mag_both_branches, pop, i, m_lim)[1] for k in range(n_runs))
+    m_ref, (T1_ref, T2_ref) = mag_both_branches(pop, i, m_lim)
+    print('{:>14s}: {:8.3f} s'.format('both branches', t_ref))
+    t = min(timed(functions.photometry, pop, i)[1] for k in range(n_runs))
+    phot = functions.photometry(pop, i)
+    selected = phot[phot.mag.values <= m_lim]
+    print('{:>14s}: {:8.3f} s, speed-up {:.1f}x'.format('photometry', t, t_ref / t))
+    print('same selection: {}'.format(np.array_equal(phot.mag.values <= m_lim, m_ref <= m_lim)))
+    err = max(np.max(np.abs(selected.T_1.values / T1_ref - 1)), np.max(np.abs(selected.T_2.values / T2_ref - 1)),
+              np.max(np.abs(phot.mag.values - m_ref)))
+    print('max difference in T_eff (relative) and mag: {:.1e} (< {:.0e}: {})'.format(err, rtol, err < rtol))
+
+
+#=========================================================================
+# Singles-to-binaries mass ratios
+#=========================================================================
+
+def bench_ratios(num, n_runs=20):
+    '''
+    The integrated mass ratios against the mean of n_runs Monte Carlo
+    samples of num systems each (the size get_ratios sampled with
+    COSMIC) and against the tabulated ratios of functions.py, which
+    carry the Monte Carlo scatter of a single COSMIC sample.
+    '''
+    settings = massratio.sampler_settings()
+    massratio._means.clear()
+    ratio_05, t = timed(massratio.mass_ratio, 0.5, settings)
+    print('integrated: {:.5f} in {:.3f} s, then {:.1e} s per binary fraction'.format(
+        ratio_05, t, timed(massratio.mass_ratio, functions.binfracs, settings)[1] / len(functions.binfracs)))
+    samples, t = timed(lambda: [massratio.monte_carlo_ratio(0.5, num, settings) for k in range(n_runs)])
+    mean, err = np.mean(samples), np.std(samples) / np.sqrt(n_runs)
+    print('Monte Carlo: {:.5f} +- {:.5f} ({} x {} systems, {:.1f} s), scatter of one sample {:.4f}, '
+          'integral within 3 sigma: {}'.format(mean, err, n_runs, num, t, np.std(samples), 
+                                               abs(mean - ratio_05) < 3 * err))
+    ratios = np.round(massratio.mass_ratio(functions.binfracs, settings), 2)
+    print('tabulated ratios matched to 0.01: {} of {}, largest difference {:.2f}'.format(
+        np.sum(ratios == functions.ratios), len(ratios), np.max(np.abs(ratios - functions.ratios))))
+
+
+#=========================================================================
+# Import time
+#=========================================================================
+
+# what importing postproc, functions and visualization used to do on top
+# of what they do now: import legwork, scipy and astropy.coordinates and
+# compute the Sun's position
+eager_imports = ('import constants, legwork.source, legwork.visualisation, seaborn, scipy.interpolate, '
+                 'scipy.optimize, scipy.integrate, astropy.coordinates; constants.sun_yGx')
+
+
+def python_time(code, n_runs=3):
+    '''
+    Shortest wall time in seconds of a fresh interpreter running code.
+    '''
+    times = []
+    for k in range(n_runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def worker_code(nproc, imports):
+    # the pool is started from python -c so that the spawned workers only
+    # run imports, not this script
+    return ('import multiprocessing as mp\n'
+            'ctx = mp.get_context("spawn")\n'
+            'with ctx.Pool({}, initializer=exec, initargs=({!r},)) as pool:\n'
+            '    pool.map(abs, range({}))').format(nproc, imports, nproc)
+
+
+def bench_startup(nproc):
+    '''
+    Import times of the main modules, and the time to start nproc
+    spawned workers that import postproc, against the same with the
+    imports and the Sun's position that used to come with them.
+    '''
+    print('python: {:.2f} s'.format(python_time('pass')))
+    for module in ['postproc', 'functions', 'visualization']:
+        t = python_time('import {}'.format(module))
+        t_ref = python_time('import {}; {}'.format(module, eager_imports))
+        print('import {:>13s}: {:.2f} s, {:.2f} s with the eager imports, {:.2f} s saved'.format(
+            module, t, t_ref, t_ref - t))
+    t = python_time(worker_code(nproc, 'import postproc'))
+    t_ref = python_time(worker_code(nproc, 'import postproc; ' + eager_imports))
+    print('{} spawned workers importing postproc: {:.2f} s, {:.2f} s with the eager imports'.format(nproc, t, t_ref))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=['jitter', 'peters', 'storage', 'reader', 'foreground', 'gwcirc', 
+                                                  'skyframe', 'photometry', 
+                                                  'ratios', 'startup'])
+    parser.add_argument('--num', default=1000000, type=int, help='number of systems per benchmark')
+    parser.add_argument('--seed', default=42, type=int, help='random seed')
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    if args.benchmark == 'jitter':
+        bench_jitter(args.num)
+    elif args.benchmark == 'peters':
+        bench_peters(args.num)
+    elif args.benchmark == 'storage':
+        bench_storage(args.num)
+    elif args.benchmark == 'reader':
+        bench_reader(args.num)
+    elif args.benchmark == 'foreground':
+        bench_foreground(args.num)
+    elif args.benchmark == 'gwcirc':
+        bench_gwcirc(args.num)
+    elif args.benchmark == 'skyframe':
+        bench_skyframe(args.num)
+    elif args.benchmark == 'photometry':
+        bench_photometry(args.num)
+    elif args.benchmark == 'ratios':
+        bench_ratios(args.num)
+    elif args.benchmark == 'startup':
+        bench_startup(args.num)
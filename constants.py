@@ -0,0 +1,57 @@
+#===================================================================================
+# Constants shared by the post-processing modules and scripts.
+#
+# The position of the Sun in the Galactocentric frame (sun_g, sun_yGx,
+# sun_zGx) needs astropy.coordinates, get_sun and a frame transform. It is
+# only computed when one of them is first used, and then cached, so that
+# importing a module, or starting a worker process, does not pay for it.
+# The modules that use it read it as constants.sun_yGx etc.; a plain
+# "from constants import sun_yGx" also works but computes it at import.
+#===================================================================================
+
+from astropy import constants as const
+from astropy import units as u
+
+
+# LEGWORK uses astropy units so we do also for consistency
+G = const.G.value
+c = const.c.value  # speed of light in m s^-1
+M_sol = const.M_sun.value  # sun's mass in kg
+R_sol = const.R_sun.value  # sun's radius in metres
+sec_Myr = u.Myr.to('s')  # seconds in a million years
+m_kpc = u.kpc.to('m')  # metres in a kiloparsec
+L_sol = const.L_sun.value  # solar luminosity in Watts
+Z_sun = 0.02  # solar metallicity
+M_astro = 7070  # FIRE star particle mass in solar masses
+mag_lim = 23  # chosen bolometric magnitude limit
+sun_time = "2021-04-23T00:00:00"  # UTC date of the Sun's position
+
+_sun_g = None
+
+
+def sun_galactocentric():
+    '''
+    Position of the Sun at sun_time in astropy's Galactocentric frame,
+    computed once per process.
+    '''
+    global _sun_g
+    if _sun_g is None:
+        import astropy.coordinates as coords
+        from astropy.time import Time
+        sun = coords.get_sun(Time(sun_time, scale='utc'))
+        _sun_g = sun.transform_to(coords.Galactocentric)
+    return _sun_g
+
+
+# values computed on first access, see __getattr__
+lazy = {'sun_g': lambda: sun_galactocentric(),
+        'sun_yGx': lambda: sun_galactocentric().galcen_distance.to('kpc').value,
+        'sun_zGx': lambda: sun_galactocentric().z.to('kpc').value}
+
+
+def __getattr__(name):
+    if name in lazy:
+        value = lazy[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -11,32 +11,10 @@
 #=========================================================================
 
 import numpy as np
-from astropy import constants as const
-from astropy import units as u
-import astropy.coordinates as coords
-from astropy.time import Time
 import argparse
 import postproc as pp
 
 
-# Set constants:
-# LEGWORK uses astropy units so we do also for consistency
-G = const.G.value
-c = const.c.value  # speed of light in m s^-1
-M_sol = const.M_sun.value  # sun's mass in kg
-R_sol = const.R_sun.value  # sun's radius in metres
-sec_Myr = u.Myr.to('s')  # seconds in a million years
-m_kpc = u.kpc.to('m')  # metres in a kiloparsec
-L_sol = const.L_sun.value  # solar luminosity in Watts
-Z_sun = 0.02  # solar metallicity
-sun = coords.get_sun(Time("2021-04-23T00:00:00", scale='utc'))
-sun_g = sun.transform_to(coords.Galactocentric)
-sun_yGx = sun_g.galcen_distance.to('kpc').value
-sun_zGx = sun_g.z.to('kpc').value
-M_astro = 7070  # FIRE star particle mass in solar masses
-mag_lim = 23  # chosen bolometric magnitude limit
-
-
 parser = argparse.ArgumentParser()
 parser.add_argument('--DWD-list', nargs='+', default=['He_He', 'CO_He', 'CO_CO', 'ONe_X'])
 parser.add_argument('--path', default='./', help='path to COSMIC dat files')
@@ -44,7 +22,22 @@ parser.add_argument('--FIRE-path', default='./', help='path to FIRE.h5 data')
 parser.add_argument('--lband-path', default='./', help='path to save LISA band DWD data')
 parser.add_argument('--nproc', default=1, type=int, help='number of processes to allow if using on compute cluster')
 parser.add_argument('--interfile', default='False', type=str, help='if True, saves DWD formation, mergers, and RLOF data')
+parser.add_argument('--compress', action='store_true', help='store each unique (conv row, FIRE particle) pair once with a weight column')
+parser.add_argument('--prefilter', action='store_true', help='only sample systems that are alive and in the LISA band at their FIRE age (no bin_num_pw column or interfiles)')
+parser.add_argument('--kernel', default='uniform', choices=['uniform', 'gaussian', 'cubic_spline'], 
+                    help='radial profile of the position offsets around each FIRE star particle')
+parser.add_argument('--seed', default=None, type=int, help='root seed of the run; a fresh one is drawn and printed if not given')
+parser.add_argument('--resume', action='store_true', help='continue an interrupted run after the last completed chunk of every task')
+parser.add_argument('--compact-schema', action='store_true', help='write Lband tables with downcast dtypes (see lbandio.py)')
+parser.add_argument('--backend', default='hdf', choices=['hdf', 'parquet'], 
+                    help='append Lband rows to one HDF file per task, or write them to a partitioned parquet dataset')
+parser.add_argument('--codec', default='zstd', choices=['none', 'snappy', 'gzip', 'brotli', 'lz4', 'zstd'], 
+                    help='compression codec of the parquet backend')
+parser.add_argument('--verbose', action='store_true', help='report chunks that are retried in smaller pieces')
 
 args = parser.parse_args()
 
-pp.save_full_galaxy(args.DWD_list, args.path, args.FIRE_path, args.lband_path, args.interfile, args.nproc)
+pp.save_full_galaxy(args.DWD_list, args.path, args.FIRE_path, args.lband_path, args.interfile, args.nproc, 
+                    compress=args.compress, prefilter=args.prefilter, kernel=args.kernel, seed=args.seed, 
+                    resume=args.resume, compact_schema=args.compact_schema, backend=args.backend, 
+                    codec=args.codec, verbose=args.verbose)
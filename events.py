@@ -0,0 +1,117 @@
+#===================================================================================
+# Per-binary interaction events from the COSMIC bpp tables. For every bin_num
+# of a dat file, event_table extracts the separation and time of the first
+# Roche-lobe overflow (evol_type 3) and of the first common envelope
+# (evol_type 7) into arrays sorted by bin_num, so that the Lband rows of both
+# binary fraction models can look up their events with one searchsorted
+# instead of regrouping the bpp table for every model.
+#
+# Tables can be cached as .npz files in a cache directory; a cached table is
+# reused as long as the size and modification time of its dat file match.
+#===================================================================================
+
+import os
+import numpy as np
+import pandas as pd
+
+import sidecar
+
+
+RLOF = 3  # evol_type of the start of Roche-lobe overflow
+CE = 7  # evol_type of a common envelope
+
+columns = ['RLOFsep', 'RLOFtime', 'CEsep', 'CEtime']
+
+
+def first_rows(bin_num):
+    '''
+    Indices of the first row of every bin_num, in the original row
+    order, sorted by bin_num.
+
+    Inputs: bin_num array
+
+    Outputs: unique bin_nums, index of their first rows
+    '''
+    order = np.argsort(bin_num, kind='stable')
+    uniq, first = np.unique(bin_num[order], return_index=True)
+    return uniq, order[first]
+
+
+def read_bpp(filename, key='bpp'):
+    '''
+    Reads the bin_num, evol_type, sep and tphys columns of the
+    RLOF and CE rows of a bpp table.
+    '''
+    cols = ['bin_num', 'evol_type', 'sep', 'tphys']
+    with pd.HDFStore(filename, mode='r') as store:
+        storer = store.get_storer(key)
+        if storer.is_table and 'evol_type' in storer.data_columns:
+            return store.select(key, columns=cols, where='evol_type in [{}, {}]'.format(RLOF, CE))
+        bpp = store[key]
+    if 'bin_num' not in bpp.columns:
+        bpp = bpp.reset_index()
+    bpp = bpp[cols]
+    return bpp.loc[bpp.evol_type.isin([RLOF, CE])]
+
+
+def build_table(bpp):
+    '''
+    Event table of a bpp dataframe: bin_num (sorted) and the sep and
+    tphys of the first RLOF and CE rows of every binary, NaN for
+    binaries without such an event.
+    '''
+    bin_num = bpp.bin_num.values
+    evol_type = bpp.evol_type.values
+    table = {'bin_num': np.unique(bin_num)}
+    for name, evol in [('RLOF', RLOF), ('CE', CE)]:
+        rows = np.flatnonzero(evol_type == evol)
+        uniq, first = first_rows(bin_num[rows])
+        pos = np.searchsorted(table['bin_num'], uniq)
+        for col, src in [('sep', 'sep'), ('time', 'tphys')]:
+            values = np.full(len(table['bin_num']), np.nan)
+            values[pos] = bpp[src].values[rows[first]]
+            table[name + col] = values
+    return table
+
+
+def event_table(filename, cache_dir=None):
+    '''
+    Returns the event table of the dat file filename (see build_table),
+    from cache_dir if it holds an up-to-date copy, otherwise reading
+    its bpp table and, with a cache_dir, caching the result.
+    '''
+    state = sidecar.file_state(filename)
+    if cache_dir is not None:
+        cache = os.path.join(cache_dir, os.path.basename(filename) + '.events.npz')
+        if os.path.exists(cache):
+            with np.load(cache) as npz:
+                if npz['size'] == state['size'] and npz['mtime_ns'] == state['mtime_ns']:
+                    return {col: npz[col] for col in ['bin_num'] + columns}
+    table = build_table(read_bpp(filename))
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache + '.{}.tmp.npz'.format(os.getpid())
+        np.savez(tmp, size=state['size'], mtime_ns=state['mtime_ns'], **table)
+        os.replace(tmp, cache)
+    return table
+
+
+def gather(table, bin_num):
+    '''
+    Looks up the events of every entry of bin_num.
+
+    Inputs: event table, bin_num array (any order, with repeats)
+
+    Outputs: dict of RLOFsep, RLOFtime, CEsep, CEtime arrays aligned
+    with bin_num, NaN where a binary has no such event
+    '''
+    bin_num = np.asarray(bin_num)
+    pos = np.searchsorted(table['bin_num'], bin_num)
+    found = pos < len(table['bin_num'])
+    found[found] = table['bin_num'][pos[found]] == bin_num[found]
+    out = {}
+    for col in columns:
+        values = np.full(len(bin_num), np.nan)
+        values[found] = table[col][pos[found]]
+        out[col] = values
+    return out
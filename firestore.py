@@ -0,0 +1,125 @@
+#===================================================================================
+# FIRE star particle catalogue store. FIRE.h5 is read and sorted by
+# metallicity once; the columns needed to build galaxies are cached as
+# .npy files in a cache directory under the output path (never next to
+# FIRE.h5, whose directory may be read-only or shared) and memory-mapped
+# by every process that needs them, so repeated make_galaxy calls and
+# worker processes share one copy in the page cache instead of
+# re-reading and re-sorting the file.
+#===================================================================================
+
+import os
+import numpy as np
+import pandas as pd
+
+
+columns = ['met', 'age', 'kern_len', 'xGx', 'yGx', 'zGx', 'FIRE_index']
+
+# one store per FIRE path, cache path and process
+_stores = {}
+
+
+def get_FIRE_store(fire_path, cache_path):
+    '''
+    Returns the FIREStore for fire_path with its cache in cache_path,
+    creating it on first use in this process.
+    '''
+    if (fire_path, cache_path) not in _stores:
+        _stores[(fire_path, cache_path)] = FIREStore(fire_path, cache_path)
+    return _stores[(fire_path, cache_path)]
+
+
+class FIREStore(object):
+    '''
+    Memory-mapped, metallicity-sorted view of FIRE.h5.
+
+    Parameters
+    ----------
+    fire_path : `str`
+        directory holding FIRE.h5
+    cache_path : `str`
+        directory for the .npy column cache, e.g. the output path +
+        'FIRE_cache/' as postproc uses
+    '''
+    def __init__(self, fire_path, cache_path):
+        self.fire_path = fire_path
+        self.cache_path = cache_path
+        self._arrays = None
+        self._offsets = {}
+
+    def __len__(self):
+        return len(self.arrays['met'])
+
+    def _column_file(self, col):
+        return os.path.join(self.cache_path, '{}.npy'.format(col))
+
+    def _cache_is_fresh(self):
+        fire_file = os.path.join(self.fire_path, 'FIRE.h5')
+        t_fire = os.path.getmtime(fire_file)
+        for col in columns:
+            f = self._column_file(col)
+            if not os.path.exists(f) or os.path.getmtime(f) < t_fire:
+                return False
+        return True
+
+    def build(self):
+        '''
+        Reads FIRE.h5, sorts it by metallicity and writes one
+        contiguous .npy file per column. Files are written under a
+        temporary name and renamed so that concurrent readers never
+        see a partial cache.
+        '''
+        FIRE = pd.read_hdf(os.path.join(self.fire_path, 'FIRE.h5')).sort_values('met')
+        FIRE['FIRE_index'] = FIRE.index
+        os.makedirs(self.cache_path, exist_ok=True)
+        for col in columns:
+            arr = np.ascontiguousarray(FIRE[col].values)
+            tmp = self._column_file(col) + '.{}.tmp'.format(os.getpid())
+            with open(tmp, 'wb') as f:
+                np.save(f, arr)
+            os.replace(tmp, self._column_file(col))
+
+    @property
+    def arrays(self):
+        '''
+        Dictionary of read-only memory-mapped column arrays, sorted
+        by metallicity. The cache is (re)built if it is missing or
+        older than FIRE.h5.
+        '''
+        if self._arrays is None:
+            if not self._cache_is_fresh():
+                self.build()
+            self._arrays = {col: np.load(self._column_file(col), mmap_mode='r')
+                            for col in columns}
+        return self._arrays
+
+    def offsets(self, met_arr, Z_sun=0.02):
+        '''
+        Start and end rows of every metallicity bin in the sorted
+        catalogue, found with searchsorted. Bin i holds
+        met_arr[i] <= met * Z_sun <= met_arr[i+1], and the last bin is
+        open-ended, as in make_galaxy.
+        '''
+        key = (tuple(met_arr), Z_sun)
+        if key not in self._offsets:
+            met = self.arrays['met']
+            met_start = np.asarray(met_arr[:-1]) / Z_sun
+            met_end = np.asarray(met_arr[1:]) / Z_sun
+            start = np.searchsorted(met, met_start, side='left')
+            end = np.searchsorted(met, met_end, side='right')
+            end[-1] = len(met)
+            self._offsets[key] = (start, end)
+        return self._offsets[key]
+
+    def get_bin(self, i, met_arr, Z_sun=0.02):
+        '''
+        Returns the star particles of metallicity bin i as a dataframe
+        indexed by FIRE_index. The columns are views of the read-only
+        memory-mapped arrays, not copies; selections (iloc, loc)
+        return new arrays as usual.
+        '''
+        start, end = self.offsets(met_arr, Z_sun)
+        sl = slice(start[i], end[i])
+        FIRE_bin = pd.DataFrame({col: self.arrays[col][sl] for col in columns}, copy=False)
+        FIRE_bin.index = FIRE_bin.FIRE_index.values
+        return FIRE_bin
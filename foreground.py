@@ -0,0 +1,255 @@
+#===================================================================================
+# Galactic foreground power spectrum. The GW power of the DWDs is binned in
+# frequency bins of width 1/Tobs from 1e-9 to 0.1 Hz, about 12.6 million bins
+# of which only the few around the populated frequencies are not empty, so
+# the spectrum is kept sparse: the indices of the occupied bins (as given by
+# np.digitize on lisa_bins) and the power summed in each with np.bincount.
+# It is also saved sparse (sparse_power, with the grid of power_grid);
+# total_power expands it to the dense table when that is needed.
+#
+# The confusion noise is fitted to the running median of the spectrum over
+# window bins. In a window the zero bins only enter as a count, so
+# running_median keeps the sorted non-zero values of the window and only
+# updates them where a non-zero bin enters or leaves it; in between, the
+# median is constant. This gives the same median, bin by bin, as
+# DataFrame.rolling(window).median() on the dense spectrum. The loop over
+# these events is compiled with numba if it is installed.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+f_min = 1e-9  # Hz
+f_max = 1e-1  # Hz
+df = 1/(4 * 3.155e7)  # Hz, 1/Tobs for Tobs = 4 yr
+f_fit_max = 1.2e-3  # Hz, highest frequency of the confusion fit
+
+_lisa_bins = None
+
+
+def lisa_bins():
+    '''
+    Frequency bins of width 1/Tobs of the foreground power spectrum,
+    built once per process.
+    '''
+    global _lisa_bins
+    if _lisa_bins is None:
+        _lisa_bins = np.arange(f_min, f_max, df)
+    return _lisa_bins
+
+
+def bin_index(f_gw):
+    '''
+    np.digitize(f_gw, lisa_bins()): the bins are evenly spaced, so
+    the index is computed directly and only corrected by one where
+    rounding puts f_gw on the wrong side of a bin edge.
+    '''
+    bins = lisa_bins()
+    f_gw = np.asarray(f_gw, dtype=float)
+    digits = np.clip(np.floor((f_gw - f_min) / df).astype(np.int64) + 1, 0, len(bins))
+    below = (digits > 0) & (bins[np.maximum(digits - 1, 0)] > f_gw)
+    digits[below] -= 1
+    above = (digits < len(bins)) & (bins[np.minimum(digits, len(bins) - 1)] <= f_gw)
+    digits[above] += 1
+    return digits
+
+
+def bin_power(f_gw, power):
+    '''
+    Sums power in the frequency bins of f_gw.
+
+    Outputs: indices of the occupied bins (sorted), power in each
+    '''
+    occupied, inverse = np.unique(bin_index(f_gw), return_inverse=True)
+    return occupied, np.bincount(inverse, weights=power, minlength=len(occupied))
+
+
+def _compact(occupied, power):
+    occupied = np.concatenate(occupied)
+    uniq, inverse = np.unique(occupied, return_inverse=True)
+    return uniq, np.bincount(inverse, weights=np.concatenate(power), minlength=len(uniq))
+
+
+def sum_power(parts):
+    '''
+    Adds up the sparse spectra (occupied, power) of an iterable of
+    parts, e.g. the bin_power of every chunk of a galaxy. The parts
+    are merged whenever they hold more entries than the merged
+    spectrum, so memory stays of the order of the occupied bins.
+    '''
+    occupied, power = [np.zeros(0, dtype=int)], [np.zeros(0)]
+    n_merged, n_buffered = 0, 0
+    for occ, pw in parts:
+        occupied.append(occ)
+        power.append(pw)
+        n_buffered += len(occ)
+        if n_buffered > max(n_merged, int(1e6)):
+            merged = _compact(occupied, power)
+            occupied, power = [merged[0]], [merged[1]]
+            n_merged, n_buffered = len(merged[0]), 0
+    return _compact(occupied, power)
+
+
+def update_power(occupied, power, digits, delta, reference):
+    '''
+    Adds delta to the power in the bins digits, e.g. minus the power of
+    newly resolved sources, without binning all sources again. Every
+    entry of digits must be an occupied bin. Bins left with less than
+    1e-12 of their power in reference (the spectrum of all sources)
+    are set to zero, so that round-off does not keep a bin whose
+    sources were all removed occupied.
+
+    Outputs: updated power of the occupied bins
+    '''
+    power = power.copy()
+    np.add.at(power, np.searchsorted(occupied, digits), delta)
+    power[power < 1e-12 * reference] = 0
+    return power
+
+
+def total_power(occupied, power):
+    '''
+    Dense spectrum as a dataframe of f_gw (the bin edges) and
+    strain_2 (the power in the bin), e.g. to rebuild the full
+    spectrum from the bin and strain_2 columns of sparse_power.
+    '''
+    bins = lisa_bins()
+    inside = occupied < len(bins)
+    strain_2 = np.zeros(len(bins))
+    strain_2[occupied[inside]] = power[inside]
+    return pd.DataFrame(np.vstack([bins, strain_2]).T, columns=['f_gw', 'strain_2'])
+
+
+def sparse_power(occupied, power):
+    '''
+    Non-zero bins of the spectrum as a dataframe of bin (the index
+    into lisa_bins), f_gw (its bin edge, as in total_power) and
+    strain_2 (the power in the bin), as saved in the total_power and
+    residual_power keys of the resolved DWD files.
+    '''
+    bins = lisa_bins()
+    keep = (occupied < len(bins)) & (power != 0)
+    return pd.DataFrame({'bin': occupied[keep], 'f_gw': bins[occupied[keep]], 'strain_2': power[keep]})
+
+
+def power_grid():
+    '''
+    Definition of the frequency bins of sparse_power, saved in the
+    power_grid key of the resolved DWD files.
+    '''
+    return pd.DataFrame({'f_min': [f_min], 'df': [df], 'n_bins': [len(lisa_bins())]})
+
+
+def _median_runs(occupied, power, leaving, events, n_bins, window):
+    # sorted non-zero values of the current window
+    values = np.zeros(window)
+    n_values = 0
+    start = np.zeros(len(events), dtype=np.int64)
+    stop = np.zeros(len(events), dtype=np.int64)
+    median = np.zeros(len(events))
+    n_runs = 0
+    enter, leave = 0, 0
+    for k in range(len(events)):
+        pos = events[k]
+        while leave < len(leaving) and leaving[leave] == pos:
+            j = np.searchsorted(values[:n_values], power[leave])
+            for m in range(j, n_values - 1):
+                values[m] = values[m+1]
+            n_values -= 1
+            leave += 1
+        while enter < len(occupied) and occupied[enter] == pos:
+            j = np.searchsorted(values[:n_values], power[enter])
+            for m in range(n_values, j, -1):
+                values[m] = values[m-1]
+            values[j] = power[enter]
+            n_values += 1
+            enter += 1
+        # the window holds window - n_values zeros before the sorted values
+        n_zero = window - n_values
+        if window % 2 == 0:
+            if window // 2 < n_zero:
+                continue
+            low = 0.0 if window // 2 - 1 < n_zero else values[window // 2 - 1 - n_zero]
+            value = (values[window // 2 - n_zero] + low) / 2
+        else:
+            if window // 2 < n_zero:
+                continue
+            value = values[window // 2 - n_zero]
+        if value == 0:
+            continue
+        start[n_runs] = max(pos, window - 1)
+        stop[n_runs] = events[k+1] if k + 1 < len(events) else n_bins
+        median[n_runs] = value
+        n_runs += 1
+    return start[:n_runs], stop[:n_runs], median[:n_runs]
+
+
+if numba is not None:
+    _median_runs = numba.njit(cache=True)(_median_runs)
+
+
+def running_median(occupied, power, n_bins, window):
+    '''
+    Median of the spectrum over the window bins ending at every bin,
+    i.e. DataFrame.rolling(window).median() of the dense spectrum of
+    n_bins bins, with the bins without a full window left out.
+
+    Outputs: start, stop and value of the runs of bins [start, stop)
+    with the same non-zero median; the median of every other bin
+    from window - 1 on is zero
+    '''
+    nonzero = power != 0
+    occupied = occupied[nonzero].astype(np.int64)
+    power = power[nonzero].astype(np.float64)
+    leaving = occupied + window
+    events = np.union1d(occupied, leaving)
+    events = events[events < n_bins]
+    start, stop, median = _median_runs(occupied, power, leaving, events, n_bins, window)
+    runs = start < stop
+    return start[runs], stop[runs], median[runs]
+
+
+def median_frequency(positions, window):
+    '''
+    Running median of the bin edges over the window bins ending at
+    positions, as DataFrame.rolling(window).median() gives it.
+    '''
+    bins = lisa_bins()
+    if window % 2 == 0:
+        return (bins[positions - window//2 + 1] + bins[positions - window//2]) / 2
+    return bins[positions - window//2]
+
+
+def conf_func(x, a, b, c, d, e):
+    '''
+    Fourth order polynomial in log10(f) fitted to log10 of the running
+    median of the foreground power.
+    '''
+    return a + b*x + c*x**2 + d*x**3 + e*x**4
+
+
+def conf_fit(occupied, power, window=1000):
+    '''
+    Fits conf_func to the running median of the foreground over window
+    bins, at the bins from window on with a non-zero median and a
+    median frequency up to f_fit_max.
+
+    Outputs: polynomial coefficients
+    '''
+    from scipy.optimize import curve_fit
+    start, stop, median = running_median(occupied, power, len(lisa_bins()), window)
+    lengths = stop - start
+    positions = np.repeat(start, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    strain_2 = np.repeat(median, lengths)
+    f_gw = median_frequency(positions, window)
+    fit = (positions >= window) & (f_gw <= f_fit_max)
+    popt, pcov = curve_fit(conf_func,
+                           xdata=np.log10(f_gw[fit]),
+                           ydata=np.log10(strain_2[fit]))
+    return popt
@@ -31,6 +31,7 @@ import legwork.psd as lisa
 import legwork.evol as evol
 from legwork import source
 import pdb
+import jitter
 
 G = const.G.value
 c = const.c.value  # speed of light in m s^-1
@@ -310,32 +311,14 @@ def a_of_RLOF(set):
 def random_sphere(R, num):
     '''
     Generates "num" number of random points within a
-    sphere of radius R. It picks random x, y, z values
-    within a cube and discards it if it's outside the
-    sphere.
+    sphere of radius R, drawn all at once with
+    jitter.sample_offsets.
 
     Inputs: Radius in kpc, num is an integer
 
     Outputs: X, Y, Z arrays of length num
     '''
-    X = []
-    Y = []
-    Z = []
-    while len(X) < num:
-        x = np.random.uniform(-R, R)
-        y = np.random.uniform(-R, R)
-        z = np.random.uniform(-R, R)
-        r = np.sqrt(x ** 2 + y ** 2 + z ** 2)
-        if r > R:
-            continue
-        if r <= R:
-            X.append(x)
-            Y.append(y)
-            Z.append(z)
-    X = np.array(X)
-    Y = np.array(Y)
-    Z = np.array(Z)
-    return X, Y, Z
+    return jitter.sample_offsets(R, num, 'uniform')
 
 def rad_WD(M):
     '''
@@ -16,34 +16,26 @@
 import pandas as pd
 import numpy as np
 pd.options.mode.chained_assignment = None
-from scipy.special import jv
-from astropy import constants as const
 from astropy import units as u
-import astropy.coordinates as coords
-from astropy.time import Time
-import legwork.utils as utils
-import legwork.strain as strain
-import legwork.snr as snr
-import legwork.psd as lisa
-import legwork.evol as evol
-from legwork import source
-
-G = const.G.value
-c = const.c.value  # speed of light in m s^-1
-M_sol = const.M_sun.value  # sun's mass in kg
-R_sol = const.R_sun.value  # sun's radius in metres
-sec_Myr = u.Myr.to('s')  # seconds in a million years
-m_kpc = u.kpc.to('m')  # metres in a kiloparsec
-L_sol = const.L_sun.value  # solar luminosity in Watts
-Z_sun = 0.02  # solar metallicity
-sun = coords.get_sun(Time("2021-04-23T00:00:00", scale='utc'))
-sun_g = sun.transform_to(coords.Galactocentric)
-sun_yGx = sun_g.galcen_distance.to('kpc').value
-sun_zGx = sun_g.z.to('kpc').value
-M_astro = 7070  # FIRE star particle mass in solar masses
-mag_lim = 23  # chosen bolometric magnitude limit
-
-FIRE = pd.read_hdf('FIRE.h5').sort_values('met')
+from firestore import get_FIRE_store
+import jitter
+import gwcirc
+import psdcache
+import skyframe
+import massratio
+import constants
+
+# legwork is only imported by LISA_FIRE_galaxy for eccentric binaries, and
+# the Sun's position (sun_g, sun_yGx, sun_zGx) is computed on first use,
+# see constants.py
+from constants import G, c, M_sol, R_sol, sec_Myr, L_sol, Z_sun, M_astro, mag_lim
+
+
+def __getattr__(name):
+    if name in constants.lazy:
+        return getattr(constants, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
 
 # Specific to Thiele et al. (2021), here are the used metallicity
 # array, the associated binary fractions for each Z value, and the ratios 
@@ -120,13 +112,25 @@ def get_binfrac_of_Z(Z):
     binfrac = np.append(binfrac_low, binfrac_high)
     return binfrac
 
-def get_ratios(binfracs):
+def get_ratios(binfracs, method='analytic', cache_dir=None):
     '''
     Calculates the ratio of mass in singles to mass
     in binaries in cosmic for solar metallicity stars.
     These ratios can be used to scale galaxies for a specific
     binary fraction.
+    
+    With method='analytic' the ratios are integrated from the
+    sampler's IMF and mass ratio distribution (see massratio.py,
+    cached in cache_dir); with method='cosmic' they are sampled with
+    COSMIC's independent sampler, 1e6 systems per binary fraction.
     '''
+    if method == 'analytic':
+        ratio_05 = np.round(massratio.mass_ratio(0.5, cache_dir=cache_dir), 2)
+        ratios = np.round(massratio.mass_ratio(binfracs, cache_dir=cache_dir), 2)
+        return ratio_05, ratios
+    elif method != 'cosmic':
+        raise ValueError('method must be analytic or cosmic, not {}'.format(method))
+    
     from cosmic.sample.initialbinarytable import InitialBinaryTable
     from cosmic.sample.sampler import independent
     final_kstar1 = [10, 11, 12]
@@ -370,32 +374,14 @@ def a_of_RLOF(set):
 def random_sphere(R, num):
     '''
     Generates "num" number of random points within a
-    sphere of radius R. It picks random x, y, z values
-    within a cube and discards it if it's outside the
-    sphere.
+    sphere of radius R, drawn all at once with
+    jitter.sample_offsets.
 
     Inputs: Radius in kpc, num is an integer
 
     Outputs: X, Y, Z arrays of length num
     '''
-    X = []
-    Y = []
-    Z = []
-    while len(X) < num:
-        x = np.random.uniform(-R, R)
-        y = np.random.uniform(-R, R)
-        z = np.random.uniform(-R, R)
-        r = np.sqrt(x ** 2 + y ** 2 + z ** 2)
-        if r > R:
-            continue
-        if r <= R:
-            X.append(x)
-            Y.append(y)
-            Z.append(z)
-    X = np.array(X)
-    Y = np.array(Y)
-    Z = np.array(Z)
-    return X, Y, Z
+    return jitter.sample_offsets(R, num, 'uniform')
 
 def rad_WD(M):
     '''
@@ -431,36 +417,31 @@ def WD_Cooling(data, i):
     equation 1. Returns the evolved present-day luminosity
     of each binary component.
     
+    Both branches are a power law, b M Z^0.4 / (A (t + 0.1))^x, so
+    each WD is evaluated once with the b and x of its branch: young
+    for cooling ages below 9000 Myr, old otherwise. A and the old b
+    only depend on kstar and are looked up.
+    
     Returns luminosity in Watts.
     '''
-    def L_WD(A, b, x, M, Z, t):
-        return (b * M * Z ** (0.4)) / (A * (t + 0.1)) ** x
-    
-    def b_old(A):
-        b = 300 * (9000 * A) ** (5.3)
-        return b
-    
     x_old = 6.48
     b_young = 300
     x_young = 1.18
-
-    A1 = A_val(data.kstar_1.values)
-    A2 = A_val(data.kstar_2.values)
-    M1 = data.mass_1.values
-    M2 = data.mass_2.values
-    Z = met_arr[i+1] * np.ones(len(data))    
-    t1 = data.t_evol_1.values
-    t2 = data.t_evol_2.values
-    
-    L1_young = L_WD(A1, b_young, x_young, M1, Z, t1)
-    L1 = L_WD(A1, b_old(A1), x_old, M1, Z, t1)
-    L2_young = L_WD(A2, b_young, x_young, M2, Z, t2)
-    L2 = L_WD(A2, b_old(A2), x_old, M2, Z, t2)
-    
-    L1[t1 < 9000.0] = L1_young[t1 < 9000.0]
-    L2[t2 < 9000.0] = L2_young[t2 < 9000.0]
-    L1 = L1 * L_sol
-    L2 = L2 * L_sol
+    
+    # A and old b of kstar 0 to 15 (non-WD kstars have A = 0)
+    A_table = A_val(np.arange(16))
+    b_old_table = 300 * (9000 * A_table) ** (5.3)
+    Z_fac = met_arr[i+1] ** (0.4)
+    
+    def L_WD(kstar, M, t):
+        kstar = np.clip(kstar, 0, 15).astype(np.int64)
+        young = t < 9000.0
+        b = np.where(young, b_young, b_old_table[kstar])
+        x = np.where(young, x_young, x_old)
+        return (b * M * Z_fac) / (A_table[kstar] * (t + 0.1)) ** x * L_sol
+    
+    L1 = L_WD(data.kstar_1.values, data.mass_1.values, data.t_evol_1.values)
+    L2 = L_WD(data.kstar_2.values, data.mass_2.values, data.t_evol_2.values)
     return L1, L2
 
 def T_eff(L1, L2, data):
@@ -475,35 +456,50 @@ def T_eff(L1, L2, data):
     T2 = (L2 / (4 * np.pi * sigma * r2 ** 2)) ** (1 / 4)
     return T1, T2
 
-def mag_bol(data, i):
+def photometry(data, i):
+    '''
+    Luminosities (WD_Cooling), effective temperatures (T_eff) and
+    combined apparent bolometric magnitude of every binary of data in
+    one pass. The result is row by row with data, so a selection on
+    mag can be applied to it (by position) and to data alike instead
+    of computing the photometry of the selected rows again.
+    
+    Outputs: dataframe of L_1, L_2 [W], T_1, T_2 [K] and mag
+    '''
     L1, L2 = WD_Cooling(data, i)
+    T1, T2 = T_eff(L1, L2, data)
     d = data.dist_sun.values * 1000
-    M1_bol = 4.8 - 2.5 * np.log10(L1 / L_sol)
-    m1_bol = M1_bol + 5 * np.log10(d / 10)
-    M2_bol = 4.8 - 2.5 * np.log10(L2 / L_sol)
-    m2_bol = M2_bol + 5 * np.log10(d / 10)
-    m_tot = -2.5 * np.log10(10 ** (-0.4 * m1_bol) + 10 ** (-0.4 * m2_bol))
-    return m_tot
+    # the fluxes of the two WDs add up: 10^(-0.4 m1) + 10^(-0.4 m2)
+    # is 10^(-0.4 m) of the summed luminosity
+    m_tot = 4.8 - 2.5 * np.log10((L1 + L2) / L_sol) + 5 * np.log10(d / 10)
+    return pd.DataFrame({'L_1': L1, 'L_2': L2, 'T_1': T1, 'T_2': T2, 'mag': m_tot})
+
+def mag_bol(data, i):
+    return photometry(data, i).mag.values
   
 #===================================================================================
 # Functions to create specialty files and our LISA galaxies:
 #===================================================================================
 
-def ZTF_df(data_i, m_lim, i):
+def ZTF_df(data_i, m_lim, i, phot=None):
     '''
     Builds galaxy files for ZTF team. Magnitude equations taken
     from:
     https://www.astro.princeton.edu/~gk/A403/constants.pdf
     https://www.astro.keele.ac.uk/jkt/pubs/JKTeq-fluxsum.pdf
+    
+    phot is the photometry of data_i if already computed.
     '''
     
-    m_tot = mag_bol(data_i, i)
-    data = data_i[(m_tot <= m_lim)&(data_i.porb_f.values <= 10)]
-    L1, L2 = WD_Cooling(data, i)
+    if phot is None:
+        phot = photometry(data_i, i)
+    keep = (phot.mag.values <= m_lim)&(data_i.porb_f.values <= 10)
+    data = data_i[keep]
+    phot = phot[keep]
     
     inc = np.arccos(np.random.uniform(0, 1, len(data)))
     d = data.dist_sun.values
-    T1, T2 = T_eff(L1, L2, data)
+    T1, T2 = phot.T_1.values, phot.T_2.values
     df = pd.DataFrame()
     
     # Columns that could be taken out later:
@@ -524,24 +520,25 @@ def ZTF_df(data_i, m_lim, i):
     df['inc'] = inc    
     return df
 
-def LISA_analysis_df(data):
-    from astropy.coordinates import SkyCoord
-    from astropy.coordinates import ICRS, Galactic
-    import astropy.units as u
-    
+def LISA_analysis_df(data, fast=True):
+    '''
+    Catalogue of the LISA-band systems of data for LISA data analysis:
+    orbital frequency, chirp, ecliptic co-latitude and longitude,
+    strain amplitude and random inclination, polarisation and phase.
+    The sky positions are computed with the fixed Galactocentric to
+    ecliptic transform of skyframe.py, or with SkyCoord if not fast.
+    '''
     psi = np.random.uniform(0, 2*np.pi, len(data))
     inc = np.arccos(np.random.uniform(0, 1, len(data)))
     
     Omega = np.random.uniform(0, 2*np.pi, len(data))
     
-    coords = SkyCoord(np.array(data.X), np.array(data.Y),
-                      np.array(data.Z), unit='kpc', frame='galactocentric')
-    coords = coords.transform_to(frame='barycentrictrueecliptic')
-    
-    theta = np.pi / 2 - coords.lat.rad
-    phi = coords.lon.rad
+    if fast:
+        theta, phi = skyframe.ecliptic_colat_lon(data.X.values, data.Y.values, data.Z.values)
+    else:
+        theta, phi = skyframe.astropy_colat_lon(data.X.values, data.Y.values, data.Z.values)
     
-    f_orb = data.f_gw.values / 2 * u.s**(-1)
+    f_orb = data.f_gw.values / 2
     h_0 = data.h_0.values
     chirps = data.fdot.values
     
@@ -551,6 +548,17 @@ def LISA_analysis_df(data):
                              'inc', 'pol', 'phase'])
     return df
 
+def write_LISA_analysis(data, filename, chunk_rows=int(1e6), fast=True):
+    '''
+    Appends LISA_analysis_df(data) to the table key 'data' of filename
+    chunk_rows systems at a time, so the catalogue is never held in
+    memory whole.
+    '''
+    for start in range(0, len(data), chunk_rows):
+        df = LISA_analysis_df(data.iloc[start:start + chunk_rows], fast=fast)
+        df.to_hdf(filename, key='data', format='t', append=True)
+    return
+
 def LISA_FIRE_galaxy(filename, i, label, ratio, binfrac, ZTF, Tyson):
     rand_seed = np.random.randint(0, 100, 1)
     np.random.seed(rand_seed)
@@ -596,11 +604,7 @@ def LISA_FIRE_galaxy(filename, i, label, ratio, binfrac, ZTF, Tyson):
     N_astro = DWD_per_mass * M_astro  # num of binaries per star particle
     
     # Choose FIRE bin based on metallicity
-    FIRE['FIRE_index'] = FIRE.index
-    if met_end * Z_sun == met_arr[-1]:
-        FIRE_bin = FIRE.loc[FIRE.met >= met_start]
-    else:
-        FIRE_bin = FIRE.loc[(FIRE.met >= met_start)&(FIRE.met <= met_end)]
+    FIRE_bin = get_FIRE_store('./', './FIRE_cache/').get_bin(i, met_arr, Z_sun)
     
     # We sample by the integer number of systems per star particle,
     # as well as a probabilistic approach for the fractional component
@@ -704,11 +708,11 @@ def LISA_FIRE_galaxy(filename, i, label, ratio, binfrac, ZTF, Tyson):
     pop_init['X'] = X
     pop_init['Y'] = Y
     pop_init['Z'] = Z
-    pop_init['dist_sun'] = (X ** 2 + (Y - sun_yGx) ** 2 + (Z - sun_zGx) ** 2) ** (1/2)
+    pop_init['dist_sun'] = (X ** 2 + (Y - constants.sun_yGx) ** 2 + (Z - constants.sun_zGx) ** 2) ** (1/2)
     
     # Creating a magnitude column for desired magnitude cuts in post-processing
-    magnitude = mag_bol(pop_init, i)
-    pop_init['mag'] = magnitude
+    phot = photometry(pop_init, i)
+    pop_init['mag'] = phot.mag.values
     
     pop_init[['bin_num', 'FIRE_index', 'X', 'Y', 'Z']].to_hdf('final_galaxy_{}_{}_{}_inter.hdf'.format(label, 
                                                                                                        met_arr[i+1], 
@@ -721,10 +725,11 @@ def LISA_FIRE_galaxy(filename, i, label, ratio, binfrac, ZTF, Tyson):
         
     # Generating galaxy file for ZTF:
     if ZTF == True:
-        df1 = ZTF_df(pop_init, mag_lim, i)
+        df1 = ZTF_df(pop_init, mag_lim, i, phot=phot)
         df1.to_hdf('ZTF_{}_{}.h5'.format(label, binfrac_write), key='data', 
                    format='t', append=True)
         df1 = pd.DataFrame()
+    phot = pd.DataFrame()
     
     # Assigning weights to population to be used for histograms.
     # This creates an extra columns which states how many times
@@ -744,26 +749,35 @@ def LISA_FIRE_galaxy(filename, i, label, ratio, binfrac, ZTF, Tyson):
     ecc = np.zeros(len(LISA_band))
     m1 = LISA_band.mass_1.values * u.M_sun
     m2 = LISA_band.mass_2.values * u.M_sun
-    mc = utils.chirp_mass(m1, m2)
     t_obs = 4*u.yr
     dist = LISA_band.dist_sun.values * u.kpc   
-    sources = source.Source(m_1=m1, m_2=m2, ecc=ecc, dist=dist, f_orb=f_orb,
-                            gw_lum_tol=0.05, stat_tol=1e-2, interpolate_g=True)
-    h_0 = sources.get_h_0_n(harmonics=[2]).reshape(len(LISA_band))
-    h_0 = h_0.to('')
-    SNR = sources.get_snr(verbose=True) 
-    chirps = utils.fn_dot(mc, f_orb, ecc, 2)
-    
-    LISA_band['h_0'] = h_0.value
+    if np.all(ecc == 0):
+        # circular binaries in closed form (see gwcirc.py), against
+        # legwork's default LISA sensitivity curve
+        sc_params = psdcache.instrument_params(t_obs=t_obs, include_confusion_noise=True)
+        h_0 = gwcirc.h_2(m1.value, m2.value, LISA_band.f_gw.values, dist.value)
+        SNR = gwcirc.SNR_circ(m1.value, m2.value, LISA_band.f_gw.values, dist.value, 
+                              lambda f: psdcache.lisa_psd(f, params=sc_params), 
+                              t_obs=t_obs.to(u.s).value, stat_tol=1e-2)
+        chirps = gwcirc.chirp_circ(m1.value, m2.value, LISA_band.f_gw.values)
+    else:
+        import legwork.utils as utils
+        from legwork import source
+        mc = utils.chirp_mass(m1, m2)
+        sources = source.Source(m_1=m1, m_2=m2, ecc=ecc, dist=dist, f_orb=f_orb,
+                                gw_lum_tol=0.05, stat_tol=1e-2, interpolate_g=True)
+        h_0 = sources.get_h_0_n(harmonics=[2]).reshape(len(LISA_band))
+        h_0 = h_0.to('').value
+        SNR = sources.get_snr(verbose=True) 
+        chirps = utils.fn_dot(mc, f_orb, ecc, 2).value
+    
+    LISA_band['h_0'] = h_0
     LISA_band['snr'] = SNR
-    LISA_band['fdot'] = chirps.value
+    LISA_band['fdot'] = chirps
     
     # Generating galaxy file for Tyson:
     if Tyson == True:
-        df2 = LISA_analysis_df(LISA_band)
-        df2.to_hdf('Tyson_{}_{}.h5'.format(label, binfrac_write), key='data', 
-                   format='t', append=True)
-        df2 = pd.DataFrame()
+        write_LISA_analysis(LISA_band, 'Tyson_{}_{}.h5'.format(label, binfrac_write))
 
     # Output to hdf files
     mass_total.to_hdf('final_galaxy_{}_{}_{}_inter.hdf'.format(label, 
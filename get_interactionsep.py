@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 from funcs_v1 import getfiles
 import tqdm
+import events
+import lbandio
 
 met_arr = np.logspace(np.log10(1e-4), np.log10(0.03), 15)
 met_arr = np.round(met_arr, 8)
@@ -18,12 +20,8 @@ ratios = np.array([0.68, 0.71, 0.74, 0.78, 0.82,
 ratio_05 = 0.64
 
 
-def get_intersep(pathtodat, pathtoLband, verbose=True):
-    def intersep(pathtodat, datfile, pathtoLband, toname, i, label, binfrac, verbose=verbose):
-        data = pd.DataFrame() 
-        columns=['bin_num', 'FIRE_index', 'met', 'rad_1', 'rad_2', 'CEsep', 'CEtime', 'RLOFsep', 'RLOFtime'] 
-        data.to_hdf(toname, key='data', format='t', append=True) 
-
+def get_intersep(pathtodat, pathtoLband, pathtosave='intersepfiles/', verbose=True):
+    def intersep(table, pathtoLband, toname, i, label, binfrac, verbose=verbose):
         if verbose:
             print('\n{}'.format(i))
 
@@ -36,80 +34,41 @@ def get_intersep(pathtodat, pathtoLband, verbose=True):
         Lbandfile = pathtoLband + 'Lband_{}_{}_{}.hdf'.format(label, Z, binfrac)
         if verbose:
             print('Lbandfile: ' + Lbandfile)
-        Lband = pd.read_hdf(Lbandfile, key='Lband').sort_values('bin_num') 
-        data = Lband[['bin_num', 'FIRE_index', 'met', 'rad_1', 'rad_2']] 
-
-        if verbose:
-            print('dat file: ' + datfile)
-        dat = pd.read_hdf(pathtodat+datfile, key='bpp') 
-        dat = dat[['tphys', 'evol_type', 'sep', 'bin_num']]
+        # weight is the multiplicity of each row (1 if not compressed)
+        Lband = lbandio.Lband_weights(pd.read_hdf(Lbandfile, key='Lband')).sort_values('bin_num') 
+        data = Lband[['bin_num', 'FIRE_index', 'met', 'rad_1', 'rad_2', 'weight']] 
 
-        RLOFsep = dat.loc[dat.evol_type==3].groupby('bin_num', as_index=False).first()
-        RLOFsep = RLOFsep.loc[RLOFsep.bin_num.isin(data.bin_num)]
-        data_RLOF = data.loc[data.bin_num.isin(RLOFsep.bin_num)]
-        RLOFsep['weights'] = data_RLOF.bin_num.value_counts().sort_index().values
-        
-        CEsep = dat.loc[dat.evol_type==7].groupby('bin_num', as_index=False).first()
-        CEsep = CEsep.loc[CEsep.bin_num.isin(data.bin_num)]
-        data_CE = data.loc[data.bin_num.isin(CEsep.bin_num)]
-        CEsep['weights'] = data_CE.bin_num.value_counts().sort_index().values
-
-        dat = []
-        data_RLOF = []
-        data_CE = []
+        # first CE and RLOF of every system (see events.py)
+        inter = events.gather(table, data.bin_num.values)
+        for col in ['CEsep', 'CEtime', 'RLOFsep', 'RLOFtime']:
+            data[col] = inter[col]
 
-        data['CEsep'] = np.repeat(CEsep['sep'], CEsep['weights']).values
-        data['CEtime'] = np.repeat(CEsep['tphys'], CEsep['weights']).values
-        data['RLOFsep'] = np.repeat(RLOFsep['sep'], RLOFsep['weights']).values
-        data['RLOFtime'] = np.repeat(RLOFsep['tphys'], RLOFsep['weights']).values
-
-        Ntot = len(data) 
-        
         if verbose:
-            print('Ntot: ', Ntot) 
-        N = 0 
-        j = 0 
-        jlast = int(1e5) 
-        while j < Ntot: 
-            if verbose:
-                print('j: ', j) 
-                print('jlast: ', jlast) 
-            data[j:jlast].to_hdf(toname, key='data', format='t', append=True) 
-            N += len(data[j:jlast]) 
-            j += 1e5 
-            j = int(j) 
-            jlast += 1e5 
-            if jlast > Ntot: 
-                jlast = Ntot 
-            jlast = int(jlast) 
-        if verbose:
-            if N != Ntot: 
-                print('loop is wrong') 
-            else: 
-                print('wrote to hdf successfully') 
+            print('Ntot: ', len(data)) 
+        data.to_hdf(toname, key='data', format='t', append=True) 
 
         return
 
 
-    # FZ:
-
     kstar1_list = ['10', '11', '11', '12']
     kstar2_list = ['10', '10', '11', '10_12']
+    # the event tables are cached next to the output files
+    cache_dir = pathtosave + 'event_cache/'
     for kstar1, kstar2 in zip(kstar1_list, kstar2_list):
         files, label = getfiles(kstar1, kstar2)
         for f, i in tqdm.tqdm(zip(files, range(len(files))), total=len(files)):
             if verbose:
                 print('i = {}'.format(i))
-            binfrac = binfracs[i]
-            met = met_arr[i+1]
-            toname = 'intersepfiles/{}_intersep_FZ.hdf'.format(label)
-            intersep(pathtodat, f, pathtoLband, toname, i, label, binfrac, verbose)
+                print('dat file: ' + f)
+            # the bpp events are extracted once for both models
+            table = events.event_table(pathtodat + f, cache_dir=cache_dir)
             
-            if verbose:
-                print('i = {}'.format(i))
-            binfrac = 0.5
-            met = met_arr[i+1]
-            toname = 'intersepfiles/{}_intersep_F50.hdf'.format(label)
-            intersep(pathtodat, f, pathtoLband, toname, i, label, binfrac, verbose)
+            # FZ:
+            toname = pathtosave + '{}_intersep_FZ.hdf'.format(label)
+            intersep(table, pathtoLband, toname, i, label, binfracs[i], verbose)
+            
+            # F50:
+            toname = pathtosave + '{}_intersep_F50.hdf'.format(label)
+            intersep(table, pathtoLband, toname, i, label, 0.5, verbose)
         
     return
\ No newline at end of file
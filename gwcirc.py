@@ -0,0 +1,126 @@
+#===================================================================================
+# Closed-form GW quantities of circular binaries. Every DWD population here is
+# circular, so the strain, chirp and SNR that legwork computes through its
+# general (eccentric, Quantity-based) machinery reduce to a few power laws in
+# the chirp mass, frequency and distance. These functions evaluate them on
+# plain arrays: masses in Msun, f_gw in Hz, distances in kpc, times in s.
+#
+# They revive h_2, ASD_2, SNR_circ and chirp_circ of retired.py with the
+# normalisation of legwork (strain.h_0_n, strain.h_c_n, utils.fn_dot and
+# snr.snr_circ_stationary/evolving for n = 2, e = 0), so they give the same
+# numbers as a legwork Source; retired.py's h_2 used (128/5)^(1/2) instead of
+# (2^(28/3)/5)^(1/2) in the strain. A binary is evolving if its frequency
+# changes by more than a fraction stat_tol over t_obs, as in legwork; the SNR
+# of evolving binaries is integrated over n_step frequencies like legwork.
+# They agree with legwork to better than 1e-6 relative (round-off for
+# stationary binaries), which tests/test_gwcirc.py checks.
+#===================================================================================
+
+import numpy as np
+from astropy import units as u
+
+from constants import G, c, M_sol, m_kpc
+
+
+t_obs_LISA = (4 * u.yr).to(u.s).value
+
+
+def chirpmass(m_1, m_2):
+    '''
+    Chirp mass in kg of masses m_1, m_2 in Msun.
+    '''
+    return (m_1 * m_2) ** (3 / 5) / (m_1 + m_2) ** (1 / 5) * M_sol
+
+
+def h_2(m_1, m_2, f_gw, dist):
+    '''
+    Dimensionless strain amplitude of the n = 2 harmonic
+    (legwork's h_0_n).
+    '''
+    Mc = chirpmass(m_1, m_2)
+    f_orb = f_gw / 2
+    prefac = (2 ** (28 / 3) / 5) ** 0.5 * G ** (5 / 3) / c ** 4
+    return prefac * Mc ** (5 / 3) * (np.pi * f_orb) ** (2 / 3) / (dist * m_kpc) / 2
+
+
+def ASD_2(m_1, m_2, f_gw, dist, t_obs=t_obs_LISA):
+    '''
+    Amplitude spectral density in Hz^-1/2 of a stationary source
+    observed for t_obs.
+    '''
+    return h_2(m_1, m_2, f_gw, dist) * np.sqrt(t_obs)
+
+
+def chirp_circ(m_1, m_2, f_gw):
+    '''
+    Rate of change of f_gw in Hz/s (legwork's fn_dot for n = 2).
+    '''
+    Mc = chirpmass(m_1, m_2)
+    f_orb = f_gw / 2
+    return 96 / (5 * np.pi) * (G * Mc) ** (5 / 3) / c ** 5 * (2 * np.pi * f_orb) ** (11 / 3)
+
+
+def f_orb_evolved(Mc, f_orb, t):
+    '''
+    Orbital frequency after a time t of GW inspiral, NaN once merged.
+    '''
+    inner = f_orb ** (-8 / 3) - 2 ** (32 / 3) * np.pi ** (8 / 3) * t / (5 * c ** 5) * (G * Mc) ** (5 / 3)
+    return np.where(inner > 0, np.abs(inner) ** (-3 / 8), np.nan)
+
+
+def is_stationary(m_1, m_2, f_gw, t_obs=t_obs_LISA, stat_tol=1e-2):
+    '''
+    True for the binaries whose frequency changes by at most a
+    fraction stat_tol over t_obs.
+    '''
+    f_orb = f_gw / 2
+    f_orb_f = f_orb_evolved(chirpmass(m_1, m_2), f_orb, t_obs)
+    return np.nan_to_num((f_orb_f - f_orb) / f_orb, nan=np.inf) <= stat_tol
+
+
+def SNR_evolving(m_1, m_2, f_gw, dist, psd_func, t_obs=t_obs_LISA, n_step=100):
+    '''
+    SNR of evolving circular binaries: the integral of
+    h_c^2 / (f^2 S_n(f)) over the n_step frequencies swept during t_obs
+    (or until one second before merger).
+    '''
+    from scipy.integrate import trapezoid
+    Mc = chirpmass(m_1, m_2)
+    f_orb = f_gw / 2
+    K = 2 ** (32 / 3) * np.pi ** (8 / 3) / (5 * c ** 5) * (G * Mc) ** (5 / 3)
+    t_merge = f_orb ** (-8 / 3) / K
+    t_evol = np.minimum(t_merge - 1, t_obs)
+    t = np.linspace(0, 1, n_step)[np.newaxis, :] * t_evol[:, np.newaxis]
+    f_orb_t = f_orb_evolved(Mc[:, np.newaxis], f_orb[:, np.newaxis], t)
+    prefac = (2 ** (5 / 3) / (3 * np.pi ** (4 / 3))) ** 0.5 * G ** (5 / 6) / c ** (3 / 2)
+    h_c_2 = (prefac * Mc[:, np.newaxis] ** (5 / 6) / (dist[:, np.newaxis] * m_kpc)
+             * f_orb_t ** (-1 / 6)) ** 2 / 2
+    f = 2 * f_orb_t
+    h_c_lisa_2 = f ** 2 * psd_func(f.flatten()).reshape(f.shape)
+    return trapezoid(y=h_c_2 / h_c_lisa_2, x=f, axis=1) ** 0.5
+
+
+def SNR_circ(m_1, m_2, f_gw, dist, psd_func, t_obs=t_obs_LISA, stat_tol=1e-2, n_step=100, block=100000):
+    '''
+    SNR of circular binaries.
+
+    Inputs: masses [Msun], f_gw [Hz], distances [kpc], psd_func giving
+    the noise PSD [Hz^-1] at an array of frequencies [Hz] (e.g. from
+    psdcache.lisa_psd), observation time [s], stationarity tolerance,
+    number of frequencies of the evolving SNR integral, number of
+    evolving binaries integrated at a time
+
+    Outputs: SNR array
+    '''
+    m_1, m_2, f_gw, dist = [np.asarray(x, dtype=float) for x in (m_1, m_2, f_gw, dist)]
+    snr = np.zeros(len(f_gw))
+    stat = is_stationary(m_1, m_2, f_gw, t_obs, stat_tol)
+
+    # stationary: SNR^2 = h_0^2 t_obs / S_n(f_gw)
+    snr[stat] = ASD_2(m_1[stat], m_2[stat], f_gw[stat], dist[stat], t_obs) / np.sqrt(psd_func(f_gw[stat]))
+
+    evol = np.flatnonzero(~stat)
+    for start in range(0, len(evol), block):
+        rows = evol[start:start + block]
+        snr[rows] = SNR_evolving(m_1[rows], m_2[rows], f_gw[rows], dist[rows], psd_func, t_obs, n_step)
+    return snr
@@ -0,0 +1,92 @@
+#===================================================================================
+# Position jitter for systems drawn from FIRE star particles. Every system
+# sampled from a star particle is displaced from the particle centre by a
+# random offset whose scale is the particle's kern_len, so systems sharing a
+# particle get unique positions. Offsets are drawn for a whole chunk at once
+# from one of several radial profiles:
+#
+#   uniform       : uniform density inside a sphere of radius kern_len
+#                   (the original random_sphere behaviour)
+#   gaussian      : isotropic Gaussian with per-axis sigma = kern_len / 2,
+#                   so about 74% of the offsets fall within kern_len
+#   cubic_spline  : the M4 cubic-spline SPH kernel with compact support
+#                   kern_len, as used for FIRE/GIZMO smoothing lengths
+#===================================================================================
+
+import numpy as np
+
+
+profiles = ('uniform', 'gaussian', 'cubic_spline')
+
+# Inverse CDF table of the cubic-spline radial profile, built on first use
+_spline_table = None
+
+
+def _directions(num, rng):
+    '''
+    Isotropic unit vectors, from uniform cos(theta) and phi.
+
+    Inputs: num is an integer, rng the random generator
+
+    Outputs: x, y, z arrays of length num
+    '''
+    cos_t = rng.uniform(-1, 1, num)
+    phi = rng.uniform(0, 2 * np.pi, num)
+    sin_t = np.sqrt(1 - cos_t ** 2)
+    return sin_t * np.cos(phi), sin_t * np.sin(phi), cos_t
+
+
+def _spline_cdf(q):
+    '''
+    Unnormalised cumulative radial distribution, int_0^q 4 pi q'^2 w(q') dq',
+    of the cubic-spline kernel w(q) = 1 - 6q^2 + 6q^3 for q <= 1/2 and
+    2(1 - q)^3 for 1/2 < q <= 1, in units of the support radius.
+    '''
+    q = np.asarray(q, dtype=float)
+    inner = q ** 3 / 3 - 6 * q ** 5 / 5 + q ** 6
+    h = 0.5
+    outer_h = 2 * (h ** 3 / 3 - 3 * h ** 4 / 4 + 3 * h ** 5 / 5 - h ** 6 / 6)
+    inner_h = h ** 3 / 3 - 6 * h ** 5 / 5 + h ** 6
+    outer = inner_h - outer_h + 2 * (q ** 3 / 3 - 3 * q ** 4 / 4 + 3 * q ** 5 / 5 - q ** 6 / 6)
+    return 4 * np.pi * np.where(q <= h, inner, outer)
+
+
+def _spline_radii(num, rng, n_grid=4097):
+    '''
+    Radii in units of the support radius drawn from the cubic-spline
+    profile by inverting its (analytic) CDF on a grid.
+    '''
+    global _spline_table
+    if _spline_table is None:
+        q = np.linspace(0, 1, n_grid)
+        F = _spline_cdf(q)
+        _spline_table = (F / F[-1], q)
+    F, q = _spline_table
+    return np.interp(rng.random(num), F, q)
+
+
+def sample_offsets(R, num, profile='uniform', rng=None):
+    '''
+    Draws num random position offsets in a few array operations.
+
+    Inputs: R is the kernel scale in kpc, either a float or an array of
+    length num (e.g. kern_len of every system), num is an integer,
+    profile is one of jitter.profiles, rng a numpy Generator (the
+    global numpy random state if None)
+
+    Outputs: X, Y, Z arrays of length num
+    '''
+    if rng is None:
+        rng = np.random
+    if profile == 'uniform':
+        r = rng.random(num) ** (1/3)
+    elif profile == 'cubic_spline':
+        r = _spline_radii(num, rng)
+    elif profile == 'gaussian':
+        xyz = rng.normal(0, 0.5, (3, num)) * R
+        return xyz[0], xyz[1], xyz[2]
+    else:
+        raise ValueError('unknown kernel profile {}, choose from {}'.format(profile, profiles))
+    x, y, z = _directions(num, rng)
+    r = r * R
+    return x * r, y * r, z * r
@@ -0,0 +1,416 @@
+#===================================================================================
+# Reading and writing of Lband tables. Lband rows are written by
+# postproc.save_Lband with every column as float64/int64. With the opt-in
+# compact schema the columns that do not need full precision are downcast
+# when written and cast back to float64/int64 when read, which roughly halves
+# the size of the files:
+#
+#   kstar_1, kstar_2                        int8     (exact)
+#   bin_num, FIRE_index, weight,
+#   bin_num_pw, bin_num_Lw                  int32    (exact, range checked)
+#   met, age, kern_len, rad_1, rad_2,
+#   xGx, yGx, zGx, X, Y, Z, dist_sun,
+#   porb, sep, tphys, t_delay, t_RLOF,
+#   t_evol                                  float32
+#
+# float32 keeps 24 significant bits, so each of these values is stored with a
+# relative error of at most 2**-24 ~ 6e-8. For positions and distances within
+# 50 kpc of the Galactic centre that is below 3e-6 kpc (0.6 AU), and for times
+# within 14 Gyr below 1e-3 Myr. The masses and the present-day sep_f, porb_f
+# and f_gw that enter the GW calculations stay in float64.
+#===================================================================================
+
+import os
+import glob
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+
+compact_dtypes = {'kstar_1': 'int8', 'kstar_2': 'int8',
+                  'bin_num': 'int32', 'FIRE_index': 'int32', 'weight': 'int32',
+                  'bin_num_pw': 'int32', 'bin_num_Lw': 'int32',
+                  'met': 'float32', 'age': 'float32', 'kern_len': 'float32',
+                  'rad_1': 'float32', 'rad_2': 'float32',
+                  'xGx': 'float32', 'yGx': 'float32', 'zGx': 'float32',
+                  'X': 'float32', 'Y': 'float32', 'Z': 'float32', 'dist_sun': 'float32',
+                  'porb': 'float32', 'sep': 'float32', 'tphys': 'float32',
+                  't_delay': 'float32', 't_RLOF': 'float32', 't_evol': 'float32'}
+
+# dtypes the compact columns are restored to when read
+full_dtypes = {'kstar_1': 'float64', 'kstar_2': 'float64',
+               'bin_num': 'int64', 'FIRE_index': 'int64', 'weight': 'int64',
+               'bin_num_pw': 'int64', 'bin_num_Lw': 'int64'}
+
+
+def compact(Lband):
+    '''
+    Downcasts the columns of an Lband dataframe listed in
+    compact_dtypes. Raises a ValueError if an integer column
+    does not fit in its compact dtype.
+    '''
+    Lband = Lband.copy()
+    for col, dtype in compact_dtypes.items():
+        if col not in Lband.columns:
+            continue
+        values = Lband[col].values
+        if np.issubdtype(np.dtype(dtype), np.integer) and len(values) > 0:
+            info = np.iinfo(dtype)
+            if values.min() < info.min or values.max() > info.max:
+                raise ValueError('{} does not fit in {}'.format(col, dtype))
+        Lband[col] = values.astype(dtype)
+    return Lband
+
+
+def expand(Lband):
+    '''
+    Casts the columns of an Lband dataframe written with the
+    compact schema back to float64/int64. Full-precision
+    dataframes are returned unchanged.
+    '''
+    for col in Lband.columns:
+        if col not in compact_dtypes or Lband[col].dtype != np.dtype(compact_dtypes[col]):
+            continue
+        Lband[col] = Lband[col].values.astype(full_dtypes.get(col, 'float64'))
+    return Lband
+
+
+def write_Lband(Lband, filename, key='Lband', compact_schema=False):
+    '''
+    Appends Lband rows to the table key of filename, with the
+    compact schema if compact_schema is True. All rows of one
+    table must be written with the same schema.
+    '''
+    if compact_schema:
+        Lband = compact(Lband)
+    Lband.to_hdf(filename, key=key, format='t', append=True)
+
+
+def read_Lband(filename, key='Lband', columns=None):
+    '''
+    Reads an Lband table written with either schema and
+    returns it with float64/int64 columns.
+    '''
+    return expand(pd.read_hdf(filename, key=key, columns=columns))
+
+
+#===================================================================================
+# Parquet dataset backend. Instead of appending to one HDF table per task,
+# every chunk is written as its own Parquet file in a dataset partitioned
+# by DWD label, binary fraction model and metallicity bin:
+#
+#   root/label=10_10/model=FZ/met_bin=0.0001/part-00000.parquet
+#
+# Files are written once and never appended to, so several processes can
+# read the dataset while it grows, and readers can load only the columns
+# and partitions they need. pyarrow is only needed for this backend.
+#===================================================================================
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+codecs = ['none', 'snappy', 'gzip', 'brotli', 'lz4', 'zstd']
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('the parquet backend needs pyarrow')
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([('label', pa.string()), ('model', pa.string()), 
+                                      ('met_bin', pa.string())]), flavor='hive')
+
+
+def model_of(binfrac):
+    '''
+    Binary fraction model of a task: F50 for a constant binary
+    fraction of 0.5, FZ for the metallicity-dependent one.
+    '''
+    return 'F50' if binfrac == 0.5 else 'FZ'
+
+
+def partition_dir(root, label, binfrac, met):
+    return os.path.join(root, 'label={}'.format(label), 'model={}'.format(model_of(binfrac)), 
+                        'met_bin={}'.format(met))
+
+
+def part_file(root, label, binfrac, met, chunk_id):
+    return os.path.join(partition_dir(root, label, binfrac, met), 'part-{:05d}.parquet'.format(chunk_id))
+
+
+def write_Lband_parquet(Lband, root, label, binfrac, met, chunk_id, codec='zstd', compact_schema=False):
+    '''
+    Writes the Lband rows of one chunk to its own file in the
+    partitioned dataset under root, compressed with codec (one of
+    lbandio.codecs). The file is written under a temporary name and
+    renamed, so readers never see a partial chunk and a chunk that
+    is recomputed simply replaces its file.
+    '''
+    _require_pyarrow()
+    if compact_schema:
+        Lband = compact(Lband)
+    fname = part_file(root, label, binfrac, met, chunk_id)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    tmp = fname + '.{}.tmp'.format(os.getpid())
+    pq.write_table(pa.Table.from_pandas(Lband, preserve_index=False), tmp, compression=codec)
+    os.replace(tmp, fname)
+
+
+def parquet_files(root, label, binfrac, met):
+    '''
+    Chunk files of one task in the dataset under root, in chunk order.
+    '''
+    return sorted(glob.glob(os.path.join(partition_dir(root, label, binfrac, met), 'part-*.parquet')))
+
+
+def remove_parquet_chunks(root, label, binfrac, met, keep):
+    '''
+    Deletes the chunk files of one task whose chunk id is not in
+    keep, e.g. chunks written after the last one recorded in the
+    manifest of a killed run.
+    '''
+    path = partition_dir(root, label, binfrac, met)
+    if not os.path.isdir(path):
+        return
+    for fname in os.listdir(path):
+        if fname.endswith('.tmp') or int(fname[5:10]) not in keep:
+            os.remove(os.path.join(path, fname))
+
+
+def read_Lband_dataset(root, columns=None, label=None, model=None, met=None, memory_map=True, 
+                       as_table=False):
+    '''
+    Reads (part of) a partitioned Lband dataset.
+
+    Parameters
+    ----------
+    root : `str`
+        directory of the dataset
+    columns : `list`
+        columns to read; columns missing from the dataset (e.g. weight
+        for uncompressed runs) are skipped. If None, all Lband columns
+        are read; the partition keys label, model and met_bin are only
+        returned when listed explicitly
+    label, model, met : `str`, `str`, `float`
+        only read these partitions (or lists of them); all if None
+    memory_map : `bool`
+        memory-map the Parquet files instead of reading them into
+        buffers
+    as_table : `bool`
+        return the pyarrow Table instead of a dataframe
+
+    Returns
+    -------
+    Lband : `pandas dataframe` or `pyarrow Table`
+        with float64/int64 columns (see expand)
+    '''
+    _require_pyarrow()
+    dataset = ds.dataset(root, format='parquet', partitioning=_partitioning())
+    if columns is None:
+        columns = [col for col in dataset.schema.names if col not in ['label', 'model', 'met_bin']]
+    else:
+        columns = [col for col in columns if col in dataset.schema.names]
+    filters = None
+    for name, value in [('label', label), ('model', model), ('met_bin', met)]:
+        if value is None:
+            continue
+        values = [str(v) for v in np.atleast_1d(value)]
+        expr = ds.field(name).isin(values)
+        filters = expr if filters is None else filters & expr
+    table = pq.read_table(root, columns=columns, filters=filters, partitioning=_partitioning(), 
+                          memory_map=memory_map)
+    if as_table:
+        return table
+    return expand(table.to_pandas())
+
+
+#===================================================================================
+# Multi-file reads. iter_Lband_files streams the Lband rows of a list of HDF
+# and/or Parquet files one file at a time, reading up to nthreads files ahead
+# on a thread pool, with column projection and an optional row predicate
+# applied before the next file is read. read_Lband_files collects them into
+# one dataframe whose columns are allocated once at their final size, in
+# place of growing a dataframe with DataFrame.append.
+#
+# Parquet files are memory-mapped, as in read_Lband_dataset, so only the
+# column chunks that are read are paged in. HDF5 (through PyTables) is not
+# thread-safe, so HDF files are read one at a time under _hdf_lock; the
+# threads then only overlap the Parquet reads, the dtype expansion and the
+# predicates.
+#
+# Lband_pieces splits files into row ranges of bounded size that separate
+# processes can read with read_Lband_piece, e.g. to stream a whole galaxy
+# through a process pool.
+#===================================================================================
+
+_hdf_lock = threading.Lock()
+
+
+def _read_file(filename, key, columns, start=None, stop=None):
+    if filename.endswith('.parquet'):
+        _require_pyarrow()
+        names = pq.read_schema(filename).names
+        table = pq.read_table(filename, columns=None if columns is None else [c for c in columns if c in names], 
+                              memory_map=True)
+        if start is not None:
+            table = table.slice(start, stop - start)
+        return table.to_pandas()
+    with _hdf_lock:
+        with pd.HDFStore(filename, mode='r') as store:
+            if '/' + key not in store.keys():
+                return None
+            storer = store.get_storer(key)
+            if storer.is_table:
+                names = storer.non_index_axes[0][1]
+                return store.select(key, columns=None if columns is None else [c for c in columns if c in names], 
+                                    start=start, stop=stop)
+            Lband = store[key]
+    if start is not None:
+        Lband = Lband.iloc[start:stop]
+    return Lband if columns is None else Lband[[c for c in columns if c in Lband.columns]]
+
+
+def Lband_pieces(filenames, chunk_rows, key='Lband'):
+    '''
+    Splits the Lband rows of filenames into pieces of at most
+    chunk_rows rows. Files that do not exist or have no Lband rows
+    are skipped.
+
+    Outputs: list of (filename, start, stop)
+    '''
+    pieces = []
+    for filename in filenames:
+        if not os.path.exists(filename):
+            continue
+        if filename.endswith('.parquet'):
+            _require_pyarrow()
+            n_rows = pq.read_metadata(filename).num_rows
+        else:
+            with pd.HDFStore(filename, mode='r') as store:
+                if '/' + key not in store.keys():
+                    continue
+                storer = store.get_storer(key)
+                n_rows = storer.nrows if storer.is_table else storer.shape[0]
+        for start in range(0, n_rows, chunk_rows):
+            pieces.append((filename, start, min(start + chunk_rows, n_rows)))
+    return pieces
+
+
+def read_Lband_piece(piece, columns=None, key='Lband'):
+    '''
+    Reads one piece (filename, start, stop) of Lband_pieces, with
+    float64/int64 columns (see expand).
+    '''
+    filename, start, stop = piece
+    return expand(_read_file(filename, key, columns, start=start, stop=stop).reset_index(drop=True))
+
+
+def _load(filename, key, columns, predicate):
+    if not os.path.exists(filename):
+        return filename, None
+    Lband = _read_file(filename, key, columns)
+    if Lband is None:
+        return filename, None
+    Lband = expand(Lband.reset_index(drop=True))
+    if predicate is not None:
+        Lband = Lband.loc[np.asarray(predicate(Lband), dtype=bool)].reset_index(drop=True)
+    return filename, Lband
+
+
+def iter_Lband_files(filenames, columns=None, predicate=None, key='Lband', nthreads=4):
+    '''
+    Yields (filename, Lband) for every file in filenames, in order.
+
+    Parameters
+    ----------
+    filenames : `list`
+        HDF files (rows in table key) and/or Parquet chunk files;
+        files that do not exist or have no Lband rows are skipped
+    columns : `list`
+        columns to read; columns missing from a file are skipped
+    predicate : `callable`
+        function of an Lband dataframe returning a boolean mask of
+        the rows to keep
+    nthreads : `int`
+        number of files read ahead on a thread pool
+
+    Returns
+    -------
+    generator of (filename, Lband) with float64/int64 columns (see expand)
+    '''
+    filenames = iter(filenames)
+    nthreads = max(1, nthreads)
+    with ThreadPoolExecutor(nthreads) as pool:
+        pending = collections.deque()
+        while True:
+            # keep nthreads files in flight
+            while len(pending) < nthreads:
+                filename = next(filenames, None)
+                if filename is None:
+                    break
+                pending.append(pool.submit(_load, filename, key, columns, predicate))
+            if not pending:
+                return
+            filename, Lband = pending.popleft().result()
+            if Lband is not None:
+                yield filename, Lband
+
+
+def concat_Lband(frames, columns=None):
+    '''
+    Concatenates Lband dataframes into one, allocating each column
+    once. All frames must have the columns of the first one; the
+    result has a fresh RangeIndex.
+    '''
+    frames = [Lband for Lband in frames if len(Lband) > 0]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=columns)
+    total = sum(len(Lband) for Lband in frames)
+    data = {}
+    for col in frames[0].columns:
+        values = np.empty(total, dtype=np.result_type(*[Lband[col].dtype for Lband in frames]))
+        start = 0
+        for Lband in frames:
+            values[start:start + len(Lband)] = Lband[col].values
+            start += len(Lband)
+        data[col] = values
+    return pd.DataFrame(data)
+
+
+def Lband_weights(Lband):
+    '''
+    Adds a unit 'weight' column to Lband data written without
+    compression so that compressed and uncompressed files can be
+    combined and histogrammed the same way.
+    '''
+    if 'weight' not in Lband.columns:
+        Lband['weight'] = np.ones(len(Lband), dtype='int64')
+    return Lband
+
+
+def read_Lband_files(filenames, columns=None, predicate=None, key='Lband', nthreads=4):
+    '''
+    Reads the Lband rows of several files into one dataframe; see
+    iter_Lband_files for the arguments.
+    '''
+    return concat_Lband([Lband for _, Lband in iter_Lband_files(filenames, columns=columns, predicate=predicate, 
+                                                                  key=key, nthreads=nthreads)], columns=columns)
+
+
+def read_Lband_weighted(filenames, columns=None, predicate=None, key='Lband', nthreads=4):
+    '''
+    read_Lband_files with a weight column in every file (see
+    Lband_weights), so compressed and uncompressed files can be
+    read together and their rows counted with weights=.
+    '''
+    if columns is not None and 'weight' not in columns:
+        columns = list(columns) + ['weight']
+    frames = iter_Lband_files(filenames, columns=columns, predicate=predicate, key=key, nthreads=nthreads)
+    return Lband_weights(concat_Lband([Lband_weights(Lband) for _, Lband in frames], columns=columns))
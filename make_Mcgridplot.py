@@ -1,75 +1,22 @@
 from funcs_v1 import *
+import lbandio
 obs_sec = 4 * u.yr.to('s')
 obs_hz = 1 / obs_sec
 
 def make_Mc_fgw_plot(pathtoLband, model):
     if model == 'FZold':
-        He = pd.DataFrame()
-        for f in galaxy_files_10_10_var():
-            He = He.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        CO = pd.DataFrame()
-        for f in galaxy_files_11_11_var():
-            CO = CO.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        COHe = pd.DataFrame()
-        for f in galaxy_files_11_10_var():
-            COHe = COHe.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        ONe = pd.DataFrame()
-        for f in galaxy_files_12_var():
-            ONe = ONe.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-            
+        files = [galaxy_files_10_10_var(), galaxy_files_11_11_var(), galaxy_files_11_10_var(), galaxy_files_12_var()]
     elif model == 'FZnew':
-        He = pd.DataFrame()
-        for f in Lband_files_10_10_var():
-            He = He.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        CO = pd.DataFrame()
-        for f in Lband_files_11_11_var():
-            CO = CO.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        COHe = pd.DataFrame()
-        for f in Lband_files_11_10_var():
-            COHe = COHe.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        ONe = pd.DataFrame()
-        for f in Lband_files_12_var():
-            ONe = ONe.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-            
+        files = [Lband_files_10_10_var(), Lband_files_11_11_var(), Lband_files_11_10_var(), Lband_files_12_var()]
     if model == 'F50old':
-        He = pd.DataFrame()
-        for f in galaxy_files_10_10_05():
-            He = He.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        CO = pd.DataFrame()
-        for f in galaxy_files_11_11_05():
-            CO = CO.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        COHe = pd.DataFrame()
-        for f in galaxy_files_11_10_05():
-            COHe = COHe.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        ONe = pd.DataFrame()
-        for f in galaxy_files_12_05():
-            ONe = ONe.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-            
+        files = [galaxy_files_10_10_05(), galaxy_files_11_11_05(), galaxy_files_11_10_05(), galaxy_files_12_05()]
     elif model == 'F50new':
-        He = pd.DataFrame()
-        for f in Lband_files_10_10_05():
-            He = He.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        CO = pd.DataFrame()
-        for f in Lband_files_11_11_05():
-            CO = CO.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        COHe = pd.DataFrame()
-        for f in Lband_files_11_10_05():
-            COHe = COHe.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-
-        ONe = pd.DataFrame()
-        for f in Lband_files_12_05():
-            ONe = ONe.append(pd.read_hdf(pathtoLband + f, key='Lband'))
+        files = [Lband_files_10_10_05(), Lband_files_11_11_05(), Lband_files_11_10_05(), Lband_files_12_05()]
+    
+    # only the columns used by the plots are read
+    # (and weight, the multiplicity of the rows of compressed files)
+    columns = ['mass_1', 'mass_2', 'met', 'f_gw', 'fdot', 'snr']
+    He, CO, COHe, ONe = [lbandio.read_Lband_weighted([pathtoLband + f for f in fs], columns=columns) for fs in files]
 
     Heplot = He.loc[(He.fdot>=obs_hz)&(He.snr>7)] #[::100]
     COHeplot = COHe.loc[(COHe.fdot>=obs_hz)&(COHe.snr>7)] #[::1000]
@@ -86,7 +33,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(He.loc[He.met*Z_sun<=met_arr[1]].mass_1.values*u.M_sun, 
                                   He.loc[He.met*Z_sun<=met_arr[1]].mass_2.values*u.M_sun)[::10],
-               x=np.log10(He.loc[He.met*Z_sun<=met_arr[1]].f_gw.values)[::10], levels=levels,fill=False, 
+               x=np.log10(He.loc[He.met*Z_sun<=met_arr[1]].f_gw.values)[::10], 
+               weights=He.loc[He.met*Z_sun<=met_arr[1]].weight.values[::10], levels=levels,fill=False, 
                ax=ax[0,0], color=colors[0], zorder=3, linewidths=2.5)
 
     ax[0,1].scatter(y=utils.chirp_mass(Heplot.mass_1.values*u.M_sun, 
@@ -95,7 +43,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(He.loc[(He.met*Z_sun>=met_arr[7])&(He.met*Z_sun<=met_arr[8])].mass_1.values*u.M_sun, 
                                   He.loc[(He.met*Z_sun>=met_arr[7])&(He.met*Z_sun<=met_arr[8])].mass_2.values*u.M_sun)[::10],
-               x=np.log10(He.loc[(He.met*Z_sun>=met_arr[7])&(He.met*Z_sun<=met_arr[8])].f_gw.values)[::10], levels=levels,fill=False, 
+               x=np.log10(He.loc[(He.met*Z_sun>=met_arr[7])&(He.met*Z_sun<=met_arr[8])].f_gw.values)[::10], 
+               weights=He.loc[(He.met*Z_sun>=met_arr[7])&(He.met*Z_sun<=met_arr[8])].weight.values[::10], levels=levels,fill=False, 
                ax=ax[0,1], color=colors[1], zorder=3, linewidths=2.5)
 
     ax[0,2].scatter(y=utils.chirp_mass(Heplot.mass_1.values*u.M_sun, 
@@ -104,7 +53,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(He.loc[(He.met*Z_sun>=met_arr[-2])].mass_1.values*u.M_sun, 
                                   He.loc[(He.met*Z_sun>=met_arr[-2])].mass_2.values*u.M_sun)[::100],
-               x=np.log10(He.loc[(He.met*Z_sun>=met_arr[-2])].f_gw.values)[::100], levels=levels,fill=False, 
+               x=np.log10(He.loc[(He.met*Z_sun>=met_arr[-2])].f_gw.values)[::100], 
+               weights=He.loc[(He.met*Z_sun>=met_arr[-2])].weight.values[::100], levels=levels,fill=False, 
                ax=ax[0,2], color=colors[3], zorder=3, linewidths=2.5)
 
     ax[1,0].scatter(y=utils.chirp_mass(COHeplot.mass_1.values*u.M_sun, 
@@ -113,7 +63,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(COHe.loc[COHe.met*Z_sun<=met_arr[1]].mass_1.values*u.M_sun, 
                                   COHe.loc[COHe.met*Z_sun<=met_arr[1]].mass_2.values*u.M_sun)[::10],
-               x=np.log10(COHe.loc[COHe.met*Z_sun<=met_arr[1]].f_gw.values)[::10], levels=levels,fill=False, 
+               x=np.log10(COHe.loc[COHe.met*Z_sun<=met_arr[1]].f_gw.values)[::10], 
+               weights=COHe.loc[COHe.met*Z_sun<=met_arr[1]].weight.values[::10], levels=levels,fill=False, 
                ax=ax[1,0], color=colors[0], zorder=3, linewidths=2.5)
 
     ax[1,1].scatter(y=utils.chirp_mass(COHeplot.mass_1.values*u.M_sun, 
@@ -122,7 +73,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(COHe.loc[(COHe.met*Z_sun>=met_arr[7])&(COHe.met*Z_sun<=met_arr[8])].mass_1.values*u.M_sun, 
                                   COHe.loc[(COHe.met*Z_sun>=met_arr[7])&(COHe.met*Z_sun<=met_arr[8])].mass_2.values*u.M_sun)[::100],
-               x=np.log10(COHe.loc[(COHe.met*Z_sun>=met_arr[7])&(COHe.met*Z_sun<=met_arr[8])].f_gw.values)[::100], levels=levels,fill=False, 
+               x=np.log10(COHe.loc[(COHe.met*Z_sun>=met_arr[7])&(COHe.met*Z_sun<=met_arr[8])].f_gw.values)[::100], 
+               weights=COHe.loc[(COHe.met*Z_sun>=met_arr[7])&(COHe.met*Z_sun<=met_arr[8])].weight.values[::100], levels=levels,fill=False, 
                ax=ax[1,1], color=colors[1], zorder=3, linewidths=2.5)
 
     ax[1,2].scatter(y=utils.chirp_mass(COHeplot.mass_1.values*u.M_sun, 
@@ -131,7 +83,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(COHe.loc[(COHe.met*Z_sun>=met_arr[-2])].mass_1.values*u.M_sun, 
                                   COHe.loc[(COHe.met*Z_sun>=met_arr[-2])].mass_2.values*u.M_sun)[::1000],
-               x=np.log10(COHe.loc[(COHe.met*Z_sun>=met_arr[-2])].f_gw.values)[::1000], levels=levels,fill=False, 
+               x=np.log10(COHe.loc[(COHe.met*Z_sun>=met_arr[-2])].f_gw.values)[::1000], 
+               weights=COHe.loc[(COHe.met*Z_sun>=met_arr[-2])].weight.values[::1000], levels=levels,fill=False, 
                ax=ax[1,2], color=colors[3], zorder=3, linewidths=2.5)
 
     ax[2,0].scatter(y=utils.chirp_mass(COplot.mass_1.values*u.M_sun, 
@@ -140,7 +93,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(CO.loc[CO.met*Z_sun<=met_arr[1]].mass_1.values*u.M_sun, 
                                   CO.loc[CO.met*Z_sun<=met_arr[1]].mass_2.values*u.M_sun)[::1],
-               x=np.log10(CO.loc[CO.met*Z_sun<=met_arr[1]].f_gw.values)[::1], levels=levels,fill=False, 
+               x=np.log10(CO.loc[CO.met*Z_sun<=met_arr[1]].f_gw.values)[::1], 
+               weights=CO.loc[CO.met*Z_sun<=met_arr[1]].weight.values[::1], levels=levels,fill=False, 
                ax=ax[2,0], color=colors[0], zorder=3, linewidths=2.5)
 
     ax[2,1].scatter(y=utils.chirp_mass(COplot.mass_1.values*u.M_sun, 
@@ -149,7 +103,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(CO.loc[(CO.met*Z_sun>=met_arr[7])&(CO.met*Z_sun<=met_arr[8])].mass_1.values*u.M_sun, 
                                   CO.loc[(CO.met*Z_sun>=met_arr[7])&(CO.met*Z_sun<=met_arr[8])].mass_2.values*u.M_sun)[::1],
-               x=np.log10(CO.loc[(CO.met*Z_sun>=met_arr[7])&(CO.met*Z_sun<=met_arr[8])].f_gw.values)[::1], levels=levels,fill=False, 
+               x=np.log10(CO.loc[(CO.met*Z_sun>=met_arr[7])&(CO.met*Z_sun<=met_arr[8])].f_gw.values)[::1], 
+               weights=CO.loc[(CO.met*Z_sun>=met_arr[7])&(CO.met*Z_sun<=met_arr[8])].weight.values[::1], levels=levels,fill=False, 
                ax=ax[2,1], color=colors[1], zorder=3, linewidths=2.5)
 
     ax[2,2].scatter(y=utils.chirp_mass(COplot.mass_1.values*u.M_sun, 
@@ -158,7 +113,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(CO.loc[(CO.met*Z_sun>=met_arr[-2])].mass_1.values*u.M_sun, 
                                   CO.loc[(CO.met*Z_sun>=met_arr[-2])].mass_2.values*u.M_sun)[::100],
-               x=np.log10(CO.loc[(CO.met*Z_sun>=met_arr[-2])].f_gw.values)[::100], levels=levels,fill=False, 
+               x=np.log10(CO.loc[(CO.met*Z_sun>=met_arr[-2])].f_gw.values)[::100], 
+               weights=CO.loc[(CO.met*Z_sun>=met_arr[-2])].weight.values[::100], levels=levels,fill=False, 
                ax=ax[2,2], color=colors[3], zorder=3, linewidths=2.5)
 
 
@@ -168,7 +124,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(ONe.loc[ONe.met*Z_sun<=met_arr[1]].mass_1.values*u.M_sun, 
                                   ONe.loc[ONe.met*Z_sun<=met_arr[1]].mass_2.values*u.M_sun)[::1],
-               x=np.log10(ONe.loc[ONe.met*Z_sun<=met_arr[1]].f_gw.values)[::1], levels=levels,fill=False, 
+               x=np.log10(ONe.loc[ONe.met*Z_sun<=met_arr[1]].f_gw.values)[::1], 
+               weights=ONe.loc[ONe.met*Z_sun<=met_arr[1]].weight.values[::1], levels=levels,fill=False, 
                ax=ax[3,0], color=colors[0], zorder=3, linewidths=2.5)
 
 
@@ -178,7 +135,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(ONe.loc[(ONe.met*Z_sun>=met_arr[7])&(ONe.met*Z_sun<=met_arr[8])].mass_1.values*u.M_sun, 
                                   ONe.loc[(ONe.met*Z_sun>=met_arr[7])&(ONe.met*Z_sun<=met_arr[8])].mass_2.values*u.M_sun)[::1],
-               x=np.log10(ONe.loc[(ONe.met*Z_sun>=met_arr[7])&(ONe.met*Z_sun<=met_arr[8])].f_gw.values)[::1], levels=levels,fill=False, 
+               x=np.log10(ONe.loc[(ONe.met*Z_sun>=met_arr[7])&(ONe.met*Z_sun<=met_arr[8])].f_gw.values)[::1], 
+               weights=ONe.loc[(ONe.met*Z_sun>=met_arr[7])&(ONe.met*Z_sun<=met_arr[8])].weight.values[::1], levels=levels,fill=False, 
                ax=ax[3,1], color=colors[1], zorder=3, linewidths=2.5)
 
     ax[3,2].scatter(y=utils.chirp_mass(ONeplot.mass_1.values*u.M_sun, 
@@ -187,7 +145,8 @@ def make_Mc_fgw_plot(pathtoLband, model):
 
     sb.kdeplot(y=utils.chirp_mass(ONe.loc[(ONe.met*Z_sun>=met_arr[-2])].mass_1.values*u.M_sun, 
                                   ONe.loc[(ONe.met*Z_sun>=met_arr[-2])].mass_2.values*u.M_sun)[::10],
-               x=np.log10(ONe.loc[(ONe.met*Z_sun>=met_arr[-2])].f_gw.values)[::10], levels=levels,fill=False, 
+               x=np.log10(ONe.loc[(ONe.met*Z_sun>=met_arr[-2])].f_gw.values)[::10], 
+               weights=ONe.loc[(ONe.met*Z_sun>=met_arr[-2])].weight.values[::10], levels=levels,fill=False, 
                ax=ax[3,2], color=colors[3], zorder=3, linewidths=2.5)
 
     from matplotlib.lines import Line2D
@@ -0,0 +1,166 @@
+#===================================================================================
+# Ratio of the mass in single stars to the mass in binaries of a population
+# with binary fraction binfrac, as COSMIC's independent sampler returns it
+# (mass_singles / mass_binaries), without sampling. Primaries and single
+# stars follow the Kroupa (2001) IMF from m1_min to m_max (slopes 1.3 and
+# 2.3 either side of 0.5 Msun) and secondaries have a mass ratio uniform
+# between m2_min / m1 and 1, so with the mean primary mass <m1> and the
+# mean secondary mass <m2>
+#
+#     mass_singles / mass_binaries = (1 - binfrac) <m1> / (binfrac (<m1> + <m2>))
+#
+# The two means only depend on the mass limits; they are integrated
+# numerically once per set of limits, kept in memory and, with a cache_dir,
+# saved there as a small json file keyed by a hash of the settings. Ratios
+# for any binfrac are then a division. monte_carlo_ratio samples the same
+# model, as the sampler does, to cross-check the integrals; both are
+# compared in tests/test_massratio.py and, with timings, in benchmarks.py
+# ratios.
+#===================================================================================
+
+import os
+import json
+import hashlib
+import numpy as np
+
+
+# Kroupa (2001) segments above m1_min: break masses and slopes
+kroupa01_breaks = [0.5]
+kroupa01_slopes = [1.3, 2.3]
+
+_means = {}
+
+
+def sampler_settings(primary_model='kroupa01', m1_min=0.08, m_max=150.0, m2_min=0.08):
+    '''
+    Settings of the independent sampler that the mass ratio depends
+    on, with COSMIC's defaults.
+    '''
+    if primary_model != 'kroupa01':
+        raise ValueError('only primary_model kroupa01 is supported, not {}'.format(primary_model))
+    return {'primary_model': primary_model, 'm1_min': float(m1_min),
+            'm_max': float(m_max), 'm2_min': float(m2_min)}
+
+
+def key(settings):
+    '''
+    Hash of the sampler settings that names their cache file.
+    '''
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _segments(settings):
+    edges = [settings['m1_min']] + [m for m in kroupa01_breaks
+                                    if settings['m1_min'] < m < settings['m_max']] + [settings['m_max']]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def imf(m, settings):
+    '''
+    Unnormalised Kroupa (2001) IMF, continuous at the breaks, zero
+    outside [m1_min, m_max].
+    '''
+    m = np.asarray(m, dtype=float)
+    out = np.zeros(m.shape)
+    norm = 1.0
+    for (a, b), slope in zip(_segments(settings), kroupa01_slopes):
+        inside = (m >= a) & (m <= b)
+        out[inside] = norm * (m[inside] / a) ** (-slope)
+        norm *= (b / a) ** (-slope)
+    return out
+
+
+def secondary_mean(m1, settings):
+    '''
+    Mean secondary mass of primaries of mass m1: the mass ratio is
+    uniform between m2_min / m1 and 1.
+    '''
+    return (m1 + settings['m2_min']) / 2
+
+
+def integrate_means(settings):
+    '''
+    Mean primary and secondary mass, integrated over the IMF segment
+    by segment.
+
+    Outputs: <m1>, <m2> in Msun
+    '''
+    from scipy.integrate import quad
+    N, M1, M2 = 0.0, 0.0, 0.0
+    for a, b in _segments(settings):
+        N += quad(lambda m: imf(m, settings), a, b, epsabs=0, epsrel=1e-12)[0]
+        M1 += quad(lambda m: m * imf(m, settings), a, b, epsabs=0, epsrel=1e-12)[0]
+        M2 += quad(lambda m: secondary_mean(m, settings) * imf(m, settings), a, b, epsabs=0, epsrel=1e-12)[0]
+    return M1 / N, M2 / N
+
+
+def means(settings, cache_dir=None):
+    '''
+    Returns integrate_means(settings) from memory, from cache_dir or by
+    integrating (and saving it in cache_dir).
+    '''
+    name = key(settings)
+    if name in _means:
+        return _means[name]
+    cache = None if cache_dir is None else os.path.join(cache_dir, 'massratio_{}.json'.format(name))
+    if cache is not None and os.path.exists(cache):
+        with open(cache) as f:
+            _means[name] = tuple(json.load(f)['means'])
+        return _means[name]
+    _means[name] = integrate_means(settings)
+    if cache is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache + '.{}.tmp'.format(os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'settings': settings, 'means': list(_means[name])}, f)
+        os.replace(tmp, cache)
+    return _means[name]
+
+
+def mass_ratio(binfrac, settings=None, cache_dir=None):
+    '''
+    mass_singles / mass_binaries of a population with binary fraction
+    binfrac (a float or an array).
+    '''
+    if settings is None:
+        settings = sampler_settings()
+    m1, m2 = means(settings, cache_dir)
+    binfrac = np.asarray(binfrac, dtype=float)
+    return (1 - binfrac) * m1 / (binfrac * (m1 + m2))
+
+
+def sample_imf(size, settings, rng=None):
+    '''
+    Draws size masses from the IMF by inverting its cumulative
+    distribution segment by segment.
+    '''
+    from scipy.integrate import quad
+    if rng is None:
+        rng = np.random
+    segments = _segments(settings)
+    slopes = kroupa01_slopes[:len(segments)]
+    weights = np.array([quad(lambda m: imf(m, settings), a, b)[0] for a, b in segments])
+    seg = np.searchsorted(np.cumsum(weights / weights.sum()), rng.uniform(0, 1, size), side='right')
+    seg = np.minimum(seg, len(segments) - 1)
+    a = np.array([s[0] for s in segments])[seg]
+    b = np.array([s[1] for s in segments])[seg]
+    k = 1 - np.array(slopes)[seg]
+    u = rng.uniform(0, 1, size)
+    return (a ** k + u * (b ** k - a ** k)) ** (1 / k)
+
+
+def monte_carlo_ratio(binfrac, size=1000000, settings=None, rng=None):
+    '''
+    mass_singles / mass_binaries of size sampled systems, each a binary
+    with probability binfrac, as the independent sampler computes it.
+    '''
+    if settings is None:
+        settings = sampler_settings()
+    if rng is None:
+        rng = np.random
+    m1 = sample_imf(size, settings, rng)
+    binary = rng.uniform(0, 1, size) < binfrac
+    q = rng.uniform(settings['m2_min'] / m1[binary], 1)
+    mass_binaries = np.sum(m1[binary] * (1 + q))
+    mass_singles = np.sum(m1[~binary])
+    return mass_singles / mass_binaries
@@ -0,0 +1,156 @@
+#===================================================================================
+# Fused Peters (1964) evolution kernel. filter_population used to call
+# t_merge, t_of_a, a_of_RLOF, a_of_t and porb_of_a one after the other, each
+# of which recomputes beta and the SI masses and separations as new arrays.
+# evolve_population does the age, merger and Roche-lobe cuts and the GW
+# evolution to the FIRE age in one pass over the population, with the same
+# formulas (and order of floating point operations) as those helpers.
+#
+# The default NumPy version computes each intermediate once and is bit-for-bit
+# identical to the helpers. An explicit loop compiled with numba can be used
+# instead with use_numba=True; it agrees with them to round-off (~1e-11
+# relative in sep_f, as numba and NumPy use different pow and log routines).
+#===================================================================================
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from constants import G, c, M_sol, R_sol, sec_Myr
+
+# Classification of every system at its FIRE age
+UNFORMED = 0  # the DWD forms after the FIRE age
+MERGED = 1  # merged before the FIRE age
+RLOF = 2  # the secondary overflowed its Roche lobe before the FIRE age
+ALIVE = 3  # detached DWD at the FIRE age
+UNDEFINED = 4  # formed, but the merger or RLOF time is not a number
+
+
+def _evolve_numpy(mass_1, mass_2, sep, rad_2, tphys, age):
+    m1 = mass_1 * M_sol
+    m2 = mass_2 * M_sol
+    beta = 64 / 5 * G ** 3 * m1 * m2 * (m1 + m2) / c ** 5
+    a_i4 = (sep * R_sol) ** 4
+    age = age * 1000
+
+    # merger time, t_merge (in seconds, as in postproc.t_merge)
+    t_delay = a_i4 / 4 / beta + tphys
+
+    # time of Roche-lobe overflow, t_of_a(a_of_RLOF)
+    q = mass_2 / mass_1
+    num = 0.49 * q ** (2/3)
+    denom = 0.6 * q ** (2/3) + np.log(1 + q ** (1/3))
+    a_RLOF = denom * rad_2 / num * R_sol
+    t_RLOF = (a_i4 - a_RLOF ** 4) / 4 / beta / sec_Myr
+
+    status = np.full(len(sep), UNDEFINED, dtype=np.int8)
+    formed = tphys <= age
+    status[~formed] = UNFORMED
+    status[formed & (t_delay <= age)] = MERGED
+    detached = formed & (t_delay > age)
+    status[detached & (t_RLOF + tphys >= age)] = ALIVE
+    status[detached & (t_RLOF + tphys <= age)] = RLOF
+
+    # GW evolution to the FIRE age, a_of_t and porb_of_a
+    t_evol = age - tphys
+    with np.errstate(invalid='ignore'):
+        a = (a_i4 - 4 * beta * (t_evol * sec_Myr)) ** (1/4)
+    sep_f = a / R_sol
+    porb_f = np.sqrt(4 * np.pi ** 2 * (sep_f * R_sol) ** 3 / G / (m1 + m2)) / 3600 / 24
+    f_gw = 2 / (porb_f * 24 * 3600)
+    return status, t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw
+
+
+def _evolve_loop(mass_1, mass_2, sep, rad_2, tphys, age):
+    n = len(sep)
+    status = np.empty(n, dtype=np.int8)
+    t_delay = np.empty(n)
+    t_RLOF = np.empty(n)
+    t_evol = np.empty(n)
+    sep_f = np.empty(n)
+    porb_f = np.empty(n)
+    f_gw = np.empty(n)
+    for k in range(n):
+        m1 = mass_1[k] * M_sol
+        m2 = mass_2[k] * M_sol
+        beta = 64 / 5 * G ** 3 * m1 * m2 * (m1 + m2) / c ** 5
+        a_i4 = (sep[k] * R_sol) ** 4
+        age_k = age[k] * 1000
+
+        t_delay[k] = a_i4 / 4 / beta + tphys[k]
+        q = mass_2[k] / mass_1[k]
+        num = 0.49 * q ** (2/3)
+        denom = 0.6 * q ** (2/3) + np.log(1 + q ** (1/3))
+        a_RLOF = denom * rad_2[k] / num * R_sol
+        t_RLOF[k] = (a_i4 - a_RLOF ** 4) / 4 / beta / sec_Myr
+
+        if not tphys[k] <= age_k:
+            status[k] = UNFORMED
+        elif t_delay[k] <= age_k:
+            status[k] = MERGED
+        elif not t_delay[k] > age_k:
+            status[k] = UNDEFINED
+        elif t_RLOF[k] + tphys[k] <= age_k:
+            status[k] = RLOF
+        elif t_RLOF[k] + tphys[k] >= age_k:
+            status[k] = ALIVE
+        else:
+            status[k] = UNDEFINED
+
+        t_evol[k] = age_k - tphys[k]
+        a4 = a_i4 - 4 * beta * (t_evol[k] * sec_Myr)
+        if a4 >= 0:
+            sep_f[k] = a4 ** (1/4) / R_sol
+        else:
+            sep_f[k] = np.nan
+        porb_f[k] = np.sqrt(4 * np.pi ** 2 * (sep_f[k] * R_sol) ** 3 / G / (m1 + m2)) / 3600 / 24
+        f_gw[k] = 2 / (porb_f[k] * 24 * 3600)
+    return status, t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw
+
+
+if numba is not None:
+    _evolve_loop = numba.njit(cache=True)(_evolve_loop)
+
+
+def evolve_population(mass_1, mass_2, sep, rad_2, tphys, age, use_numba=False):
+    '''
+    Classifies every system at its FIRE age and evolves it there
+    with GW radiation, in a single pass.
+
+    Systems are MERGED if t_delay <= age, RLOF if t_RLOF + tphys <= age
+    and ALIVE otherwise, as the cuts in postproc.merging_pop and
+    postproc.RLOF_pop (a system exactly on a boundary, which those put
+    in both populations, is counted as merged or overflowing).
+
+    Parameters
+    ----------
+    mass_1, mass_2 : `array`
+        component masses in solar masses
+    sep : `array`
+        separation at DWD formation in solar radii
+    rad_2 : `array`
+        radius of the secondary in solar radii
+    tphys : `array`
+        DWD formation time in Myr
+    age : `array`
+        FIRE star particle age in Gyr
+    use_numba : `bool`
+        use the numba-compiled loop instead of NumPy
+
+    Returns
+    -------
+    status : `array`
+        one of UNFORMED, MERGED, RLOF, ALIVE, UNDEFINED
+    t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw : `array`
+        as in postproc.merging_pop, RLOF_pop and evolve (sep_f is NaN
+        where the binary would have merged)
+    '''
+    if use_numba and numba is None:
+        raise ImportError('use_numba=True needs numba')
+    args = [np.ascontiguousarray(arr, dtype=float) for arr in (mass_1, mass_2, sep, rad_2, tphys, age)]
+    if use_numba:
+        return _evolve_loop(*args)
+    return _evolve_numpy(*args)
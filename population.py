@@ -0,0 +1,120 @@
+#===================================================================================
+# Struct-of-arrays container for DWD populations. filter_population used to
+# pass a pandas DataFrame through a chain of .loc copies, column assignments
+# and groupby joins, each of which copies every column. Population keeps one
+# typed numpy array per column, applies cuts in place with index arrays and
+# builds the histogram weights with np.bincount. DataFrames are only created
+# at the output boundary.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+
+
+class Population(object):
+    '''
+    Columnar DWD population.
+
+    Columns are numpy arrays of equal length and are available both as
+    items (pop['sep']) and as attributes (pop.sep), so the Peters
+    helpers in postproc work on a Population as they do on a DataFrame.
+
+    Parameters
+    ----------
+    columns : `dict`
+        column name -> array, all of the same length
+    '''
+    __slots__ = ('_cols', '_n')
+
+    def __init__(self, columns=None):
+        self._cols = {}
+        self._n = 0
+        if columns is not None:
+            for name, arr in columns.items():
+                self[name] = arr
+
+    @classmethod
+    def from_frame(cls, df, columns=None, dtypes=None):
+        '''
+        Builds a Population from the columns of a DataFrame. dtypes
+        optionally maps column names to the dtype they are cast to.
+        '''
+        if columns is None:
+            columns = df.columns
+        dtypes = dtypes or {}
+        return cls({col: np.ascontiguousarray(df[col].values, dtype=dtypes.get(col))
+                    for col in columns})
+
+    def to_frame(self, columns=None):
+        '''
+        Converts (a subset of the columns of) the population to a DataFrame.
+        '''
+        if columns is None:
+            columns = list(self._cols)
+        return pd.DataFrame({col: self._cols[col] for col in columns}, columns=columns)
+
+    @property
+    def columns(self):
+        return list(self._cols)
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, name):
+        return name in self._cols
+
+    def __getitem__(self, name):
+        return self._cols[name]
+
+    def __setitem__(self, name, arr):
+        arr = np.asarray(arr)
+        if arr.ndim == 0:
+            arr = np.full(self._n, arr)
+        if self._cols and len(arr) != self._n:
+            raise ValueError('column {} has length {}, expected {}'.format(name, len(arr), self._n))
+        self._cols[name] = arr
+        self._n = len(arr)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._cols[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def take(self, idx):
+        '''
+        Keeps only the rows in the index array idx, in place.
+        '''
+        for name in self._cols:
+            self._cols[name] = self._cols[name][idx]
+        self._n = len(idx)
+        return self
+
+    def mask(self, keep):
+        '''
+        Keeps only the rows where the boolean array keep is True, in place.
+        '''
+        return self.take(np.flatnonzero(keep))
+
+    def subset(self, keep, columns=None):
+        '''
+        Returns a new Population holding the rows selected by keep (a
+        boolean or index array) and, optionally, only some columns.
+        '''
+        if columns is None:
+            columns = self._cols
+        return Population({name: self._cols[name][keep] for name in columns})
+
+    def group_weights(self, by='bin_num', weights=None):
+        '''
+        For every row, the number of rows (or the sum of weights)
+        sharing its value of the column by. This is the np.bincount
+        equivalent of joining groupby(by).size() back on by.
+        '''
+        if self._n == 0:
+            return np.zeros(0, dtype='int64')
+        uniq, inverse = np.unique(self._cols[by], return_inverse=True)
+        counts = np.bincount(inverse, weights=weights, minlength=len(uniq))
+        return counts[inverse].astype('int64')
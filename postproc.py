@@ -1,20 +1,30 @@
 import utils as dutil
-
+from firestore import get_FIRE_store
+from population import Population
+from lbandio import Lband_weights
+import jitter
+import peters
+import lbandio
+import sidecar
+import events
+import foreground
+import psdcache
+import gwcirc
+import constants
+
+import os
+import collections
+import functools
+import queue
+import zlib
 import numpy as np
 import pandas as pd
 import astropy.units as u
-from astropy.time import Time
-import astropy.constants as const
-import astropy.coordinates as coords
-from astropy.coordinates import SkyCoord
-from scipy.interpolate import interp1d, UnivariateSpline
-from scipy.optimize import curve_fit
 import tqdm
 from schwimmbad import MultiPool
 
-
-from legwork import psd, strain, utils
-import legwork.source as source
+# legwork (and through it matplotlib), scipy and astropy.coordinates take
+# seconds to import, so they are imported by the functions that use them
 
 pd.options.mode.chained_assignment = None
 
@@ -40,19 +50,19 @@ ratios = np.array([0.68, 0.71, 0.74, 0.78, 0.82,
 
 ratio_05 = 0.64
 
-# LEGWORK uses astropy units so we do also for consistency
-G = const.G.value
-c = const.c.value  # speed of light in m s^-1
-M_sol = const.M_sun.value  # sun's mass in kg
-R_sol = const.R_sun.value  # sun's radius in metres
-sec_Myr = u.Myr.to('s')  # seconds in a million years
-m_kpc = u.kpc.to('m')  # metres in a kiloparsec
-Z_sun = 0.02  # solar metallicity
-sun = coords.get_sun(Time("2021-04-23T00:00:00", scale='utc'))
-sun_g = sun.transform_to(coords.Galactocentric)
-sun_yGx = sun_g.galcen_distance.to('kpc').value
-sun_zGx = sun_g.z.to('kpc').value
-M_astro = 7070  # FIRE star particle mass in solar masses
+# kstar1 and kstar2 labels of the COSMIC dat files of each DWD type
+DWD_kstars = {'He_He': ('10', '10'), 'CO_He': ('11', '10'), 
+              'CO_CO': ('11', '11'), 'ONe_X': ('12', '10_12')}
+
+# Physical constants; the Sun's position (sun_g, sun_yGx, sun_zGx) is
+# computed on first use, see constants.py
+from constants import G, c, M_sol, R_sol, sec_Myr, Z_sun, M_astro
+
+
+def __getattr__(name):
+    if name in constants.lazy:
+        return getattr(constants, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 
@@ -168,32 +178,14 @@ def a_of_RLOF(set):
 def random_sphere(R, num):
     '''
     Generates "num" number of random points within a
-    sphere of radius R. It picks random x, y, z values
-    within a cube and discards it if it's outside the
-    sphere.
+    sphere of radius R, drawn all at once with
+    jitter.sample_offsets.
 
     Inputs: Radius in kpc, num is an integer
 
     Outputs: X, Y, Z arrays of length num
     '''
-    X = []
-    Y = []
-    Z = []
-    while len(X) < num:
-        x = np.random.uniform(-R, R)
-        y = np.random.uniform(-R, R)
-        z = np.random.uniform(-R, R)
-        r = np.sqrt(x ** 2 + y ** 2 + z ** 2)
-        if r > R:
-            continue
-        if r <= R:
-            X.append(x)
-            Y.append(y)
-            Z.append(z)
-    X = np.array(X)
-    Y = np.array(Y)
-    Z = np.array(Z)
-    return X, Y, Z
+    return jitter.sample_offsets(R, num, 'uniform')
 
 
 def rad_WD(M):
@@ -227,132 +219,142 @@ def evolve(pop_init):
     return pop_init
 
 
-def position(pop_init):
+def position(pop_init, kernel='uniform', rng=None):
     '''
     Assigning random microchanges to positions to
     give each system a unique position for identical
-    FIRE star particles
-    '''
-    R_list = pop_init.kern_len.values
-    xGx = pop_init.xGx.values.copy()
-    yGx = pop_init.yGx.values.copy()
-    zGx = pop_init.zGx.values.copy()
-    x, y, z = random_sphere(1.0, len(R_list))
-    X = xGx + (x * R_list)
-    Y = yGx + (y * R_list)
-    Z = zGx + (z * R_list)
+    FIRE star particles. kernel is the radial profile
+    of the offsets (see jitter.profiles), scaled by
+    each particle's kern_len, and rng the random
+    generator they are drawn from.
+    '''
+    R_list = np.asarray(pop_init.kern_len)
+    xGx = np.asarray(pop_init.xGx)
+    yGx = np.asarray(pop_init.yGx)
+    zGx = np.asarray(pop_init.zGx)
+    x, y, z = jitter.sample_offsets(R_list, len(R_list), kernel, rng=rng)
+    X = xGx + x
+    Y = yGx + y
+    Z = zGx + z
     pop_init['X'] = X
     pop_init['Y'] = Y
     pop_init['Z'] = Z
-    pop_init['dist_sun'] = (X ** 2 + (Y - sun_yGx) ** 2 + (Z - sun_zGx) ** 2) ** (1/2)   
+    pop_init['dist_sun'] = (X ** 2 + (Y - constants.sun_yGx) ** 2 + (Z - constants.sun_zGx) ** 2) ** (1/2)   
     return pop_init
   
     
 def merging_pop(pop_init):
+    '''
+    Splits a Population into systems that have not merged by
+    their FIRE age (kept in place in pop_init) and those that have.
+    '''
     t_m = t_merge(pop_init)
-    pop_init['t_delay'] = t_m + pop_init.tphys.values
-    pop_merge = pop_init.loc[pop_init.t_delay <= pop_init.age * 1000]
-    pop_init = pop_init.loc[pop_init.t_delay >= pop_init.age * 1000]
+    pop_init['t_delay'] = t_m + pop_init.tphys
+    age = pop_init.age * 1000
+    pop_merge = pop_init.subset(pop_init.t_delay <= age)
+    pop_init.mask(pop_init.t_delay >= age)
     return pop_init, pop_merge
 
 
 def RLOF_pop(pop_init):
+    '''
+    Splits a Population into systems that have not overflowed their
+    Roche lobe by their FIRE age (kept in place in pop_init) and those
+    that have.
+    '''
     a_RLOF = a_of_RLOF(pop_init)
     t_RLOF = t_of_a(pop_init, a_RLOF)
     pop_init['t_RLOF'] = t_RLOF
-    pop_RLOF = pop_init.loc[t_RLOF + pop_init.tphys <= pop_init.age * 1000]
-    pop_init = pop_init.loc[t_RLOF + pop_init.tphys >= pop_init.age * 1000]
+    age = pop_init.age * 1000
+    pop_RLOF = pop_init.subset(t_RLOF + pop_init.tphys <= age)
+    pop_init.mask(t_RLOF + pop_init.tphys >= age)
     return pop_init, pop_RLOF
 
 
 def filter_population(dat):
-    pop_init, i, label, ratio, binfrac, pathtosave, interfile = dat
+    pop_init, i, label, ratio, binfrac, pathtosave, interfile, kernel, prefilter, seed = dat
+    check_prefilter(interfile, prefilter)
+    
+    # Work on one array per column from here on; the cuts below are
+    # applied in place and a DataFrame is only built for the output
+    pop_init = Population.from_frame(pop_init, dtypes={'bin_num': 'int64', 'FIRE_index': 'int64'})
+    
+    # Compressed populations (see sample_compressed) store each unique
+    # (conv row, FIRE particle) pair once with its multiplicity in 'weight'
+    compressed = 'weight' in pop_init
+    if compressed:
+        inter_cols = ['bin_num', 'FIRE_index', 'weight']
+    else:
+        inter_cols = ['bin_num', 'FIRE_index']
+    
+    inter_file = pathtosave + 'Lband_{}_{}_{}_inter.hdf'.format(label, met_arr[i+1], binfrac)
+    def save_inter(pop, key, cols=inter_cols):
+        pop.to_frame(cols).to_hdf(inter_file, key=key, format='t', append=True)
     
-    pop_init[['bin_num', 'FIRE_index']] = pop_init[['bin_num', 'FIRE_index']].astype('int64')
     if interfile == True:
-        pop_init[['bin_num', 'FIRE_index']].to_hdf(pathtosave + 'Lband_{}_{}_{}_inter.hdf'.format(label,
-                                                                                     met_arr[i+1],
-                                                                                     binfrac),
-                                                   key='pop_init', format='t', append=True)    
+        save_inter(pop_init, 'pop_init')
     # Now that we've obtained an initial population, we make data cuts
     # of systems who wouldn't form in time for their FIRE age, or would
     # merge or overflow their Roche Lobe before present day.
-    pop_init = pop_init.loc[pop_init.tphys <= pop_init.age * 1000]
-    if interfile == True:
-        pop_init[['bin_num', 'FIRE_index']].to_hdf(pathtosave + 'Lband_{}_{}_{}_inter.hdf'.format(label, 
-                                                                                     met_arr[i+1], 
-                                                                                     binfrac), 
-                                                    key='pop_age', format='t', append=True)
-    
-    pop_init, pop_merge = merging_pop(pop_init)
+    pop_init.mask(pop_init.tphys <= pop_init.age * 1000)
     if interfile == True:
-        pop_merge[['bin_num', 'FIRE_index']].to_hdf(pathtosave + 'Lband_{}_{}_{}_inter.hdf'.format(label,
-                                                                                      met_arr[i+1], 
-                                                                                      binfrac), 
-                                                    key='pop_merge', format='t', append=True)    
-    
-        pop_init[['bin_num', 'FIRE_index']].to_hdf(pathtosave + 'Lband_{}_{}_{}_inter.hdf'.format(label, 
-                                                                                     met_arr[i+1], 
-                                                                                     binfrac), 
-                                key='pop_nm', format='t', append=True)
-    
-    pop_merge = pd.DataFrame()
-    pop_init, pop_RLOF = RLOF_pop(pop_init)
+        save_inter(pop_init, 'pop_age')
     
+    # The merger and RLOF cuts and the GW evolution to the FIRE age
+    # are done in one pass by the fused Peters kernel; it evaluates
+    # the same formulas as merging_pop, RLOF_pop and evolve
+    status, t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw = peters.evolve_population(
+        pop_init.mass_1, pop_init.mass_2, pop_init.sep, pop_init.rad_2, pop_init.tphys, pop_init.age)
     if interfile == True:
-        pop_RLOF[['bin_num','FIRE_index']].to_hdf(pathtosave + 'Lband_{}_{}_{}_inter.hdf'.format(label,
-                                                                                           met_arr[i+1], 
-                                                                                           binfrac), 
-                                                  key='pop_RLOF', format='t', append=True)
-    
-        pop_init[['bin_num', 'FIRE_index']].to_hdf(pathtosave + 'Lband_{}_{}_{}_inter.hdf'.format(label, 
-                                                                                            met_arr[i+1], 
-                                                                                            binfrac), 
-                                key='pop_nRLOF', format='t', append=True)
-    pop_RLOF = pd.DataFrame()
+        save_inter(pop_init.subset(status == peters.MERGED), 'pop_merge')
+        save_inter(pop_init.subset(t_delay > pop_init.age * 1000), 'pop_nm')
+        save_inter(pop_init.subset(status == peters.RLOF), 'pop_RLOF')
+        save_inter(pop_init.subset(status == peters.ALIVE), 'pop_nRLOF')
     
     # We now have a final population which we can evolve
     # using GW radiation
-    pop_init = evolve(pop_init)
+    alive = np.flatnonzero(status == peters.ALIVE)
+    pop_init.take(alive)
+    pop_init['t_delay'] = t_delay[alive]
+    pop_init['t_RLOF'] = t_RLOF[alive]
+    pop_init['t_evol'] = t_evol[alive]
+    pop_init['sep_f'] = sep_f[alive]
+    pop_init['porb_f'] = porb_f[alive]
+    pop_init['f_gw'] = f_gw[alive]
     
     # Assigning random microchanges to positions to
     # give each system a unique position for identical
     # FIRE star particles
-    pop_init = position(pop_init)
+    pop_init = position(pop_init, kernel, rng=np.random.default_rng(seed))
     
     if interfile == True:
-        pop_init[['bin_num', 'FIRE_index', 'X', 'Y', 'Z']].to_hdf(pathtosave + 'Lband_{}_{}_{}_inter.hdf'.format(label, 
-                                                                                                    met_arr[i+1], 
-                                                                                                    binfrac), 
-                                                                  key='pop_f', format='t', append=True)    
-    if binfrac == 0.5:
-        binfrac_write = 0.5
-    else:
-        binfrac_write = 'variable'
+        save_inter(pop_init, 'pop_f', inter_cols + ['X', 'Y', 'Z'])
     
     # Assigning weights to population to be used for histograms.
     # This creates an extra columns which states how many times
     # a given system was sampled from the cosmic-pop conv df.
-    pop_init = pop_init.join(pop_init.groupby('bin_num')['bin_num'].size(), 
-                             on='bin_num', rsuffix='_pw')
+    # A prefiltered population never drew the systems that are alive
+    # but outside the band, so it cannot count them and has no
+    # bin_num_pw column.
+    if prefilter:
+        pass
+    elif compressed:
+        pop_init['bin_num_pw'] = pop_init.group_weights('bin_num', pop_init.weight)
+    else:
+        pop_init['bin_num_pw'] = pop_init.group_weights('bin_num')
     
     # Systems detectable by LISA will be in the frequency band
     # between f_gw's 0.01mHz and 1Hz.
-    LISA_band = pop_init.loc[(pop_init.f_gw >= 1e-4)]
+    LISA_band = pop_init.mask(pop_init.f_gw >= 1e-4)
     if len(LISA_band) == 0:
         print('No LISA sources for source {} and met {} and binfrac {}'.format(label, met_arr[i+1], binfrac))
         return []
     else:
-        pop_init = pd.DataFrame()
-        LISA_band = LISA_band.join(LISA_band.groupby('bin_num')['bin_num'].size(), 
-                                   on='bin_num', rsuffix='_Lw')
-        #if verbose:
-        #    print('got LISA band and added weight column')
-
-        # Output to hdf files
-        #savefile = 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac)
-        #LISA_band.to_hdf(pathtosave + savefile, key='Lband', format='t', append=True)
-        return LISA_band
+        if compressed:
+            LISA_band['bin_num_Lw'] = LISA_band.group_weights('bin_num', LISA_band.weight)
+        else:
+            LISA_band['bin_num_Lw'] = LISA_band.group_weights('bin_num')
+        return LISA_band.to_frame()
     
 #def sample_and_filter(dat):
 #    params_list = ['bin_num', 'mass_1', 'mass_2', 'kstar_1', 'kstar_2', 'porb', 'sep', 
@@ -369,28 +371,275 @@ def filter_population(dat):
 #    dat = [pop_init_int[params_list], i, label, ratio, binfrac, pathtosave, interfile]
 #    filter_population()
     
-def make_galaxy(dat, verbose=False):
-    pathtodat, fire_path, pathtosave, filename, i, label, ratio, binfrac, interfile, nproc = dat
-    FIRE = pd.read_hdf(fire_path+'FIRE.h5').sort_values('met')
+def sample_compressed(conv, FIRE_bin, N_astro, rng, Nsamp_split=5e6):
+    '''
+    Draws the same astrophysical population as the integer and decimal
+    sampling in make_galaxy, but stores each (conv row, FIRE particle)
+    pair only once together with its multiplicity.
+
+    Each star particle receives int(N_astro) draws from conv, which is a
+    multinomial over the conv rows, plus one extra draw with probability
+    N_astro % 1. When int(N_astro) is smaller than len(conv) the multinomial
+    is drawn as row indices and collapsed with np.unique, otherwise it is
+    drawn directly with a multinomial. Particles are processed in
+    blocks of at most Nsamp_split draws so the index arrays stay small.
+
+    Inputs: conv dataframe, FIRE_bin dataframe (including FIRE_index),
+    N_astro the number of binaries per star particle, rng the numpy
+    Generator to draw from
+
+    Outputs: dataframe of unique pairs with the conv and FIRE columns
+    and a 'weight' column holding the multiplicity of each pair
+    '''
+    N_astro = float(np.squeeze(N_astro))
+    n_conv = len(conv)
+    n_part = len(FIRE_bin)
+    n_int = int(N_astro)
+    N_astro_dec = N_astro % 1
+
+    keys = []
+    counts = []
+    if n_int > 0:
+        if n_int < n_conv:
+            block = max(1, int(Nsamp_split // n_int))
+        else:
+            block = max(1, int(Nsamp_split // n_conv))
+        for start in range(0, n_part, block):
+            stop = min(start + block, n_part)
+            if n_int < n_conv:
+                rows = rng.integers(0, n_conv, size=(stop - start) * n_int)
+                part = np.repeat(np.arange(start, stop), n_int)
+                key, count = np.unique(part * n_conv + rows, return_counts=True)
+            else:
+                draws = rng.multinomial(n_int, np.ones(n_conv) / n_conv, size=stop - start)
+                part, rows = np.nonzero(draws)
+                count = draws[part, rows]
+                key = (part + start) * n_conv + rows
+            keys.append(key)
+            counts.append(count)
+
+    # decimal portion: at most one extra system per star particle
+    p_DWD = rng.random(n_part)
+    part_dec = np.where(p_DWD <= N_astro_dec)[0]
+    rows_dec = rng.integers(0, n_conv, size=len(part_dec))
+    keys.append(part_dec * n_conv + rows_dec)
+    counts.append(np.ones(len(part_dec), dtype=int))
+
+    return pair_table(conv, FIRE_bin, np.concatenate(keys), np.concatenate(counts))
+
+
+def pair_table(conv, FIRE_bin, keys, counts=None):
+    '''
+    Builds the population dataframe for (conv row, FIRE particle) pairs
+    encoded as keys = particle * len(conv) + row. Repeated keys are
+    collapsed into one row whose 'weight' is the summed count.
+
+    Inputs: conv dataframe, FIRE_bin dataframe, keys integer array,
+    counts integer array of the same length (ones if None)
+
+    Outputs: dataframe of unique pairs with a 'weight' column
+    '''
+    n_conv = len(conv)
+    if counts is None:
+        counts = np.ones(len(keys), dtype='int64')
+    key, inverse = np.unique(keys, return_inverse=True)
+    weight = np.bincount(inverse, weights=counts, minlength=len(key)).astype('int64')
+
+    part = key // n_conv
+    rows = key % n_conv
+    pop = pd.concat([conv.iloc[rows].reset_index(), 
+                     FIRE_bin.iloc[part].reset_index()], axis=1)
+    pop['weight'] = weight
+    return pop
+
+
+def survival_window(conv, f_gw_min=1e-4, rtol=1e-9):
+    '''
+    Finds, for every conv row, the closed interval of FIRE ages
+    [t_min, t_max] (in Myr, compared against age * 1000) for which
+    the binary has formed, has neither merged nor overflowed its
+    Roche lobe, and orbits at f_gw >= f_gw_min. These are the same
+    cuts that filter_population applies, written in closed form
+    with the Peters helpers t_of_a, t_merge and a_of_RLOF.
 
-    rand_seed = np.random.randint(0, 100, 1)
-    np.random.seed(rand_seed)
+    The interval is widened by a relative rtol so that no system
+    is lost to round-off at the edges; filter_population still
+    applies the exact cuts afterwards.
+
+    Inputs: conv dataframe with mass_1, mass_2, sep, rad_2, tphys
+
+    Outputs: order, t_min, t_max where order sorts conv by t_min
+    and t_min/t_max are given in that sorted order
+    '''
+    # separation at which the binary enters the band
+    porb_band = 2 / f_gw_min
+    a_band = (G * (conv.mass_1 + conv.mass_2) * M_sol * porb_band ** 2 / (4 * np.pi ** 2)) ** (1/3) / R_sol
+    t_band = t_of_a(conv, a_band).values
+    t_RLOF = t_of_a(conv, a_of_RLOF(conv)).values
+    t_m = t_merge(conv).values
+    tphys = conv.tphys.values
     
-    rand_seed = pd.DataFrame(rand_seed)
-    rand_seed.to_hdf(pathtosave+'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac), 
-                     key='rand_seed')
+    t_min = tphys + np.maximum(t_band, 0)
+    t_max = tphys + np.minimum(t_m, t_RLOF)
+    t_min = t_min - rtol * np.abs(t_min)
+    t_max = t_max + rtol * np.abs(t_max)
+    
+    order = np.argsort(t_min, kind='stable')
+    return order, t_min[order], t_max[order]
+
+
+def sample_survivors(conv, FIRE_bin, N_astro, window, rng, compress=False):
+    '''
+    Samples only the (conv row, FIRE particle) pairs that can survive
+    the cuts in filter_population, using the interval index from
+    survival_window.
+
+    make_galaxy gives every star particle int(N_astro) uniform draws
+    from conv plus one more with probability N_astro % 1. Only draws
+    landing on rows with t_min <= age * 1000 (a prefix of the sorted
+    index) can survive, so the number of such draws is binomial with
+    probability prefix / len(conv) and they are uniform on the prefix.
+    Draws with t_max < age * 1000 are then rejected. This thins the
+    original sampling exactly, so the surviving population has the
+    same distribution while the rejected probability mass is never
+    drawn. The systems that are alive but outside the band are not
+    drawn either, so filter_population writes no bin_num_pw for a
+    prefiltered population and no interfiles can be written.
+
+    Inputs: conv dataframe, FIRE_bin dataframe (including FIRE_index),
+    N_astro the number of binaries per star particle, window the
+    output of survival_window, rng the numpy Generator to draw from,
+    compress to collapse repeated pairs into a 'weight' column
+
+    Outputs: population dataframe of candidate survivors
+    '''
+    order, t_min, t_max = window
+    N_astro = float(np.squeeze(N_astro))
+    n_conv = len(conv)
+    n_int = int(N_astro)
+    N_astro_dec = N_astro % 1
+    
+    age = FIRE_bin.age.values * 1000
+    n_prefix = np.searchsorted(t_min, age, side='right')
+    p_prefix = n_prefix / n_conv
+    
+    # integer portion
+    K_int = rng.binomial(n_int, p_prefix)
+    # decimal portion
+    K_dec = (rng.random(len(FIRE_bin)) <= N_astro_dec * p_prefix).astype(int)
+    
+    K = K_int + K_dec
+    part = np.repeat(np.arange(len(FIRE_bin)), K)
+    rows = (rng.random(len(part)) * n_prefix[part]).astype('int64')
+    keep = t_max[rows] >= age[part]
+    part = part[keep]
+    rows = order[rows[keep]]
+    
+    if compress:
+        return pair_table(conv, FIRE_bin, part * n_conv + rows)
+    pop = pd.concat([conv.iloc[rows].reset_index(), 
+                     FIRE_bin.iloc[part].reset_index()], axis=1)
+    return pop
+
+
+def check_prefilter(interfile, prefilter):
+    '''
+    Raises a ValueError if interfiles are asked for a prefiltered
+    population: sample_survivors only draws the systems that survive
+    all cuts, so pop_init and pop_age would not hold the sampled
+    population and pop_merge, pop_RLOF would be empty.
+    '''
+    if prefilter and interfile == True:
+        raise ValueError('interfiles cannot be written for a prefiltered population')
 
-    # Choose metallicity bin
-    met_start = met_arr[i] / Z_sun
-    met_end = met_arr[i+1] / Z_sun
+
+def new_root_seed():
+    '''
+    Draws a fresh root seed from OS entropy, reduced to 63 bits so it
+    can be stored in the spawn_keys table of the Lband files.
+    '''
+    return int(np.random.SeedSequence().entropy % 2 ** 63)
+
+
+def spawn_key(label, i, binfrac, chunk_id):
+    '''
+    SeedSequence spawn key of one chunk: the crc32 of the DWD label,
+    the metallicity index, the binary fraction in units of 1e-4 and
+    the chunk id.
+    '''
+    return (zlib.crc32(label.encode()), int(i), int(round(binfrac * 1e4)), int(chunk_id))
+
+
+def chunk_seeds(root_seed, label, i, binfrac, chunk_id):
+    '''
+    Returns the (sampling, filtering) SeedSequences of one chunk. They
+    only depend on the root seed of the run and the chunk's spawn key,
+    so every chunk draws the same numbers whichever process runs it
+    and in whichever order, and can be regenerated on its own.
+    '''
+    seq = np.random.SeedSequence(root_seed, spawn_key=spawn_key(label, i, binfrac, chunk_id))
+    return seq.spawn(2)
+
+
+def make_galaxy(dat, verbose=False, compact_schema=False, backend='hdf', codec='zstd'):
+    '''
+    Creates the LISA band population of a single (DWD type, metallicity,
+    binary fraction) task and appends it to its Lband file. The chunks
+    from galaxy_chunks are sampled and filtered on nproc processes. compact_schema,
+    backend and codec select how the Lband rows are stored (see
+    save_Lband).
+    '''
+    pathtodat, fire_path, pathtosave, filename, i, label, ratio, binfrac, interfile, nproc, compress, prefilter, kernel, seed = dat
+    check_prefilter(interfile, prefilter)
+    if seed is None:
+        seed = new_root_seed()
+        dat = list(dat[:-1]) + [seed]
+        print('root seed: {}'.format(seed))
+    chunks = (((0, chunk_id), desc) for chunk_id, desc in galaxy_chunks(dat, verbose=verbose))
+    store_opts = {'compact_schema': compact_schema, 'backend': backend, 'codec': codec}
+    if nproc > 1:
+        # Chunks are sampled by the workers and at most 2 * nproc of
+        # them are in flight, so memory stays bounded by the chunk size
+        # rather than by the size of the metallicity bin
+        for (task_id, chunk_id), LISA_band, n_pieces in pool_chunks(chunks, nproc, 2 * nproc, verbose=verbose):
+            save_Lband(LISA_band, i, label, binfrac, pathtosave, seed=seed, chunk_id=chunk_id, 
+                       n_pieces=n_pieces, **store_opts)
+    else:
+        for (task_id, chunk_id), LISA_band, n_pieces in map(functools.partial(filter_chunk, verbose=verbose), 
+                                                            chunks):
+            save_Lband(LISA_band, i, label, binfrac, pathtosave, seed=seed, chunk_id=chunk_id, 
+                       n_pieces=n_pieces, **store_opts)
     
-    # Calculating the formation time of each component:
-    conv = pd.read_hdf(pathtodat+filename, key='conv')
+    return
+
+
+def galaxy_chunks(dat, verbose=False, chunk_ids=None, skip_ids=None, Nsamp_split=int(5e6)):
+    '''
+    Lazily yields (chunk_id, descriptor) for each chunk of one (DWD
+    type, metallicity, binary fraction) task. A descriptor is the
+    small list [dat, chunk_id, N_astro, start, stop, size]; the chunk
+    itself is only sampled by build_chunk, in the worker that filters
+    it, so the parent never holds conv or a sampled population.
+
+    The chunks are the decimal portion (chunk 0, all star particles)
+    followed by the integer portion in pieces of at most Nsamp_split
+    systems (start, stop count systems), or, for compressed/prefiltered
+    populations, the star particles in pieces that draw at most
+    Nsamp_split systems (start, stop count particles). size is an
+    upper bound on the rows of the chunk. Each chunk is sampled from
+    its own random stream (see chunk_seeds).
+
+    If chunk_ids is given only those chunks are yielded and nothing is
+    written, otherwise the mass_total key is written when the task is
+    first read. Chunks in skip_ids (e.g. those already completed when
+    resuming) are not yielded.
+    '''
+    pathtodat, fire_path, pathtosave, filename, i, label, ratio, binfrac, interfile, nproc, compress, prefilter, kernel, seed = dat
     
-    # Re-writing the radii of each component since the conv df 
-    # doesn't log the WD radius properly
-    conv['rad_1'] = rad_WD(conv.mass_1.values)
-    conv['rad_2'] = rad_WD(conv.mass_2.values)    
+    def wanted(chunk_id):
+        if skip_ids is not None and chunk_id in skip_ids:
+            return False
+        return chunk_ids is None or chunk_id in chunk_ids
     
     # Use ratio to scale to astrophysical pop w/ specific binary frac.
     try:
@@ -400,113 +649,483 @@ def make_galaxy(dat, verbose=False):
         mass_binaries = pd.read_hdf(pathtodat+filename, key='mass_binaries').iloc[-1]
     mass_total = (1 + ratio) * mass_binaries
     
-    mass_total.to_hdf(pathtosave+'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], 
-                                                  binfrac), key='mass_total')
-    DWD_per_mass = len(conv) / mass_total
-    N_astro = DWD_per_mass * M_astro  # num of binaries per star particle
-    
-    # Choose FIRE bin based on metallicity
-    FIRE['FIRE_index'] = FIRE.index
-    if met_end * Z_sun == met_arr[-1]:
-        FIRE_bin = FIRE.loc[FIRE.met >= met_start]
-    else:
-        FIRE_bin = FIRE.loc[(FIRE.met >= met_start)&(FIRE.met <= met_end)]
-    FIRE = []
+    if chunk_ids is None:
+        mass_total.to_hdf(pathtosave+'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], 
+                                                      binfrac), key='mass_total')
+    # only the number of conv rows is read here
+    with pd.HDFStore(pathtodat+filename, mode='r') as store:
+        storer = store.get_storer('conv')
+        n_conv = int(storer.nrows if storer.is_table else storer.shape[0])
+    DWD_per_mass = n_conv / mass_total
+    N_astro = float(np.squeeze(DWD_per_mass * M_astro))  # num of binaries per star particle
+    
+    # Number of star particles in the FIRE bin of this metallicity
+    start, end = get_FIRE_store(fire_path, pathtosave + 'FIRE_cache/').offsets(met_arr, Z_sun)
+    n_part = int(end[i] - start[i])
+    
+    if compress or prefilter:
+        per_part = max(1, int(np.ceil(N_astro)))
+        block = max(1, Nsamp_split // per_part)
+        if verbose:
+            print('we will sample {} star particles in {} chunks'.format(n_part, -(-n_part // block)))
+        for j in range(0, max(n_part, 1), block):
+            chunk_id = j // block
+            stop = min(j + block, n_part)
+            if wanted(chunk_id):
+                yield chunk_id, [dat, chunk_id, N_astro, j, stop, (stop - j) * per_part]
+        return
     
     # We sample by the integer number of systems per star particle,
     # as well as a probabilistic approach for the fractional component
     # of N_astro:
-    N_astro_dec = N_astro % 1
-    p_DWD = np.random.rand(len(FIRE_bin))
-    N_sample_dec = np.zeros(len(FIRE_bin))
-    N_sample_dec[p_DWD <= N_astro_dec.values] = 1.0
-    num_sample_dec = int(N_sample_dec.sum())
+    if wanted(0):
+        yield 0, [dat, 0, N_astro, 0, n_part, n_part]
+    
+    N_sample_int = int(N_astro) * n_part
     if verbose:
-        print('we will sample {} stars from the decimal portion'.format(num_sample_dec))
-    sample_dec = pd.DataFrame.sample(conv, num_sample_dec, replace=True)
-    FIRE_bin2 = FIRE_bin.loc[N_sample_dec == 1.0]
+        print('we will sample {} stars from the integer portion'.format(N_sample_int))
+    for j in range(0, N_sample_int, Nsamp_split):
+        chunk_id = 1 + j // Nsamp_split
+        jlast = min(j + Nsamp_split, N_sample_int)
+        if wanted(chunk_id):
+            yield chunk_id, [dat, chunk_id, N_astro, j, jlast, jlast - j]
+    
+    return
+
+
+# conv of the last task read by this process, see task_conv
+_conv = {}
+
+
+def task_conv(dat):
+    '''
+    Reads the conv table of one task, with the WD radii rewritten and,
+    for prefiltered tasks, its survival_window. Workers keep the last
+    one they read, as consecutive chunks mostly belong to one task.
+
+    Outputs: conv dataframe, window (None unless prefilter)
+    '''
+    pathtodat, filename, prefilter = dat[0], dat[3], dat[11]
+    key = (pathtodat + filename, bool(prefilter))
+    if key not in _conv:
+        _conv.clear()
+        conv = pd.read_hdf(pathtodat+filename, key='conv')
+        
+        # Re-writing the radii of each component since the conv df 
+        # doesn't log the WD radius properly
+        conv['rad_1'] = rad_WD(conv.mass_1.values)
+        conv['rad_2'] = rad_WD(conv.mass_2.values)
+        _conv[key] = (conv, survival_window(conv) if prefilter else None)
+    return _conv[key]
+
+
+def build_chunk(desc, verbose=False):
+    '''
+    Samples the chunk of a galaxy_chunks descriptor and returns the
+    filter_population argument list. The result only depends on the
+    descriptor and the root seed, whichever process builds it.
+    '''
+    dat, chunk_id, N_astro, start, stop, size = desc
+    pathtodat, fire_path, pathtosave, filename, i, label, ratio, binfrac, interfile, nproc, compress, prefilter, kernel, seed = dat
+    sample_seed, filter_seed = chunk_seeds(seed, label, i, binfrac, chunk_id)
+    rng = np.random.default_rng(sample_seed)
+    conv, window = task_conv(dat)
+    
+    # Choose FIRE bin based on metallicity; the catalogue is read
+    # and sorted once per process and memory-mapped from its cache
+    FIRE_bin = get_FIRE_store(fire_path, pathtosave + 'FIRE_cache/').get_bin(i, met_arr, Z_sun)
     
     params_list = ['bin_num', 'mass_1', 'mass_2', 'kstar_1', 'kstar_2', 'porb', 'sep', 
             'met', 'age', 'tphys', 'rad_1', 'rad_2', 'kern_len', 'xGx', 'yGx', 'zGx', 
                    'FIRE_index']#, 'CEsep', 'CEtime', 'RLOFsep', 'RLOFtime']
     
-    pop_init = pd.concat([sample_dec.reset_index(), FIRE_bin2.reset_index()], axis=1)
-    sample_dec = pd.DataFrame()
-    FIRE_bin2 = pd.DataFrame()
-    dat = [pop_init[params_list], i, label, ratio, binfrac, pathtosave, interfile]
-    LISA_band = filter_population(dat)
-
-    if len(LISA_band) > 0:
-        savefile = 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac)
-        LISA_band.to_hdf(pathtosave + savefile, key='Lband', format='t', append=True)
+    dat_args = [i, label, ratio, binfrac, pathtosave, interfile, kernel, prefilter]
     
-    N_sample_int = int(N_astro) * len(FIRE_bin)
-    if verbose:
-        print('we will sample {} stars from the integer portion'.format(N_sample_int))
+    if compress or prefilter:
+        FIRE_bin = FIRE_bin.iloc[start:stop]
+        if prefilter:
+            # Only draw systems whose FIRE age falls inside their
+            # formed, unmerged, pre-RLOF and in-band window
+            pop_init = sample_survivors(conv, FIRE_bin, N_astro, window, rng, compress=compress)
+        else:
+            # Store each (conv row, FIRE particle) pair once with its
+            # multiplicity instead of materialising every duplicate row
+            pop_init = sample_compressed(conv, FIRE_bin, N_astro, rng)
+        if compress:
+            params_list = params_list + ['weight']
+            if verbose:
+                print('chunk {}: {} unique pairs representing {} systems'.format(chunk_id, len(pop_init), 
+                                                                               pop_init.weight.sum()))
+        elif verbose:
+            print('chunk {}: {} candidate survivors'.format(chunk_id, len(pop_init)))
+        return [pop_init[params_list]] + dat_args + [filter_seed]
+    
+    if chunk_id == 0:
+        N_astro_dec = N_astro % 1
+        p_DWD = rng.random(len(FIRE_bin))
+        N_sample_dec = np.zeros(len(FIRE_bin))
+        N_sample_dec[p_DWD <= N_astro_dec] = 1.0
+        num_sample_dec = int(N_sample_dec.sum())
+        if verbose:
+            print('we will sample {} stars from the decimal portion'.format(num_sample_dec))
+        sample_dec = pd.DataFrame.sample(conv, num_sample_dec, replace=True, random_state=rng)
+        FIRE_bin2 = FIRE_bin.loc[N_sample_dec == 1.0]
+        
+        pop_init = pd.concat([sample_dec.reset_index(), FIRE_bin2.reset_index()], axis=1)
+        return [pop_init[params_list]] + dat_args + [filter_seed]
+    
+    return [int_chunk(conv, FIRE_bin, int(N_astro), params_list, start, stop, rng, verbose=verbose)] + dat_args + [filter_seed]
+
+
+def int_chunk(conv, FIRE_bin, n_int, params_list, j, jlast, rng, verbose=False):
+    '''
+    Builds systems j to jlast of the integer portion of the population,
+    in which every star particle in FIRE_bin is repeated n_int times,
+    without building the others.
+
+    Inputs: conv dataframe, FIRE_bin dataframe, n_int number of systems
+    per star particle, params_list columns to keep, j and jlast the
+    first and last + 1 system, rng the numpy Generator of the chunk
 
+    Outputs: population dataframe of the chunk
+    '''
     if verbose:
-        print('getting FIRE bin')
-    FIRE_repeat = pd.DataFrame(np.repeat(FIRE_bin.values, int(N_astro), axis=0))
-    FIRE_repeat.columns = FIRE_bin.columns
-    FIRE_bin = pd.DataFrame()
-    
-    Nsamp_split = 5e6
-    if N_sample_int < Nsamp_split:
-        sample_int = pd.DataFrame.sample(conv, N_sample_int, replace=True)
-        pop_init_int = pd.concat([sample_int.reset_index(), 
-                                  FIRE_repeat.reset_index()], axis=1)
-        N = len(sample_int)
-        sample_int = pd.DataFrame()
-        FIRE_repeat = pd.DataFrame()
-        dat = [pop_init_int[params_list], i, label, ratio, binfrac, pathtosave, interfile]
-        LISA_band = filter_population(dat)
-        
+        print('j: ', j)
+        print('jlast: ', jlast)
+        print('sampling {} systems'.format(jlast - j))
+    sample_int = pd.DataFrame.sample(conv, jlast - j, replace=True, random_state=rng)
+    FIRE_chunk = FIRE_bin.iloc[np.arange(j, jlast) // n_int]
+    pop_init_int = pd.concat([sample_int.reset_index(), 
+                              FIRE_chunk.reset_index()], axis=1)
+    return pop_init_int[params_list]
+
+
+def recompute_chunk(dat, chunk_id, n_pieces=1):
+    '''
+    Regenerates the LISA band population of a single chunk of a
+    task from the root seed in dat and the chunk's spawn key,
+    without writing anything. n_pieces is the number of pieces
+    the chunk was filtered in (see the spawn_keys table). The
+    result is identical to the rows that chunk contributed to
+    the Lband file.
+    '''
+    for _, desc in galaxy_chunks(dat, chunk_ids=[chunk_id]):
+        dat_chunk = build_chunk(desc)
+        dat_chunk[6] = 'False'
+        return filter_pieces(dat_chunk, n_pieces)
+    raise ValueError('task has no chunk {}'.format(chunk_id))
+
+
+def filter_pieces(dat, n_pieces):
+    '''
+    Runs filter_population on a chunk split into n_pieces pieces of
+    (nearly) equal length and concatenates the LISA band populations.
+    Each piece draws from its own child of the chunk's filtering
+    seed. With n_pieces = 1 this is filter_population(dat).
+    '''
+    if n_pieces == 1:
+        return filter_population(dat)
+    pop_init = dat[0]
+    # children are built from their spawn keys rather than with spawn(),
+    # which would hand out new children on every retry
+    seed = dat[-1]
+    seeds = [np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (k,)) for k in range(n_pieces)]
+    bounds = np.linspace(0, len(pop_init), n_pieces + 1).astype(int)
+    LISA_bands = []
+    for start, stop, seed in zip(bounds[:-1], bounds[1:], seeds):
+        LISA_band = filter_population([pop_init.iloc[start:stop]] + list(dat[1:-1]) + [seed])
         if len(LISA_band) > 0:
-            savefile = 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac)
-            LISA_band.to_hdf(pathtosave + savefile, key='Lband', format='t', append=True)
-    
+            LISA_bands.append(LISA_band)
+    if len(LISA_bands) == 0:
+        return []
+    return pd.concat(LISA_bands, ignore_index=True)
 
-    elif N_sample_int > Nsamp_split:
-        if verbose:
-            print('looping the integer population')
-        N = 0
-        j = 0
-        jlast = int(Nsamp_split)
-        dat_filter = []
-        while j < N_sample_int:
+
+def filter_chunk(chunk, n_pieces=1, retry_factor=4, min_rows=10000, verbose=False):
+    '''
+    Samples one (key, descriptor) chunk of galaxy_chunks (see
+    build_chunk), runs filter_population on it in n_pieces pieces and
+    returns the LISA band population tagged with its key and the
+    number of pieces it was filtered in. If the chunk runs out of
+    memory it is retried in retry_factor times as many pieces, as long
+    as the pieces hold at least min_rows systems. The bin_num_pw and
+    bin_num_Lw weights of a retried chunk are counted per piece.
+    '''
+    key, desc = chunk
+    dat = build_chunk(desc, verbose=verbose)
+    while True:
+        try:
+            return key, filter_pieces(dat, n_pieces), n_pieces
+        except MemoryError:
+            if len(dat[0]) // (n_pieces * retry_factor) < min_rows:
+                raise
+            n_pieces = n_pieces * retry_factor
             if verbose:
-                print('j: ', j)
-                print('jlast: ', jlast)
-                print('sampling {} systems'.format(int(jlast - j)))
-            sample_int = pd.DataFrame.sample(conv, int(jlast-j), replace=True)
-            N += len(sample_int)
-            pop_init_int = pd.concat([sample_int.reset_index(), 
-                                      FIRE_repeat.iloc[j:jlast].reset_index()], axis=1)
-            dat_filter.append([pop_init_int[params_list], i, label, ratio, binfrac, pathtosave, interfile])
-            j += Nsamp_split
-            j = int(j)
-            jlast += Nsamp_split
-            jlast = int(jlast)
-            if jlast > N_sample_int:
-                jlast = N_sample_int
-        with MultiPool(processes=nproc) as pool:
-            LISA_band_list = list(pool.map(filter_population, dat_filter))
-        
-        for LISA_band in LISA_band_list:
-            savefile = 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac)
-            LISA_band.to_hdf(pathtosave + savefile, key='Lband', format='t', append=True)
-    
-       
-    if N != N_sample_int:
-        print('loop is incorrect')
+                print('chunk {} ran out of memory, retrying in {} pieces'.format(key, n_pieces))
 
-    FIRE_repeat = pd.DataFrame()
-    sample_int = pd.DataFrame()
-    
-    return
+
+def pool_chunks(chunks, nproc, maxsize, ordered=True, retry_factor=4, min_rows=10000, max_deaths=3, 
+                verbose=False, held=None):
+    '''
+    Runs filter_chunk on the (key, descriptor) chunks on nproc worker
+    processes and yields its results. Like imap_bounded, a chunk is
+    only pulled from chunks once fewer than maxsize are in flight
+    (or finished but not yet yielded), and results come in submission
+    order if ordered, otherwise as they complete. held, if given,
+    returns the number of yielded results the caller still keeps in
+    memory (e.g. to write them in order); they count against maxsize
+    too, so the caller's buffer cannot grow while an early chunk is
+    slow.
+
+    A worker that is killed, e.g. by the kernel's OOM killer, takes
+    no Python MemoryError with it but breaks the pool, and the chunks
+    in flight lose their results. The pool is then respawned and
+    those chunks are requeued in retry_factor times as many pieces,
+    while the pieces can hold at least min_rows systems (judged from
+    the size bound of the descriptor); a chunk that
+    cannot be split further is given up on (RuntimeError) after
+    max_deaths broken pools.
+    '''
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    from concurrent.futures.process import BrokenProcessPool
+    
+    def requeue(item):
+        chunk, n_pieces, deaths = item
+        if chunk[1][5] // (n_pieces * retry_factor) >= min_rows:
+            n_pieces = n_pieces * retry_factor
+        elif deaths >= max_deaths:
+            raise RuntimeError('chunk {} was in flight in {} broken pools'.format(chunk[0], deaths + 1))
+        if verbose:
+            print('chunk {} lost its worker, retrying in {} pieces'.format(chunk[0], n_pieces))
+        retry.append((chunk, n_pieces, deaths + 1))
+    
+    if held is None:
+        held = lambda: 0
+    chunks = iter(chunks)
+    exhausted = False
+    retry = collections.deque()
+    inflight = {}
+    order = collections.deque()
+    finished = {}
+    pool = ProcessPoolExecutor(max_workers=nproc)
+    try:
+        while True:
+            # lost chunks are always resubmitted: they were already
+            # counted when they were first pulled
+            while retry or (not exhausted and len(inflight) + len(finished) + held() < maxsize):
+                if retry:
+                    item = retry.popleft()
+                else:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    item = (chunk, 1, 0)
+                    if ordered:
+                        order.append(chunk[0])
+                chunk = None
+                future = pool.submit(filter_chunk, item[0], n_pieces=item[1], retry_factor=retry_factor, 
+                                     min_rows=min_rows, verbose=verbose)
+                inflight[future] = item
+            if not inflight:
+                break
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                item = inflight.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    requeue(item)
+                    continue
+                if ordered:
+                    finished[result[0]] = result
+                else:
+                    yield result
+            if broken:
+                for item in inflight.values():
+                    requeue(item)
+                inflight = {}
+                pool.shutdown(wait=True)
+                if verbose:
+                    print('a worker died, restarting the pool')
+                pool = ProcessPoolExecutor(max_workers=nproc)
+            while order and order[0] in finished:
+                yield finished.pop(order.popleft())
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
 
 
-def save_full_galaxy(DWD_list, pathtodat, fire_path, pathtoLband, interfile, nproc):
+def save_Lband(LISA_band, i, label, binfrac, pathtosave, seed=None, chunk_id=None, n_pieces=1, 
+               compact_schema=False, backend='hdf', codec='zstd'):
+    '''
+    Appends the LISA band population of one chunk to the Lband file
+    of its task. If seed is given, the chunk's spawn key is appended
+    to the spawn_keys table together with the number of rows it wrote
+    and the number of pieces it was filtered in. The Lband rows are
+    written first, so spawn_keys is the manifest of completed chunks
+    used by resume_task. With compact_schema the rows are written
+    with the downcast dtypes of lbandio.compact_dtypes.
+
+    With backend='parquet' the rows go to their own file in the
+    partitioned dataset pathtosave + 'Lband_dataset' instead,
+    compressed with codec; mass_total and spawn_keys stay in the
+    task's Lband HDF file.
+
+    The metadata sidecar of the task (see Lband_meta) is updated
+    with the new rows.
+    '''
+    savefile = 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac)
+    # read before writing, as writing makes the sidecar stale
+    meta = sidecar.read_meta(pathtosave + savefile) if os.path.exists(pathtosave + savefile) else None
+    if len(LISA_band) > 0:
+        if backend == 'parquet':
+            lbandio.write_Lband_parquet(LISA_band, pathtosave + 'Lband_dataset', label, binfrac, met_arr[i+1], 
+                                        chunk_id, codec=codec, compact_schema=compact_schema)
+        else:
+            lbandio.write_Lband(LISA_band, pathtosave + savefile, compact_schema=compact_schema)
+    if seed is not None:
+        label_key, met_index, binfrac_key, chunk = spawn_key(label, i, binfrac, chunk_id)
+        keys = pd.DataFrame({'root_seed': [seed], 'label_key': [label_key], 'met_index': [met_index], 
+                             'binfrac_key': [binfrac_key], 'chunk_id': [chunk], 'n_rows': [len(LISA_band)], 
+                             'n_pieces': [n_pieces]}, 
+                            dtype='int64')
+        keys.to_hdf(pathtosave + savefile, key='spawn_keys', format='t', append=True)
+    if not os.path.exists(pathtosave + savefile):
+        return
+    if meta is None:
+        Lband_meta(i, label, binfrac, pathtosave, backend=backend)
+    else:
+        # the rows as they are read back, so that the sidecar matches
+        # a rescan of the file
+        if compact_schema:
+            LISA_band = lbandio.expand(lbandio.compact(LISA_band))
+        meta = sidecar.add_Lband_rows(meta, LISA_band)
+        sidecar.write_meta(pathtosave + savefile, sidecar.set_Lband_manifest(meta, pathtosave + savefile))
+
+
+def Lband_meta(i, label, binfrac, pathtosave, backend='hdf'):
+    '''
+    Returns the metadata sidecar of the Lband file of one task (row
+    and system counts, mass_total, spawn_keys, column min/max and
+    histograms of met and f_gw, see sidecar.py). If the sidecar is
+    missing or stale the task's rows are scanned and it is rewritten.
+    '''
+    savefile = pathtosave + 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac)
+    meta = sidecar.read_meta(savefile)
+    if meta is not None:
+        return meta
+    meta = sidecar.empty_Lband_meta()
+    if backend == 'parquet':
+        if os.path.isdir(pathtosave + 'Lband_dataset'):
+            meta = sidecar.add_Lband_rows(meta, lbandio.read_Lband_dataset(pathtosave + 'Lband_dataset', label=label, 
+                                                                           model=lbandio.model_of(binfrac), 
+                                                                           met=met_arr[i+1]))
+    else:
+        with pd.HDFStore(savefile, mode='r') as store:
+            if '/Lband' in store.keys():
+                for Lband in store.select('Lband', chunksize=int(1e6)):
+                    meta = sidecar.add_Lband_rows(meta, lbandio.expand(Lband))
+    meta = sidecar.set_Lband_manifest(meta, savefile)
+    meta.update(label=label, met=float(met_arr[i+1]), binfrac=float(binfrac), backend=backend)
+    return sidecar.write_meta(savefile, meta)
+
+
+def resume_task(i, label, binfrac, pathtosave, backend='hdf'):
+    '''
+    Brings the Lband file of one task back to its last completed
+    chunk so that a killed run can be resumed. Chunks are written
+    in order, so the completed chunks listed in spawn_keys are
+    always 0, ..., k-1. Lband rows beyond the ones they account for
+    belong to a half-written chunk and are removed (for the parquet
+    backend, the chunk files not in the manifest). Files that cannot
+    be read, or that have no manifest, are deleted and the task
+    starts again.
+
+    Outputs: set of completed chunk ids, root seed of the run that
+    wrote them (None if there are none)
+    '''
+    savefile = pathtosave + 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac)
+    dataset = pathtosave + 'Lband_dataset'
+    if not os.path.exists(savefile):
+        if backend == 'parquet':
+            lbandio.remove_parquet_chunks(dataset, label, binfrac, met_arr[i+1], keep=set())
+        return set(), None
+    try:
+        with pd.HDFStore(savefile) as store:
+            if '/spawn_keys' not in store.keys():
+                if '/Lband' not in store.keys():
+                    return set(), None
+                raise KeyError('no spawn_keys manifest')
+            keys = store.select('spawn_keys')
+            chunks = keys.chunk_id.values
+            if len(np.unique(keys.root_seed)) != 1 or not np.array_equal(chunks, np.arange(len(chunks))):
+                raise ValueError('inconsistent spawn_keys manifest')
+            if backend == 'parquet':
+                lbandio.remove_parquet_chunks(dataset, label, binfrac, met_arr[i+1], keep=set(chunks.tolist()))
+                return set(chunks.tolist()), int(keys.root_seed.iloc[0])
+            n_rows = store.get_storer('Lband').nrows if '/Lband' in store.keys() else 0
+            n_expected = int(keys.n_rows.sum())
+            if n_rows < n_expected:
+                raise ValueError('{} Lband rows but the manifest lists {}'.format(n_rows, n_expected))
+            if n_rows > n_expected:
+                print('{}: removing {} rows of a half-written chunk'.format(savefile, n_rows - n_expected))
+                store.remove('Lband', start=n_expected)
+        return set(chunks.tolist()), int(keys.root_seed.iloc[0])
+    except (KeyError, ValueError, OSError) as err:
+        print('{}: cannot resume ({}), starting this task again'.format(savefile, err))
+        os.remove(savefile)
+        if backend == 'parquet':
+            lbandio.remove_parquet_chunks(dataset, label, binfrac, met_arr[i+1], keep=set())
+        return set(), None
+
+
+def imap_bounded(pool, func, iterable, maxsize, ordered=True):
+    '''
+    Like pool.imap, but only pulls the next item from iterable once
+    fewer than maxsize tasks are in flight, so a lazy generator of
+    large chunks is never consumed ahead of the workers. With
+    ordered=True results are yielded in submission order, otherwise
+    in the order in which they complete so a slow chunk never keeps
+    the other workers waiting.
+    '''
+    if ordered:
+        pending = collections.deque()
+        for item in iterable:
+            pending.append(pool.apply_async(func, (item,)))
+            item = None
+            while len(pending) >= maxsize:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        return
+    
+    done = queue.Queue()
+    def get():
+        result = done.get()
+        if isinstance(result, BaseException):
+            raise result
+        return result
+    
+    inflight = 0
+    for item in iterable:
+        pool.apply_async(func, (item,), callback=done.put, error_callback=done.put)
+        item = None
+        inflight += 1
+        while inflight >= maxsize:
+            inflight -= 1
+            yield get()
+    while inflight > 0:
+        inflight -= 1
+        yield get()
+
+
+def save_full_galaxy(DWD_list, pathtodat, fire_path, pathtoLband, interfile, nproc, compress=False, 
+                     prefilter=False, kernel='uniform', seed=None, resume=False, compact_schema=False, 
+                     backend='hdf', codec='zstd', verbose=False):
+    check_prefilter(interfile, prefilter)
+    
     # Generate array of metallicities:
     
     met_arr = np.logspace(np.log10(1e-4), np.log10(0.03), 15)
@@ -525,44 +1144,147 @@ def save_full_galaxy(DWD_list, pathtodat, fire_path, pathtoLband, interfile, npr
                        1.44, 1.7, 2.05, 2.51, 3.17])
     
     ratio_05 = 0.64
+    
+    # When resuming, every task continues after its last completed
+    # chunk; its Lband file is truncated back to that chunk
+    if resume:
+        completed = {}
+        for DWD in DWD_list:
+            fnames, label = dutil.getfiles(kstar1=DWD_kstars[DWD][0], kstar2=DWD_kstars[DWD][1])
+            for i in range(len(fnames)):
+                for binfrac in [binfracs[i], 0.5]:
+                    completed[(label, i, binfrac)], task_seed = resume_task(i, label, binfrac, pathtoLband, 
+                                                                            backend=backend)
+                    if task_seed is None:
+                        continue
+                    if seed is None:
+                        seed = task_seed
+                    elif seed != task_seed:
+                        raise ValueError('cannot resume: {} Z={} binfrac={} was written with root seed {}, not {}'.format(
+                                         label, met_arr[i+1], binfrac, task_seed, seed))
+    
+    # All random numbers are drawn from streams spawned from one
+    # root seed per run (see chunk_seeds)
+    if seed is None:
+        seed = new_root_seed()
+    print('root seed: {}'.format(seed))
 
     
     # Run Code:
     # Run through all metallicities for metallicity-dependent
     # binary fraction and binary fraction of 0.5
     
+    # Every task gets pathtoLband as its output path, so the FIRE
+    # column cache goes to pathtoLband + 'FIRE_cache/' and fire_path
+    # is only read
     dat = []
     
     for DWD in DWD_list:
-        if DWD == 'He_He':
-            kstar1 = '10'
-            kstar2 = '10'    
-        elif DWD == 'CO_He':
-            kstar1 = '11'
-            kstar2 = '10'
-        elif DWD == 'CO_CO':
-            kstar1 = '11'
-            kstar2 = '11'
-        elif DWD == 'ONe_X':
-            kstar1 = '12'
-            kstar2 = '10_12'
-            
+        kstar1, kstar2 = DWD_kstars[DWD]
         fnames, label = dutil.getfiles(kstar1=kstar1, kstar2=kstar2)
         i = 0
         for f, ratio, binfrac in zip(fnames, ratios, binfracs):
-            dat.append([pathtodat, fire_path, pathtoLband, f, i, label, ratio, binfrac, interfile, nproc])
+            dat.append([pathtodat, fire_path, pathtoLband, f, i, label, ratio, binfrac, interfile, nproc, compress, prefilter, kernel, seed])
             i += 1
         i = 0
         for f, ratio, binfrac in zip(fnames, ratios, binfracs):
-            dat.append([pathtodat, fire_path, pathtoLband, f, i, label, ratio_05, 0.5, interfile, nproc])
+            dat.append([pathtodat, fire_path, pathtoLband, f, i, label, ratio_05, 0.5, interfile, nproc, compress, prefilter, kernel, seed])
             i += 1
-    for d in dat:
-        make_galaxy(d)
+    
+    # Every task is split into chunks which are fed lazily to one shared
+    # pool: idle workers take the next chunk of whichever task is being
+    # enumerated, so small bins and the decimal portions no longer leave
+    # the other cores idle. The parent only sends chunk descriptors;
+    # reading conv and sampling happen in the workers. tasks tracks per-task completion and holds
+    # the chunks that finished early until all earlier chunks of their
+    # task are written, so the Lband files do not depend on nproc. The
+    # held chunks count against the 2 * nproc chunks in flight, so
+    # memory stays bounded while an early chunk is slow or retried.
+    tasks = {}
+    
+    def finish(task_id):
+        task = tasks[task_id]
+        if task['exhausted'] and task['done'] == len(task['submitted']):
+            print('finished {} Z={} binfrac={} in {} chunks'.format(task['label'], met_arr[task['i']+1], 
+                                                                    task['binfrac'], task['done']))
+            del tasks[task_id]
+    
+    def task_chunks():
+        for task_id, d in enumerate(dat):
+            pathtodat, fire_path, pathtoLband, f, i, label, ratio, binfrac = d[:8]
+            tasks[task_id] = {'i': i, 'label': label, 'binfrac': binfrac, 'pathtosave': pathtoLband,
+                              'submitted': [], 'done': 0, 'exhausted': False, 'waiting': {}}
+            skip_ids = completed[(label, i, binfrac)] if resume else None
+            for chunk_id, desc in galaxy_chunks(d, skip_ids=skip_ids):
+                tasks[task_id]['submitted'].append(chunk_id)
+                yield (task_id, chunk_id), desc
+            tasks[task_id]['exhausted'] = True
+            finish(task_id)
+    
+    def handle(key, LISA_band, n_pieces):
+        task_id, chunk_id = key
+        task = tasks[task_id]
+        task['waiting'][chunk_id] = (LISA_band, n_pieces)
+        # write every chunk whose predecessors have all been written
+        while task['done'] < len(task['submitted']) and task['submitted'][task['done']] in task['waiting']:
+            chunk_id = task['submitted'][task['done']]
+            LISA_band, n_pieces = task['waiting'].pop(chunk_id)
+            save_Lband(LISA_band, task['i'], task['label'], task['binfrac'], task['pathtosave'], 
+                       seed=seed, chunk_id=chunk_id, n_pieces=n_pieces, compact_schema=compact_schema, 
+                       backend=backend, codec=codec)
+            task['done'] += 1
+        finish(task_id)
+    
+    if nproc > 1:
+        held = lambda: sum(len(task['waiting']) for task in tasks.values())
+        for key, LISA_band, n_pieces in pool_chunks(task_chunks(), nproc, 2 * nproc, ordered=False, 
+                                                    verbose=verbose, held=held):
+            handle(key, LISA_band, n_pieces)
+    else:
+        for key, LISA_band, n_pieces in map(functools.partial(filter_chunk, verbose=verbose), task_chunks()):
+            handle(key, LISA_band, n_pieces)
           
     return
 
 
-def get_formeff(pathtodat, pathtoLband, pathtosave, getfrom='Lband'):
+def Lband_model_files(pathtoLband, labels, var, met=None, backend='hdf'):
+    '''
+    Lband files of the DWD labels (e.g. ['10_10', '12']) for one binary
+    fraction model (var=True for FZ, False for F50), optionally of a
+    single metallicity bin: the task HDF files, or the chunk files of
+    the parquet dataset in pathtoLband.
+    '''
+    files = []
+    for label in labels:
+        for i in range(15):
+            if met is not None and met_arr[i+1] != met:
+                continue
+            binfrac = binfracs[i] if var else 0.5
+            if backend == 'parquet':
+                files.extend(lbandio.parquet_files(pathtoLband + 'Lband_dataset', label, binfrac, met_arr[i+1]))
+            else:
+                files.append(pathtoLband + 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac))
+    return files
+
+
+def read_Lband_model(pathtoLband, labels, var, columns=None, predicate=None, met=None, backend='hdf', 
+                     nthreads=4):
+    '''
+    Reads the Lband rows of the DWD labels for one binary fraction
+    model into one dataframe with a weight column (see Lband_weights).
+    Only the listed columns, and the rows for which predicate is True,
+    are kept; see lbandio.iter_Lband_files. Missing files are skipped.
+    '''
+    files = Lband_model_files(pathtoLband, labels, var, met=met, backend=backend)
+    return lbandio.read_Lband_weighted(files, columns=columns, predicate=predicate, nthreads=nthreads)
+
+
+def get_formeff(pathtodat, pathtoLband, pathtosave, getfrom='Lband', cache_dir=None):
+    # The sidecars of the dat files are kept in cache_dir, never next
+    # to the inputs
+    if cache_dir is None:
+        cache_dir = pathtosave + 'meta_cache/'
+    
     def formeff(datfiles, Lbandfiles, pathtodat, pathtoLband, label, model, getfrom):
         lenconv = []
         masslist = []
@@ -573,20 +1295,20 @@ def get_formeff(pathtodat, pathtoLband, pathtosave, getfrom='Lband'):
             elif model == 'FZ':
                 binfrac = binfracs[i]
                 ratio = ratios[i]
+            # row counts and masses come from the metadata sidecars,
+            # which are written on the first call if missing
+            datmeta = sidecar.dat_meta(pathtodat + datfiles[i], cache_dir=cache_dir)
             if getfrom == 'Lband':
-                mass = pd.read_hdf(pathtoLband + Lbandfiles[i], key='mass_total')
-                conv = pd.read_hdf(pathtodat + datfiles[i], key='conv')
+                meta = sidecar.read_meta(pathtoLband + Lbandfiles[i])
+                if meta is not None and 'mass_total' in meta:
+                    mass = np.array([meta['mass_total']])
+                else:
+                    mass = pd.read_hdf(pathtoLband + Lbandfiles[i], key='mass_total').values
             elif getfrom == 'dat':
-                try:
-                    mass_binaries = pd.read_hdf(pathtodat + datfiles[i], key='mass_stars').iloc[-1]
-                except:
-                    print('m_binaries key')
-                    mass_binaries = pd.read_hdf(pathtodat + datfiles[i], key='mass_binaries').iloc[-1]
-                mass = (1 + ratio) * mass_binaries
-                conv = pd.read_hdf(pathtodat + datfiles[i], key='conv')
+                mass = np.array([(1 + ratio) * datmeta['mass_binaries']])
                             
             masslist.append(mass)
-            lenconv.append(len(conv))
+            lenconv.append(datmeta['n_rows']['conv'])
 
         lenconv = np.array(lenconv)
         masslist = np.concatenate(np.array(masslist))
@@ -616,83 +1338,38 @@ def get_formeff(pathtodat, pathtoLband, pathtosave, getfrom='Lband'):
     return
 
 
-def get_interactionsep(pathtodat, pathtoLband, pathtosave, verbose=False):
-    def intersep(pathtodat, datfile, pathtoLband, fsave, i, label, binfrac, verbose=verbose):
-        data = pd.DataFrame() 
-        columns=['bin_num', 'FIRE_index', 'met', 'rad_1', 'rad_2', 'CEsep', 'CEtime', 'RLOFsep', 'RLOFtime'] 
-        data.to_hdf(fsave, key='data', format='t', append=True) 
-
-        if verbose:
-            print('\n{}'.format(i))
-
+def get_interactionsep(pathtodat, pathtoLband, pathtosave, verbose=False, backend='hdf'):
+    def intersep(table, fsave, i, label, binfrac, verbose=verbose):
         Z = met_arr[i+1] 
 
         if verbose:
+            print('\n{}'.format(i))
             print('Z: ', Z) 
             print('binfrac: ', binfrac) 
 
-        Lbandfile = pathtoLband + 'Lband_{}_{}_{}.hdf'.format(label, Z, binfrac)
-        if verbose:
-            print('Lbandfile: ' + Lbandfile)
-        try:
-            Lband = pd.read_hdf(Lbandfile, key='Lband').sort_values('bin_num') 
-            data = Lband[['bin_num', 'FIRE_index', 'met', 'rad_1', 'rad_2']] 
-    
-            if verbose:
-                print('dat file: ' + datfile)
-            dat = pd.read_hdf(pathtodat+datfile, key='bpp') 
-            dat = dat[['tphys', 'evol_type', 'sep', 'bin_num']]
-    
-            RLOFsep = dat.loc[dat.evol_type==3].groupby('bin_num', as_index=False).first()
-            RLOFsep = RLOFsep.loc[RLOFsep.bin_num.isin(data.bin_num)]
-            data_RLOF = data.loc[data.bin_num.isin(RLOFsep.bin_num)]
-            RLOFsep['weights'] = data_RLOF.bin_num.value_counts().sort_index().values
-            
-            CEsep = dat.loc[dat.evol_type==7].groupby('bin_num', as_index=False).first()
-            CEsep = CEsep.loc[CEsep.bin_num.isin(data.bin_num)]
-            data_CE = data.loc[data.bin_num.isin(CEsep.bin_num)]
-            CEsep['weights'] = data_CE.bin_num.value_counts().sort_index().values
-    
-            dat = []
-            data_RLOF = []
-            data_CE = []
-    
-            data['CEsep'] = np.repeat(CEsep['sep'], CEsep['weights']).values
-            data['CEtime'] = np.repeat(CEsep['tphys'], CEsep['weights']).values
-            data['RLOFsep'] = np.repeat(RLOFsep['sep'], RLOFsep['weights']).values
-            data['RLOFtime'] = np.repeat(RLOFsep['tphys'], RLOFsep['weights']).values
-    
-            Ntot = len(data) 
-            
-            if verbose:
-                print('Ntot: ', Ntot) 
-            N = 0 
-            j = 0 
-            jlast = int(1e5) 
-            while j < Ntot: 
-                if verbose:
-                    print('j: ', j) 
-                    print('jlast: ', jlast) 
-                data[j:jlast].to_hdf(fsave, key='data', format='t', append=True) 
-                N += len(data[j:jlast]) 
-                j += 1e5 
-                j = int(j) 
-                jlast += 1e5 
-                if jlast > Ntot: 
-                    jlast = Ntot 
-                jlast = int(jlast) 
-            if verbose:
-                if N != Ntot: 
-                    print('loop is wrong') 
-                else: 
-                    print('wrote to hdf successfully') 
-    
-            return
-        except:
+        # weight is the multiplicity of each row (1 if not compressed)
+        # and is kept so the table can be averaged and histogrammed
+        Lband = read_Lband_model(pathtoLband, [label], binfrac != 0.5, met=Z, backend=backend, 
+                                 columns=['bin_num', 'FIRE_index', 'met', 'rad_1', 'rad_2', 'weight'])
+        if len(Lband) == 0:
             return
+        data = Lband.sort_values('bin_num')[['bin_num', 'FIRE_index', 'met', 'rad_1', 'rad_2', 'weight']]
+        
+        # first CE and RLOF of every system from the event table of
+        # its dat file (NaN if the binary has none)
+        inter = events.gather(table, data.bin_num.values)
+        for col in ['CEsep', 'CEtime', 'RLOFsep', 'RLOFtime']:
+            data[col] = inter[col]
+        
+        if verbose:
+            print('Ntot: ', len(data)) 
+        data.to_hdf(fsave, key='data', format='t', append=True) 
+        return
 
 
-    # FZ:
+    # The event table of every dat file is built once, shared by
+    # both binary fraction models and cached in pathtosave
+    cache_dir = pathtosave + 'event_cache/'
     kstar1_list = ['10', '11', '11', '12']
     kstar2_list = ['10', '10', '11', '10_12']
     for kstar1, kstar2 in zip(kstar1_list, kstar2_list):
@@ -700,81 +1377,58 @@ def get_interactionsep(pathtodat, pathtoLband, pathtosave, verbose=False):
         for f, i in tqdm.tqdm(zip(files, range(len(files))), total=len(files)):
             if verbose:
                 print('i = {}'.format(i))
-            binfrac = binfracs[i]
-            met = met_arr[i+1]
-            fsave = pathtosave+'{}_intersep_FZ.hdf'.format(label)
-            intersep(pathtodat, f, pathtoLband, fsave, i, label, binfrac, verbose)
+                print('dat file: ' + f)
+            try:
+                table = events.event_table(pathtodat + f, cache_dir=cache_dir)
+            except (OSError, KeyError) as err:
+                print('no bpp events for {} ({})'.format(f, err))
+                continue
             
-            if verbose:
-                print('i = {}'.format(i))
-            binfrac = 0.5
-            met = met_arr[i+1]
-            fsave = pathtosave+'{}_intersep_F50.hdf'.format(label)
-            intersep(pathtodat, f, pathtoLband, fsave, i, label, binfrac, verbose)
+            # FZ:
+            intersep(table, pathtosave+'{}_intersep_FZ.hdf'.format(label), i, label, binfracs[i], verbose)
+            # F50:
+            intersep(table, pathtosave+'{}_intersep_F50.hdf'.format(label), i, label, 0.5, verbose)
         
     return
 
 
-def get_numLISA(pathtoLband, pathtosave, Lbandfile, FIREmin=0.00015, FIREmax=13.346, Z_sun=0.02):
+def get_numLISA(pathtoLband, pathtosave, Lbandfile, FIREmin=0.00015, FIREmax=13.346, Z_sun=0.02, backend='hdf'):
     num = 30
     met_bins = np.logspace(np.log10(FIREmin), np.log10(FIREmax), num)*Z_sun
     
-    for var, model in zip([False, True], ['F50', 'FZ']):
-        
-        He = pd.DataFrame()
-        for f in dutil.Lband_files(kstar1='10', kstar2='10', var=var):
+    def numLISA(label, var):
+        # The histograms are summed from the metadata sidecars of the
+        # Lband files (see Lband_meta); the rows are only read if a
+        # sidecar is missing or stale, or if met_bins are not the
+        # default grid of sidecar.met_bins
+        nums = np.zeros(len(met_bins)-1)
+        for i in range(15):
+            binfrac = binfracs[i] if var else 0.5
+            f = 'Lband_{}_{}_{}.hdf'.format(label, met_arr[i+1], binfrac)
             try:
-                He = He.append(pd.read_hdf(pathtoLband + f, key='Lband')[['met']])
-            except:
+                meta = Lband_meta(i, label, binfrac, pathtoLband, backend=backend)
+            except (OSError, KeyError):
                 print('no LISA sources for {}'.format(f))
                 continue
-        print('finished He + He')
-        if len(He) > 0:
-            Henums, bins = np.histogram(He.met*Z_sun, bins=met_bins)
-        else:
-            Henums = np.zeros(len(met_bins)-1)
-        He = []
+            counts = sidecar.met_counts(meta, met_bins)
+            if counts is None and meta['n_rows'] > 0:
+                Lband = read_Lband_model(pathtoLband, [label], var, columns=['met', 'weight'], met=met_arr[i+1], 
+                                         backend=backend)
+                counts, bins = np.histogram(Lband.met*Z_sun, bins=met_bins, weights=Lband.weight)
+            if counts is not None:
+                nums += counts
+        return nums
+    
+    for var, model in zip([False, True], ['F50', 'FZ']):
         
-        COHe = pd.DataFrame()
-        for f in dutil.Lband_files(kstar1='11', kstar2='10', var=var):
-            try:
-                COHe = COHe.append(pd.read_hdf(pathtoLband + f, key='Lband')[['met']])
-            except:
-                print('no LISA sources for {}'.format(f))
+        Henums = numLISA('10_10', var)
+        print('finished He + He')
+        COHenums = numLISA('11_10', var)
         print('finished CO + He')
-        if len(COHe) > 0:
-            COHenums, bins = np.histogram(COHe.met*Z_sun, bins=met_bins)
-        else:
-            COHenums = np.zeros(len(met_bins)-1)
-        COHe = []
-        
-        
-        CO = pd.DataFrame()
-        for f in dutil.Lband_files(kstar1='11', kstar2='11', var=var):
-            try:
-                CO = CO.append(pd.read_hdf(pathtoLband + f, key='Lband')[['met']])
-            except:
-                print('no LISA sources for {}'.format(f))
+        COnums = numLISA('11_11', var)
         print('finished CO + CO')
-        if len(CO) > 0:
-            COnums, bins = np.histogram(CO.met*Z_sun, bins=met_bins)
-        else:
-            COnums = np.zeros(len(met_bins)-1)
-        CO = []
-        
-        
-        ONe = pd.DataFrame()
-        for f in dutil.Lband_files(kstar1='12', kstar2='10', var=var):
-            try:
-                ONe = ONe.append(pd.read_hdf(pathtoLband + f, key='Lband')[['met']])
-            except:
-                print('no LISA sources for {}'.format(f))
+        ONenums = numLISA('12', var)
         print('finished ONe + X')
-        if len(ONe) > 0:
-            ONenums, bins = np.histogram(ONe.met*Z_sun, bins=met_bins)
-        else:
-            ONenums = np.zeros(len(met_bins)-1)
-        ONe = []
     
         numLISA_30bins = pd.DataFrame(np.array([Henums, COHenums, COnums, ONenums]).T, 
                                          columns=['He', 'COHe', 'CO', 'ONe'])
@@ -784,109 +1438,261 @@ def get_numLISA(pathtoLband, pathtosave, Lbandfile, FIREmin=0.00015, FIREmax=13.
     return
 
 
-def get_resolvedDWDs(pathtoLband, pathtosave, var, window=1000):
-    
-    def func(x, a, b, c, d, e):
-        return a + b*x + c*x**2 + d*x**3 + e*x**4
-    
-    def cosmic_confusion(f, L, t_obs=4 * u.yr, approximate_R=True, include_confusion_noise=False):
-        lisa_psd_no_conf = psd.power_spectral_density(f, include_confusion_noise=False, t_obs=4 * u.yr)
-        conf = 10**func(x=np.log10(f.value), 
-                        a=popt[0], b=popt[1], 
-                        c=popt[2], d=popt[3], e=popt[4]) * t_obs.to(u.s)
-    
-        psd_plus_conf = conf + lisa_psd_no_conf
-        return psd_plus_conf.to(u.Hz**(-1))
+def cosmic_confusion(popt, cache_dir=None):
+    '''
+    Returns a legwork custom PSD function: the LISA PSD plus the
+    confusion noise of the fitted coefficients popt, interpolated from
+    the tables of psdcache.py (saved in cache_dir).
+    '''
+    def psd_func(f, L='auto', t_obs=4 * u.yr, approximate_R=True, confusion_noise=None):
+        params = psdcache.instrument_params(t_obs=4 * u.yr if isinstance(t_obs, str) else t_obs)
+        return psdcache.lisa_psd(f, popt, params=params, cache_dir=cache_dir) * u.Hz**(-1)
+    return psd_func
+
+
+def cosmic_confusion_psd(popt, cache_dir=None):
+    '''
+    Unit-free version of cosmic_confusion for gwcirc.SNR_circ: PSD in
+    Hz^-1 at frequencies in Hz.
+    '''
+    def psd_func(f):
+        return psdcache.lisa_psd(f, popt, cache_dir=cache_dir)
+    return psd_func
+
+
+Tobs = 4 * u.yr
+snr_cut = 7
+
+
+def Lband_sources(Lband, sc_params, **kwargs):
+    import legwork.source as source
+    return source.Source(m_1=Lband.mass_1.values * u.Msun, 
+                         m_2=Lband.mass_2.values * u.Msun,  
+                         ecc=np.zeros(len(Lband.mass_1)), 
+                         dist=Lband.dist_sun.values * u.kpc, 
+                         f_orb=Lband.f_gw.values/2 * u.Hz,
+                         interpolate_g=True, 
+                         interpolate_sc=True, 
+                         sc_params=sc_params, **kwargs)
+
+
+def foreground_piece(task):
+    '''
+    GW power of one piece of the Lband files (see lbandio.Lband_pieces)
+    summed in the bins of foreground.lisa_bins. With fast=True the
+    strains are computed by gwcirc.py instead of legwork.
+
+    Outputs: indices of the occupied bins, power in each
+    '''
+    piece, fast = task
+    Lband = Lband_weights(lbandio.read_Lband_piece(piece, columns=['mass_1', 'mass_2', 'dist_sun', 'f_gw', 'weight']))
+    if len(Lband) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    if fast:
+        strains = gwcirc.h_2(Lband.mass_1.values, Lband.mass_2.values, Lband.f_gw.values, Lband.dist_sun.values)
+    else:
+        sources = Lband_sources(Lband, {"instrument": "LISA",
+                                        "t_obs": Tobs,
+                                        "L": 2.5e9,
+                                        "approximate_R": True,
+                                        "confusion_noise": None})
+        strains = sources.get_h_0_n(harmonics=[2]).flatten()
+    return foreground.bin_power(Lband.f_gw.values, strains**2 * Lband.weight.values)
+
 
+def noise_ratio(f_gw, popt, cache_dir=None):
+    '''
+    Ratio of the PSD of LISA plus the confusion noise of popt to the
+    PSD of LISA alone at the frequencies f_gw (in Hz).
+    '''
+    return psdcache.lisa_psd(f_gw, popt, cache_dir=cache_dir) / psdcache.lisa_psd(f_gw, cache_dir=cache_dir)
+
+
+def confusion_snr(Lband, popt, cache_dir=None, fast=True):
+    '''
+    Adds the h_0, power, digits, snr, chirp and resolved_chirp columns
+    of the systems of Lband against LISA plus the confusion noise of
+    popt. The systems are circular, so with fast=True they are computed
+    in closed form by gwcirc.py instead of through a legwork Source.
+    '''
+    Tobs_s = Tobs.to(u.s).value
+    if fast:
+        m_1, m_2, f_gw, dist = Lband.mass_1.values, Lband.mass_2.values, Lband.f_gw.values, Lband.dist_sun.values
+        strains = gwcirc.h_2(m_1, m_2, f_gw, dist)
+        snr = gwcirc.SNR_circ(m_1, m_2, f_gw, dist, cosmic_confusion_psd(popt, cache_dir), 
+                              t_obs=Tobs_s, stat_tol=1/Tobs_s)
+        chirp = gwcirc.chirp_circ(m_1, m_2, f_gw)
+    else:
+        sources_conf = Lband_sources(Lband, {"instrument": "custom",
+                                             "custom_psd": cosmic_confusion(popt, cache_dir),
+                                             "t_obs": Tobs,
+                                             "L": 2.5e9,
+                                             "approximate_R": True,
+                                             "confusion_noise": None}, 
+                                     stat_tol=1/Tobs_s)
+        strains = sources_conf.get_h_0_n(harmonics=[2]).flatten()
+        snr = sources_conf.get_snr(t_obs=Tobs, verbose=False)
+        from legwork import utils
+        chirp = utils.fn_dot(sources_conf.m_c, sources_conf.f_orb, sources_conf.ecc, n=2).to(u.Hz / u.s).value
+    Lband['h_0'] = strains
+    Lband['power'] = strains**2 * Lband.weight.values
+    Lband['digits'] = foreground.bin_index(Lband.f_gw.values)
+    Lband['snr'] = snr
+    Lband['chirp'] = chirp
+    Lband['resolved_chirp'] = np.zeros(len(Lband))
+    Lband.loc[Lband.chirp > 1/Tobs_s**2, 'resolved_chirp'] = 1.0
+    return Lband
+
+
+def resolved_piece(task):
+    '''
+    SNR and chirp of the systems of one piece of the Lband files
+    against LISA plus the confusion noise of popt (see confusion_snr).
+
+    Outputs: the systems with SNR above snr_cut and, if candidates is
+    True, the systems below it that could pass it once the confusion
+    noise goes down (SNR above snr_cut against LISA alone), both
+    indexed by their row number in the concatenated pieces
+    '''
+    piece, offset, popt, candidates, cache_dir, fast = task
+    Lband = Lband_weights(lbandio.read_Lband_piece(piece))
+    Lband.index = Lband.index + offset
+    if len(Lband) == 0:
+        return Lband, Lband
+    Lband = confusion_snr(Lband, popt, cache_dir, fast)
+    resolved = Lband.snr > snr_cut
+    if candidates:
+        # the SNR of a stationary source scales as PSD^(-1/2)
+        snr_max = Lband.snr.values * np.sqrt(noise_ratio(Lband.f_gw.values, popt, cache_dir))
+        candidates = ~resolved & (snr_max > snr_cut)
+    else:
+        candidates = np.zeros(len(Lband), dtype=bool)
+    return Lband.loc[resolved], Lband.loc[candidates]
+
+
+def subtract_resolved(occupied, power, dat, popt, window, rtol=1e-4, max_iter=20, verbose=False, cache_dir=None, 
+                      fast=True):
+    '''
+    Iteratively removes the resolved systems from the foreground.
+
+    Every iteration takes the power of the systems of dat that passed
+    (or fell back below) snr_cut off (or back onto) the foreground
+    spectrum, refits the confusion noise and recomputes the SNR of the
+    systems of dat whose PSD changed by more than rtol since their SNR
+    was last computed, until no system crosses snr_cut or max_iter
+    iterations are done. The power is updated bin by bin, only for the
+    systems that crossed.
+
+    Inputs: sparse foreground spectrum of all systems (see
+    foreground.py), systems above or near snr_cut (see resolved_piece)
+    with the confusion noise fit popt, median window
+
+    Outputs: residual power of the occupied bins, final popt, dat with
+    the SNRs against it
+    '''
+    residual = power
+    subtracted = np.zeros(len(dat), dtype=bool)
+    # PSD ratio (see noise_ratio) each SNR was last computed with
+    computed = noise_ratio(dat.f_gw.values, popt, cache_dir)
+    for iteration in range(max_iter):
+        crossed = (dat.snr.values > snr_cut) != subtracted
+        if verbose:
+            print('iteration {}: {} systems crossed the SNR cut'.format(iteration, crossed.sum()))
+        if not crossed.any():
+            break
+        sign = np.where(subtracted[crossed], 1.0, -1.0)
+        residual = foreground.update_power(occupied, residual, dat.digits.values[crossed], 
+                                           sign * dat.power.values[crossed], power)
+        subtracted = subtracted ^ crossed
+        
+        popt = foreground.conf_fit(occupied, residual, window)
+        current = noise_ratio(dat.f_gw.values, popt, cache_dir)
+        changed = np.abs(current / computed - 1) > rtol
+        if changed.any():
+            dat.loc[changed] = confusion_snr(dat.loc[changed].copy(), popt, cache_dir, fast)
+            computed[changed] = current[changed]
+    else:
+        print('confusion noise not converged after {} iterations'.format(max_iter))
+    return residual, popt, dat
+
+
+def get_resolvedDWDs(pathtoLband, pathtosave, var, window=1000, backend='hdf', nproc=1, chunk_rows=int(1e6), 
+                     iterative=False, rtol=1e-4, max_iter=20, fast=True):
+    '''
+    Finds the DWDs resolved by LISA and the foreground of the others.
+
+    The Lband files of all DWD types are streamed in pieces of at most
+    chunk_rows systems through nproc processes, twice: the first pass
+    sums the GW power of every piece in the 1/Tobs frequency bins,
+    which gives the foreground and its confusion noise fit (see
+    foreground.py); the second computes the SNR of every system against
+    LISA plus that confusion noise and keeps the ones above snr_cut.
+    Only one piece per process is in memory at a time.
+
+    With iterative=True the resolved systems are then taken out of the
+    foreground and the confusion noise refitted until the resolved set
+    no longer changes (see subtract_resolved). Only the systems that
+    can pass snr_cut at all are kept for this, so it costs about one
+    more fit per iteration rather than new passes over the Lband files.
+    The foreground without the resolved systems is saved in the
+    residual_power key. Both spectra are saved as their non-zero bins
+    (foreground.sparse_power) with the bin grid in the power_grid key.
+
+    With fast=True (the default) strains, SNRs and chirps are computed
+    in closed form for circular binaries (gwcirc.py); fast=False uses
+    legwork Sources.
+    '''
     kstar1_list = ['10', '11', '11', '12']
     kstar2_list = ['10', '10', '11', '10_12']
-    lisa_bins = np.arange(1e-9, 1e-1, 1/(4 * 3.155e7))
-    Tobs = 4 * u.yr
-    
-    # load the data
-    dat = pd.DataFrame()
-    for kstar1, kstar2 in zip(kstar1_list, kstar2_list):
-        for f in dutil.Lband_files(kstar1=kstar1, kstar2=kstar2, var=var):
-            try:
-                dat = dat.append(pd.read_hdf(pathtoLband + f, key='Lband'))
-            except:
-                continue            
-            
-    sources = source.Source(m_1=dat.mass_1.values * u.Msun, 
-                            m_2=dat.mass_2.values * u.Msun,  
-                            ecc=np.zeros(len(dat.mass_1)), 
-                            dist=dat.dist_sun.values * u.kpc, 
-                            f_orb=dat.f_gw.values/2 * u.Hz,
-                            
-                            interpolate_g=True, 
-                            interpolate_sc=True, 
-                            sc_params={"instrument": "LISA",
-                                       "t_obs": Tobs,
-                                       "L": 2.5e9,
-                                       "approximate_R": True,
-                                       "include_confusion_noise": False})
-    
-    strains = sources.get_h_0_n(harmonics=[2])
-    dat['h_0'] = strains
-    dat['power'] = strains**2
-    dat['digits'] = np.digitize(dat.f_gw, lisa_bins)
-            
-    power = dat.groupby('digits').power.sum()
-    power_foreground = np.zeros(len(lisa_bins))
-    power_foreground[np.array(power.index.astype(int))] = power
-    
-    power_dat = pd.DataFrame(np.vstack([lisa_bins, power_foreground]).T, 
-                             columns=['f_gw', 'strain_2'])
-    
-    power_dat_median = power_dat.rolling(window).median()
-    power_dat_median = power_dat_median[window:]
-    
-    power_dat_median_fit = power_dat_median.loc[(power_dat_median.strain_2 > 0) & (power_dat_median.f_gw <= 1.2e-3)]
-
-    popt, pcov = curve_fit(func, 
-                           xdata=np.log10(power_dat_median_fit.f_gw.values),
-                           ydata=np.log10(power_dat_median_fit.strain_2.values))
-
-    
-    psd_conf = psd.power_spectral_density(f=np.linspace(1e-4, 1e-1, 1000000) * u.Hz, 
-                                          instrument="custom", 
-                                          custom_function=cosmic_confusion, 
-                                          t_obs=4 * u.yr, 
-                                          L=None, 
-                                          approximate_R=True, 
-                                          include_confusion_noise=False)
-    
-    sources_conf = source.Source(m_1=dat.mass_1.values * u.Msun, 
-                                 m_2=dat.mass_2.values * u.Msun,  
-                                 ecc=np.zeros(len(dat.mass_1)), 
-                                 dist=dat.dist_sun.values * u.kpc, 
-                                 f_orb=dat.f_gw.values/2 * u.Hz,
-                                 stat_tol = 1/(Tobs.to(u.s).value),
-                                 interpolate_g=True, 
-                                 interpolate_sc=True, 
-                                 sc_params={"instrument": "custom",
-                                            "custom_function":cosmic_confusion,
-                                            "t_obs": Tobs,
-                                            "L": 2.5e9,
-                                            "approximate_R": True,
-                                            "include_confusion_noise": True})
-
-    
-    dat['snr'] = sources_conf.get_snr(t_obs=Tobs, verbose=False)
-    dat['chirp'] = utils.fn_dot(sources_conf.m_c, sources_conf.f_orb, sources_conf.ecc, n=2)
-
-    dat = dat.loc[dat.snr > 7]
-    dat['resolved_chirp'] = np.zeros(len(dat))
-    dat.loc[dat.chirp > 1/((Tobs.to(u.s))**2), 'resolved_chirp'] = 1.0
+    labels = [dutil.getfiles(kstar1, kstar2)[1] for kstar1, kstar2 in zip(kstar1_list, kstar2_list)]
+    pieces = lbandio.Lband_pieces(Lband_model_files(pathtoLband, labels, var, backend=backend), chunk_rows)
+    offsets = np.cumsum([0] + [stop - start for _, start, stop in pieces])
+    
+    def run(func, tasks):
+        if nproc > 1:
+            with MultiPool(processes=nproc) as pool:
+                for out in imap_bounded(pool, func, tasks, 2 * nproc):
+                    yield out
+        else:
+            for out in map(func, tasks):
+                yield out
+    
+    # foreground power in the occupied frequency bins
+    occupied, power = foreground.sum_power(tqdm.tqdm(run(foreground_piece, [(piece, fast) for piece in pieces]), 
+                                                     total=len(pieces)))
+    popt = foreground.conf_fit(occupied, power, window)
+
+    # PSD tables, built once here for all the processes
+    cache_dir = pathtosave + 'psd_cache/'
+    psdcache.table(psdcache.instrument_params(), None, cache_dir)
+    psdcache.table(psdcache.instrument_params(), popt, cache_dir)
+
+    # systems above the SNR cut
+    tasks = [(piece, offset, popt, iterative, cache_dir, fast) for piece, offset in zip(pieces, offsets)]
+    resolved, candidates = [], []
+    for dat, near in tqdm.tqdm(run(resolved_piece, tasks), total=len(tasks)):
+        resolved.append(dat)
+        candidates.append(near)
+    dat = pd.concat(resolved + candidates) if len(resolved) > 0 else pd.DataFrame()
+    
+    residual = power
+    if iterative and len(dat) > 0:
+        residual, popt, dat = subtract_resolved(occupied, power, dat.sort_index(), popt, window, 
+                                                rtol=rtol, max_iter=max_iter, verbose=True, cache_dir=cache_dir, 
+                                                fast=fast)
+    dat = dat.loc[dat.snr > snr_cut] if len(dat) > 0 else dat
     
     if var:
         fname = 'resolved_DWDs_FZ.hdf'
     else:
         fname = 'resolved_DWDs_F50.hdf'
     dat.to_hdf(pathtosave+fname, key='resolved')
-    power_dat.to_hdf(pathtosave+fname, key='total_power')
+    # only the occupied bins are saved, with the grid they are on
+    foreground.power_grid().to_hdf(pathtosave+fname, key='power_grid')
+    foreground.sparse_power(occupied, power).to_hdf(pathtosave+fname, key='total_power')
+    if iterative:
+        foreground.sparse_power(occupied, residual).to_hdf(pathtosave+fname, key='residual_power')
     
     pd.DataFrame(popt).to_hdf(pathtosave+fname, key='conf_fit')
     
     return
-    
@@ -0,0 +1,144 @@
+#===================================================================================
+# Cached PSD lookup tables. The LISA PSD, with or without a fitted confusion
+# noise (see foreground.py), is tabulated once on a log-spaced frequency grid
+# and then interpolated linearly in log f - log PSD, which is vectorised and
+# much cheaper than evaluating legwork's PSD for every call.
+#
+# A table is keyed by the instrument parameters passed to legwork, t_obs and
+# the confusion fit coefficients. When it is built, the direct PSD is also
+# evaluated half way between the grid points, where linear interpolation is
+# least accurate; the grid is refined until the relative error there is below
+# rtol, and that error is stored with the table. Tables are kept in memory
+# and, with a cache_dir, saved there as .npz files so other processes and
+# later runs load them instead of building them again. Frequencies outside
+# the table are evaluated directly. tests/test_psdcache.py checks the tables
+# against legwork and the disk cache.
+#===================================================================================
+
+import os
+import json
+import hashlib
+import numpy as np
+import astropy.units as u
+
+import foreground
+
+
+f_lo = 1e-7  # Hz
+f_hi = 1  # Hz
+rtol = 1e-6
+max_per_decade = 64000
+
+_tables = {}
+
+
+def instrument_params(t_obs=4 * u.yr, instrument='LISA', L='auto', approximate_R=False, 
+                      include_confusion_noise=False):
+    '''
+    legwork parameters of the instrument PSD. The defaults are those
+    of psd.power_spectral_density, except that legwork's own Galactic
+    confusion noise is left out unless include_confusion_noise.
+    '''
+    return {'instrument': instrument, 't_obs': t_obs.to(u.yr).value,
+            'L': L if isinstance(L, str) else u.Quantity(L, u.m).value,
+            'approximate_R': approximate_R, 'include_confusion_noise': include_confusion_noise}
+
+
+def key(params, popt=None):
+    '''
+    Hash of the instrument parameters and confusion fit coefficients
+    that names a table.
+    '''
+    spec = dict(params, popt=None if popt is None else [float(p) for p in popt])
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def direct_psd(f, params, popt=None):
+    '''
+    PSD in Hz^-1 at the frequencies f (in Hz) from legwork, plus the
+    confusion noise of popt over t_obs.
+    '''
+    # legwork is only needed to build tables, so it is not imported with
+    # this module
+    from legwork import psd
+    L = params['L'] if isinstance(params['L'], str) else params['L'] * u.m
+    # legwork's include_confusion_noise=True is the Robson et al. (2019) fit,
+    # which legwork >= 0.4 asks for as confusion_noise='robson19'
+    confusion_noise = 'robson19' if params['include_confusion_noise'] else None
+    S = psd.power_spectral_density(np.asarray(f) * u.Hz, instrument=params['instrument'],
+                                   t_obs=params['t_obs'] * u.yr, L=L,
+                                   approximate_R=params['approximate_R'],
+                                   confusion_noise=confusion_noise).to(u.Hz**(-1)).value
+    if popt is not None:
+        S = S + 10**foreground.conf_func(np.log10(f), *popt) * (params['t_obs'] * u.yr).to(u.s).value
+    return S
+
+
+def build_table(params, popt=None):
+    '''
+    Tabulates log10 of direct_psd on a log-spaced grid, doubling the
+    number of points per decade until the interpolation error half way
+    between them is below rtol.
+
+    Outputs: log10 f, log10 PSD, maximum relative error
+    '''
+    n_per_decade = 1000
+    while True:
+        x = np.linspace(np.log10(f_lo), np.log10(f_hi), int(np.log10(f_hi/f_lo) * n_per_decade) + 1)
+        y = np.log10(direct_psd(10**x, params, popt))
+        mid = (x[1:] + x[:-1]) / 2
+        exact = direct_psd(10**mid, params, popt)
+        err = np.max(np.abs(10**((y[1:] + y[:-1]) / 2) / exact - 1))
+        if err < rtol or n_per_decade >= max_per_decade:
+            break
+        n_per_decade *= 2
+    if err >= rtol:
+        print('PSD table error {:.1e} above rtol = {:.0e}'.format(err, rtol))
+    return x, y, err
+
+
+def table(params, popt=None, cache_dir=None):
+    '''
+    Returns the table of params and popt (see build_table) from memory,
+    from cache_dir, or by building it (and saving it in cache_dir).
+    '''
+    name = key(params, popt)
+    if name in _tables:
+        return _tables[name]
+    cache = None if cache_dir is None else os.path.join(cache_dir, 'psd_{}.npz'.format(name))
+    if cache is not None and os.path.exists(cache):
+        with np.load(cache) as npz:
+            _tables[name] = (npz['log_f'], npz['log_psd'], float(npz['max_err']))
+        return _tables[name]
+    x, y, err = build_table(params, popt)
+    if cache is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache + '.{}.tmp.npz'.format(os.getpid())
+        np.savez(tmp, log_f=x, log_psd=y, max_err=err,
+                 params=json.dumps(dict(params, popt=None if popt is None else list(map(float, popt)))))
+        os.replace(tmp, cache)
+    _tables[name] = (x, y, err)
+    return _tables[name]
+
+
+def lisa_psd(f, popt=None, params=None, cache_dir=None):
+    '''
+    PSD in Hz^-1 of the instrument of params (default: LISA over 4 yr,
+    see instrument_params) plus the confusion noise of popt at the
+    frequencies f, as floats in Hz or a Quantity, interpolated from
+    the cached table.
+    '''
+    if params is None:
+        params = instrument_params()
+    f = np.asarray(u.Quantity(f, u.Hz).value, dtype=float)
+    x, y, _ = table(params, popt, cache_dir)
+    log_f = np.atleast_1d(np.log10(f))
+    # the grid is evenly spaced in log f, so no search is needed
+    t = (log_f - x[0]) / (x[1] - x[0])
+    i = np.clip(np.floor(t).astype(np.int64), 0, len(x) - 2)
+    t = t - i
+    S = 10**(y[i] * (1 - t) + y[i+1] * t)
+    outside = (log_f < x[0]) | (log_f > x[-1])
+    if np.any(outside):
+        S[outside] = direct_psd(10**log_f[outside], params, popt)
+    return S.reshape(f.shape)
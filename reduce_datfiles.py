@@ -1,52 +1,159 @@
+#=========================================================================
+# Reduces the COSMIC dat files to what the post-processing needs:
+#
+#   new_<dat file>     : bpp with the first row (initial state), first
+#                        RLOF (evol_type 3) and first CE (evol_type 7)
+#                        of every binary, as bpp.groupby('bin_num').first()
+#   reduced_<dat file> : conv and mass_stars
+#
+# The files are reduced in parallel on nproc processes. Memory does not
+# depend on the size of the dat files: bpp is only ever read in slices of
+# at most chunksize rows with start/stop (see slices), which works for
+# tables and for COSMIC's default fixed format alike.
+#
+# new_ bpp is built in one pass over these slices. Each slice is split
+# into three groups, all its rows, its evol_type 3 rows and its
+# evol_type 7 rows, and every group is reduced with
+# groupby('bin_num').first(), as the original script did (np.unique with
+# return_index would take whole first rows, while first() takes the first
+# non-null value of each column). The candidates of all slices are then
+# reduced the same way again (first_of_chunks), which gives the same rows
+# as grouping the whole of bpp, since the slices are in file order. The
+# evol_type rows are picked by a mask on each slice, not by an HDF5 where
+# query, because fixed-format files cannot be queried.
+#
+# For the labels of conv_cuts, conv is rebuilt in a second pass over bpp:
+# an HDF5 query if bpp is a table with kstar_1 and kstar_2 as data
+# columns, otherwise the same slices cut with a mask, again reduced to
+# the first row of every binary.
+#
+# Usage: python reduce_datfiles.py --dat_path old/ --dat_path_new new/ --nproc 8
+#=========================================================================
+
 from utils import getfiles
+import sidecar
 import tqdm
 import argparse
 import pandas as pd
+from schwimmbad import MultiPool
+
+
+# rows kept besides the first row of every binary: first RLOF and CE
+keep_evol = [3, 7]
+
+# labels whose conv table is rebuilt from the first bpp row of the
+# final DWD type: query, queried columns and in-memory mask
+conv_cuts = {'11_11': ('kstar_1 == 11 & kstar_2 == 11', ['kstar_1', 'kstar_2'],
+                       lambda bpp: (bpp.kstar_1 == 11) & (bpp.kstar_2 == 11)),
+             '12': ('kstar_1 == 12 & kstar_2 in [10, 11, 12]', ['kstar_1', 'kstar_2'],
+                    lambda bpp: (bpp.kstar_1 == 12) & (bpp.kstar_2.isin([10, 11, 12])))}
+
+
+def slices(store, key, chunksize):
+    '''
+    Yields store[key] in slices of at most chunksize rows, for table
+    and fixed-format keys.
+    '''
+    storer = store.get_storer(key)
+    n_rows = int(storer.nrows if storer.is_table else storer.shape[0])
+    for start in range(0, n_rows, chunksize):
+        yield store.select(key, start=start, stop=min(start + chunksize, n_rows))
+
+
+def select_chunks(store, key, where, where_columns, mask, chunksize):
+    '''
+    Yields the rows of store[key] selected by the HDF5 query where in
+    chunks of at most chunksize rows. If key is not a table with
+    where_columns as data columns, it is read in slices (see slices)
+    cut with the function mask instead.
+    '''
+    storer = store.get_storer(key)
+    if storer.is_table and set(where_columns) <= set(storer.data_columns):
+        for chunk in store.select(key, where=where, chunksize=chunksize):
+            yield chunk
+        return
+    for chunk in slices(store, key, chunksize):
+        yield chunk.loc[mask(chunk)]
+
+
+def first_of_chunks(chunks, groups):
+    '''
+    groupby('bin_num').first() of each group of rows over a sequence
+    of chunks, keeping only the candidates of every chunk in memory.
+
+    Inputs: chunks of bpp rows in file order, dict of functions that
+    select the rows of each group from a chunk
+
+    Outputs: dict of dataframes indexed by bin_num
+    '''
+    candidates = {name: [] for name in groups}
+    for chunk in chunks:
+        for name, select in groups.items():
+            candidates[name].append(chunk.loc[select(chunk)].groupby('bin_num').first())
+    return {name: pd.concat(candidates[name]).groupby(level=0).first() if candidates[name] else pd.DataFrame()
+            for name in groups}
+
+
+def reduce_data(pathold, pathnew, filename, label, chunksize=int(1e6)):
+    with pd.HDFStore(pathold+filename, mode='r') as store:
+        # first row, first RLOF and first CE of every binary
+        groups = {'init': lambda bpp: slice(None)}
+        groups.update({evol: (lambda bpp, evol=evol: bpp.evol_type == evol) for evol in keep_evol})
+        parts = first_of_chunks(slices(store, 'bpp', chunksize), groups)
+        newbpp = pd.concat([parts['init']] + [parts[evol] for evol in keep_evol])
+        newbpp = newbpp.sort_values(by=['bin_num', 'tphys'])
+
+        if label in conv_cuts:
+            where, where_columns, mask = conv_cuts[label]
+            conv = first_of_chunks(select_chunks(store, 'bpp', where, where_columns, mask, chunksize), 
+                                   {'conv': lambda bpp: slice(None)})['conv']
+        else:
+            conv = store['conv']
+
+        if '/mass_stars' in store.keys():
+            mass_binaries = store['mass_stars']
+        else:
+            print('{}: no mass_stars key, using mass_binaries'.format(filename))
+            mass_binaries = store['mass_binaries']
 
-def reduce_data(pathold, pathnew, filename, label):
-    bpp = pd.read_hdf(pathold+filename, key='bpp')
-    
-    init = bpp.groupby('bin_num').first()
-    RLOFsep = bpp.loc[bpp.evol_type==3].groupby('bin_num').first()
-    CEsep = bpp.loc[bpp.evol_type==7].groupby('bin_num').first()
-    
-    newbpp = init.append(RLOFsep)
-    newbpp = newbpp.append(CEsep)
-    newbpp = newbpp.sort_values(by=['bin_num', 'tphys'])
     newbpp.to_hdf(pathnew + 'new_' + filename, key='bpp')
-    
-    
-    if label == '11_11':
-        conv = bpp.loc[(bpp.kstar_1==11)&(bpp.kstar_2==11)].groupby('bin_num').first()  
-    elif label == '12':
-        conv = bpp.loc[(bpp.kstar_1==12)&(bpp.kstar_2.isin([10,11,12]))].groupby('bin_num').first() 
-    else:
-        conv = pd.read_hdf(pathold+filename, key='conv')
     conv.to_hdf(pathnew + 'reduced_' + filename, key='conv')
-    conv = []
-    bpp = []
-    
-    try:
-        mass_binaries = pd.read_hdf(pathold+filename, key='mass_stars')
-    except:
-        print('m_binaries key')
-        mass_binaries = pd.read_hdf(pathold+filename, key='mass_binaries')
-        
     mass_binaries.to_hdf(pathnew + 'reduced_' + filename, key='mass_stars')
-    
+
+    # row counts and binary mass for get_formeff
+    sidecar.dat_meta(pathnew + 'new_' + filename)
+    sidecar.dat_meta(pathnew + 'reduced_' + filename)
+
     return 'reduced_' + filename
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--dat_path", default="./", type=str)
-parser.add_argument("--dat_path_new", default="./", type=str)
 
-args = parser.parse_args()
+def reduce_task(task):
+    pathold, pathnew, filename, label, chunksize = task
+    return reduce_data(pathold, pathnew, filename, label, chunksize=chunksize)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dat_path", default="./", type=str)
+    parser.add_argument("--dat_path_new", default="./", type=str)
+    parser.add_argument("--nproc", default=1, type=int, help='number of dat files reduced at the same time')
+    parser.add_argument("--chunksize", default=int(1e6), type=int, help='maximum number of bpp rows read at once')
 
-kstar1_list = ['10', '11', '11', '12']
-kstar2_list = ['10', '10', '11', '10_12']
+    args = parser.parse_args()
 
-for kstar1, kstar2 in tqdm.tqdm(zip(kstar1_list, kstar2_list)):
-    fnames, label = getfiles(kstar1=kstar1, kstar2=kstar2)
-    for f in tqdm.tqdm(fnames):
-        newf = reduce_data(pathold=args.dat_path, pathnew=args.dat_path_new, filename=f, label=label)
+    kstar1_list = ['10', '11', '11', '12']
+    kstar2_list = ['10', '10', '11', '10_12']
 
+    tasks = []
+    for kstar1, kstar2 in zip(kstar1_list, kstar2_list):
+        fnames, label = getfiles(kstar1=kstar1, kstar2=kstar2)
+        for f in fnames:
+            tasks.append((args.dat_path, args.dat_path_new, f, label, args.chunksize))
+
+    if args.nproc > 1:
+        with MultiPool(processes=args.nproc) as pool:
+            for newf in tqdm.tqdm(pool.imap_unordered(reduce_task, tasks), total=len(tasks)):
+                pass
+    else:
+        for newf in tqdm.tqdm(map(reduce_task, tasks), total=len(tasks)):
+            pass
@@ -0,0 +1,180 @@
+#===================================================================================
+# Metadata sidecars. Every Lband task file and COSMIC dat file can have a small
+# JSON file, <file>.meta.json, holding what the summary stages need without
+# reading the data again. It is kept next to the file, or under cache_dir
+# (by file name) for inputs that must not be written to, such as the dat
+# files read by postproc.get_formeff:
+#
+#   Lband : row count, number of systems (sum of weight), mass_total, the
+#           spawn_keys manifest, min/max of every column and weighted
+#           histograms of met and f_gw on the fixed grids below
+#   dat   : row count of every table, the COSMIC binary mass and the
+#           min/max of every conv column
+#
+# A sidecar records the size and modification time of its data file. If the
+# file has changed since (e.g. a resumed run truncated it), read_meta treats
+# the sidecar as stale and returns None; callers then scan the file and write
+# a fresh sidecar.
+#===================================================================================
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+version = 1
+
+# Fixed histogram grids. met_bins are the bin edges of get_numLISA
+# (30 log-spaced FIRE metallicities, in units of Z_sun = 0.02);
+# fgw_bins cover 1e-5 to 1 Hz in 100 log-spaced bins.
+Z_sun = 0.02
+met_bins = np.logspace(np.log10(0.00015), np.log10(13.346), 30) * Z_sun
+fgw_bins = np.logspace(-5, 0, 101)
+
+
+def meta_path(filename, cache_dir=None):
+    if cache_dir is None:
+        return filename + '.meta.json'
+    return os.path.join(cache_dir, os.path.basename(filename) + '.meta.json')
+
+
+def file_state(filename):
+    '''
+    Size and modification time of filename, used to tell whether
+    a sidecar still describes it.
+    '''
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def read_meta(filename, cache_dir=None):
+    '''
+    Returns the sidecar of filename (kept in cache_dir if given) as a
+    dict, or None if there is none, it cannot be read, or filename
+    changed after it was written.
+    '''
+    try:
+        with open(meta_path(filename, cache_dir)) as f:
+            meta = json.load(f)
+        if meta.get('version') != version or meta.get('source') != file_state(filename):
+            return None
+    except (OSError, ValueError):
+        return None
+    return meta
+
+
+def write_meta(filename, meta, cache_dir=None):
+    '''
+    Writes the sidecar of filename (to cache_dir if given), stamped
+    with the current size and modification time of filename. The
+    sidecar is written under a temporary name and renamed so readers
+    never see a partial one.
+    '''
+    meta = dict(meta, version=version, source=file_state(filename))
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    tmp = meta_path(filename, cache_dir) + '.{}.tmp'.format(os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path(filename, cache_dir))
+    return meta
+
+
+def remove_meta(filename, cache_dir=None):
+    if os.path.exists(meta_path(filename, cache_dir)):
+        os.remove(meta_path(filename, cache_dir))
+
+
+def _minmax(df, meta):
+    for col in df.columns:
+        values = df[col].values
+        if len(values) == 0 or not np.issubdtype(values.dtype, np.number):
+            continue
+        lo, hi = np.nanmin(values).item(), np.nanmax(values).item()
+        meta['min'][col] = lo if col not in meta['min'] else min(lo, meta['min'][col])
+        meta['max'][col] = hi if col not in meta['max'] else max(hi, meta['max'][col])
+
+
+#===================================================================================
+# Lband sidecars
+#===================================================================================
+
+def empty_Lband_meta():
+    return {'kind': 'Lband', 'n_rows': 0, 'n_systems': 0, 'min': {}, 'max': {},
+            'met_hist': {'edges': met_bins.tolist(), 'counts': [0] * (len(met_bins) - 1)},
+            'fgw_hist': {'edges': fgw_bins.tolist(), 'counts': [0] * (len(fgw_bins) - 1)}}
+
+
+def add_Lband_rows(meta, Lband):
+    '''
+    Adds the row count, min/max and histograms of the Lband rows
+    of one chunk to meta. met and f_gw are histogrammed in float64
+    whatever their dtype, as the readers see them after
+    lbandio.expand: met * Z_sun in float32 would round values on
+    the met_bins edges into the neighbouring bin.
+    '''
+    if len(Lband) == 0:
+        return meta
+    weight = Lband['weight'].values if 'weight' in Lband.columns else np.ones(len(Lband), dtype='int64')
+    meta['n_rows'] += len(Lband)
+    meta['n_systems'] += int(weight.sum())
+    _minmax(Lband, meta)
+    for hist, values in [('met_hist', Lband['met'].values.astype('float64') * Z_sun), 
+                         ('fgw_hist', Lband['f_gw'].values.astype('float64'))]:
+        counts, _ = np.histogram(values, bins=np.array(meta[hist]['edges']), weights=weight)
+        meta[hist]['counts'] = (np.array(meta[hist]['counts']) + counts.astype('int64')).tolist()
+    return meta
+
+
+def set_Lband_manifest(meta, filename):
+    '''
+    Copies mass_total and the spawn_keys manifest of the Lband file
+    filename into meta.
+    '''
+    with pd.HDFStore(filename, mode='r') as store:
+        if '/mass_total' in store.keys():
+            meta['mass_total'] = float(np.asarray(store['mass_total']).ravel()[-1])
+        if '/spawn_keys' in store.keys():
+            meta['spawn_keys'] = {col: values.tolist() for col, values in store.select('spawn_keys').items()}
+    return meta
+
+
+def met_counts(meta, bins):
+    '''
+    Weighted numbers of systems per metallicity bin (of met * Z_sun)
+    from an Lband sidecar, or None if its grid is not bins.
+    '''
+    edges = np.array(meta['met_hist']['edges'])
+    if len(edges) != len(bins) or not np.array_equal(edges, bins):
+        return None
+    return np.array(meta['met_hist']['counts'], dtype=float)
+
+
+#===================================================================================
+# COSMIC dat sidecars
+#===================================================================================
+
+def dat_meta(filename, cache_dir=None):
+    '''
+    Returns the sidecar of a COSMIC dat file, scanning the file and
+    writing a new sidecar (to cache_dir if given) if there is no
+    up-to-date one.
+
+    The binary mass is the last entry of mass_stars, or of
+    mass_binaries in older files.
+    '''
+    meta = read_meta(filename, cache_dir)
+    if meta is not None:
+        return meta
+    meta = {'kind': 'dat', 'n_rows': {}, 'min': {}, 'max': {}}
+    with pd.HDFStore(filename, mode='r') as store:
+        for key in store.keys():
+            storer = store.get_storer(key)
+            meta['n_rows'][key.lstrip('/')] = int(storer.nrows if storer.is_table else storer.shape[0])
+        if '/conv' in store.keys():
+            _minmax(store['conv'], meta)
+        for key in ['/mass_binaries', '/mass_stars']:
+            if key in store.keys():
+                meta['mass_binaries'] = float(np.asarray(store[key]).ravel()[-1])
+    return write_meta(filename, meta, cache_dir)
@@ -0,0 +1,62 @@
+#===================================================================================
+# Galactocentric to ecliptic sky positions without SkyCoord. Positions only
+# go from astropy's Galactocentric frame to ICRS by a rotation and the offset
+# of the Sun (the solar system barycentre) from the Galactic centre, and from
+# ICRS to BarycentricTrueEcliptic (equinox J2000) by a fixed rotation, so the
+# whole transform is x_ecl = R x_gal + offset. R and offset are taken once per
+# process from astropy itself, by transforming the Galactic centre and the
+# unit vectors, and then applied to every source in one matrix product.
+# This gives astropy's latitudes and longitudes to far better than a
+# micro-arcsecond for everything beyond a few pc of the Sun, where both are
+# only limited by round-off of the positions, which tests/test_skyframe.py
+# asserts and benchmarks.py skyframe reports with the timings.
+#===================================================================================
+
+import numpy as np
+import astropy.units as u
+
+scale = 1e6  # kpc
+_affine = None
+
+
+def galactocentric_to_ecliptic():
+    '''
+    Rotation matrix and offset (in kpc) from Cartesian positions in
+    astropy's default Galactocentric frame to barycentric true ecliptic
+    ones, computed once per process.
+    '''
+    global _affine
+    if _affine is None:
+        from astropy.coordinates import SkyCoord
+        # long unit vectors, so that subtracting the offset loses no digits
+        points = np.vstack([np.zeros(3), scale * np.eye(3)])
+        gal = SkyCoord(x=points[:, 0], y=points[:, 1], z=points[:, 2], unit='kpc',
+                       frame='galactocentric')
+        ecl = gal.transform_to('barycentrictrueecliptic').cartesian.xyz.to(u.kpc).value.T
+        offset = ecl[0]
+        _affine = ((ecl[1:] - offset).T / scale, offset)
+    return _affine
+
+
+def ecliptic_colat_lon(X, Y, Z):
+    '''
+    Ecliptic co-latitude and longitude in radians, longitude in
+    [0, 2 pi) as astropy gives it, of Galactocentric positions X, Y, Z
+    in kpc.
+    '''
+    R, offset = galactocentric_to_ecliptic()
+    xyz = R @ np.vstack([X, Y, Z]).astype(float) + offset[:, np.newaxis]
+    colat = np.arctan2(np.hypot(xyz[0], xyz[1]), xyz[2])
+    lon = np.mod(np.arctan2(xyz[1], xyz[0]), 2 * np.pi)
+    return colat, lon
+
+
+def astropy_colat_lon(X, Y, Z):
+    '''
+    ecliptic_colat_lon through SkyCoord.transform_to.
+    '''
+    from astropy.coordinates import SkyCoord
+    coords = SkyCoord(np.asarray(X), np.asarray(Y), np.asarray(Z), unit='kpc',
+                      frame='galactocentric')
+    coords = coords.transform_to(frame='barycentrictrueecliptic')
+    return np.pi / 2 - coords.lat.rad, coords.lon.rad
@@ -0,0 +1,60 @@
+#===================================================================================
+# lbandio's compact schema: compact -> expand, directly and through an Lband
+# file, restores the float64/int64 dtypes, keeps integers and the
+# full-precision columns exact and the float32 columns to 2**-24.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import lbandio
+
+
+def random_Lband(n=5000):
+    rng = np.random.default_rng(20)
+    Lband = pd.DataFrame({col: rng.uniform(-50, 50, n) for col in lbandio.compact_dtypes
+                          if np.issubdtype(np.dtype(lbandio.compact_dtypes[col]), np.floating)})
+    Lband['kstar_1'] = rng.choice([10.0, 11.0, 12.0], n)
+    Lband['kstar_2'] = rng.choice([10.0, 11.0, 12.0], n)
+    for col in ['bin_num', 'FIRE_index', 'weight', 'bin_num_pw', 'bin_num_Lw']:
+        Lband[col] = rng.integers(0, 2**31 - 1, n)
+    # columns that stay in full precision
+    Lband['mass_1'] = rng.uniform(0.2, 1.4, n)
+    Lband['f_gw'] = 10 ** rng.uniform(-5, -1, n)
+    return Lband
+
+
+def check_round_trip(Lband, out):
+    assert list(out.columns) == list(Lband.columns)
+    for col in Lband.columns:
+        assert out[col].dtype == Lband[col].dtype, col
+        if lbandio.compact_dtypes.get(col, 'int').startswith('float'):
+            np.testing.assert_allclose(out[col].values, Lband[col].values, rtol=2.0**-24, atol=0)
+        else:
+            assert np.array_equal(out[col].values, Lband[col].values), col
+
+
+def test_compact_expand():
+    Lband = random_Lband()
+    compact = lbandio.compact(Lband)
+    for col, dtype in lbandio.compact_dtypes.items():
+        assert compact[col].dtype == np.dtype(dtype)
+    assert compact.mass_1.dtype == np.float64 and compact.f_gw.dtype == np.float64
+    check_round_trip(Lband, lbandio.expand(compact))
+    # full-precision rows are left alone
+    pd.testing.assert_frame_equal(lbandio.expand(Lband.copy()), Lband)
+
+
+def test_file_round_trip(tmp_path):
+    Lband = random_Lband()
+    filename = str(tmp_path / 'Lband.hdf')
+    lbandio.write_Lband(Lband, filename, compact_schema=True)
+    check_round_trip(Lband, lbandio.read_Lband(filename))
+
+
+def test_out_of_range():
+    Lband = random_Lband(10)
+    Lband.loc[3, 'bin_num'] = 2**31
+    with pytest.raises(ValueError):
+        lbandio.compact(Lband)
@@ -0,0 +1,94 @@
+#===================================================================================
+# events.py: event tables against a groupby of the bpp table, for fixed and
+# table format dat files, their npz cache, and gather, including the NaN of
+# binaries without an event or missing from the table.
+#===================================================================================
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import events
+
+
+def make_bpp(n=3000):
+    '''
+    bpp rows of n binaries in shuffled bin_num order, with several or
+    no RLOF and CE rows per binary.
+    '''
+    rng = np.random.default_rng(21)
+    bin_num = rng.permutation(np.arange(0, 5 * n, 5))
+    rows = []
+    for b in bin_num:
+        n_rows = rng.integers(1, 8)
+        rows.append(pd.DataFrame({'bin_num': b, 'evol_type': rng.choice([1, 2, 3, 7, 10], n_rows),
+                                  'sep': rng.uniform(0.01, 100, n_rows), 'tphys': rng.uniform(0, 13000, n_rows),
+                                  'mass_1': rng.uniform(0.1, 2, n_rows)}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def reference(bpp):
+    '''
+    sep and tphys of the first RLOF and CE row of every binary, in
+    file order, as the original groupby found them.
+    '''
+    out = pd.DataFrame(index=np.unique(bpp.bin_num))
+    for name, evol in [('RLOF', events.RLOF), ('CE', events.CE)]:
+        first = bpp.loc[bpp.evol_type == evol].groupby('bin_num').first()
+        out[name + 'sep'] = first.sep
+        out[name + 'time'] = first.tphys
+    return out
+
+
+@pytest.mark.parametrize('fmt', ['fixed', 'table'])
+def test_event_table(tmp_path, fmt):
+    bpp = make_bpp()
+    filename = str(tmp_path / 'dat.h5')
+    if fmt == 'table':
+        bpp.to_hdf(filename, key='bpp', format='t', data_columns=['evol_type'])
+    else:
+        bpp.to_hdf(filename, key='bpp')
+    table = events.event_table(filename)
+    ref = reference(bpp)
+    # binaries without any RLOF or CE row are not in the table
+    with_events = ref.dropna(how='all')
+    assert np.array_equal(table['bin_num'], with_events.index.values)
+    for col in events.columns:
+        assert np.array_equal(table[col], with_events[col].values, equal_nan=True), col
+
+
+def test_cache(tmp_path, monkeypatch):
+    bpp = make_bpp(500)
+    filename = str(tmp_path / 'dat.h5')
+    bpp.to_hdf(filename, key='bpp')
+    cache_dir = str(tmp_path / 'event_cache')
+    table = events.event_table(filename, cache_dir=cache_dir)
+    assert os.listdir(cache_dir) == ['dat.h5.events.npz']
+    # an up-to-date cache is used without reading bpp
+    read_bpp = events.read_bpp
+    monkeypatch.setattr(events, 'read_bpp', None)
+    cached = events.event_table(filename, cache_dir=cache_dir)
+    assert all(np.array_equal(cached[col], table[col], equal_nan=True) for col in ['bin_num'] + events.columns)
+    # a rewritten dat file is read again
+    monkeypatch.setattr(events, 'read_bpp', read_bpp)
+    bpp.iloc[:250].to_hdf(filename, key='bpp', mode='w')
+    rebuilt = events.event_table(filename, cache_dir=cache_dir)
+    assert len(rebuilt['bin_num']) < len(table['bin_num'])
+    assert np.array_equal(rebuilt['bin_num'], events.event_table(filename)['bin_num'])
+
+
+def test_gather():
+    bpp = make_bpp(500)
+    table = events.build_table(bpp.loc[bpp.evol_type.isin([events.RLOF, events.CE])])
+    ref = reference(bpp)
+    rng = np.random.default_rng(22)
+    # repeats, binaries without events, and bin_nums below, between and
+    # above the ones in the table
+    bin_num = np.concatenate([rng.choice(ref.index.values, 2000), [-1, 2, 7, 10**9]])
+    out = events.gather(table, bin_num)
+    missing = ~np.isin(bin_num, ref.index.values)
+    for col in events.columns:
+        assert np.all(np.isnan(out[col][missing]))
+        assert np.array_equal(out[col][~missing], ref.loc[bin_num[~missing], col].values, equal_nan=True), col
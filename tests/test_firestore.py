@@ -0,0 +1,54 @@
+#===================================================================================
+# firestore.FIREStore: metallicity bins of the sorted catalogue, returned as
+# views of the memory-mapped column cache, which is kept under the output
+# path rather than next to FIRE.h5.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+
+import firestore
+import postproc as pp
+
+
+def make_store(path, out, n=5000):
+    rng = np.random.default_rng(6)
+    FIRE = pd.DataFrame({'met': 10 ** rng.uniform(-3, 0.2, n), 'age': rng.uniform(0, 13.7, n),
+                         'kern_len': rng.uniform(0, 1e-3, n), 'xGx': rng.normal(0, 5, n),
+                         'yGx': rng.normal(0, 5, n), 'zGx': rng.normal(0, 1, n)})
+    FIRE.to_hdf(path / 'FIRE.h5', key='data')
+    return FIRE, firestore.FIREStore(str(path), str(out / 'FIRE_cache'))
+
+
+def test_bins_match_catalogue(tmp_path):
+    FIRE, store = make_store(tmp_path, tmp_path)
+    n = 0
+    for i in range(15):
+        FIRE_bin = store.get_bin(i, pp.met_arr, pp.Z_sun)
+        n += len(FIRE_bin)
+        expected = FIRE.loc[FIRE_bin.index]
+        assert np.array_equal(FIRE_bin.FIRE_index.values, FIRE_bin.index.values)
+        for col in ['met', 'age', 'kern_len', 'xGx', 'yGx', 'zGx']:
+            assert np.array_equal(FIRE_bin[col].values, expected[col].values)
+        if i < 14:
+            assert np.all(FIRE_bin.met * pp.Z_sun <= pp.met_arr[i+1])
+        assert np.all(FIRE_bin.met * pp.Z_sun >= pp.met_arr[i])
+    assert n == len(FIRE)
+
+
+def test_bins_are_views(tmp_path):
+    FIRE, store = make_store(tmp_path, tmp_path)
+    FIRE_bin = store.get_bin(8, pp.met_arr, pp.Z_sun)
+    assert len(FIRE_bin) > 0
+    for col in firestore.columns:
+        assert np.shares_memory(FIRE_bin[col].values, store.arrays[col])
+        assert not FIRE_bin[col].values.flags.writeable
+
+
+def test_cache_is_under_output_path(tmp_path):
+    (tmp_path / 'fire').mkdir()
+    FIRE, store = make_store(tmp_path / 'fire', tmp_path / 'out')
+    assert len(store) == len(FIRE)
+    assert [p.name for p in (tmp_path / 'fire').iterdir()] == ['FIRE.h5']
+    assert sorted(p.name for p in (tmp_path / 'out' / 'FIRE_cache').iterdir()) == \
+        sorted(col + '.npy' for col in firestore.columns)
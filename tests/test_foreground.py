@@ -0,0 +1,94 @@
+#===================================================================================
+# foreground.py against the dense spectrum it replaces: running_median
+# against DataFrame.rolling(window).median(), including runs next to empty
+# bins, and conf_fit against the rolling median and curve_fit of the
+# original get_resolvedDWDs on a shortened bin grid.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import curve_fit
+
+import foreground
+
+
+def dense_median(occupied, power, n_bins, window):
+    dense = np.zeros(n_bins)
+    dense[occupied] = power
+    median = pd.Series(dense).rolling(window).median().values
+    median[:window - 1] = 0
+    return median
+
+
+def runs_to_dense(start, stop, median, n_bins):
+    out = np.zeros(n_bins)
+    for a, b, value in zip(start, stop, median):
+        out[a:b] = value
+    return out
+
+
+@pytest.mark.parametrize('window', [7, 8, 51])
+def test_running_median_matches_rolling(window):
+    rng = np.random.default_rng(8)
+    n_bins = 3000
+    # mostly occupied, with empty stretches longer and shorter than the
+    # window and a sparse stretch where the median drops to zero
+    occupied = np.flatnonzero(rng.uniform(0, 1, n_bins) < 0.7)
+    occupied = occupied[((occupied < 1000) | (occupied >= 1000 + 2 * window)) &
+                        ((occupied < 1500) | (occupied >= 1500 + window // 2))]
+    occupied = occupied[(occupied < 2000) | (occupied >= 2500) | (rng.uniform(0, 1, len(occupied)) < 0.2)]
+    power = 10 ** rng.normal(-44, 1, len(occupied))
+    power[rng.uniform(0, 1, len(power)) < 0.05] = 0
+    start, stop, median = foreground.running_median(occupied, power, n_bins, window)
+    assert np.all(median > 0)
+    assert np.all(stop[:-1] <= start[1:])
+    out = runs_to_dense(start, stop, median, n_bins)
+    ref = dense_median(occupied, power, n_bins, window)
+    assert np.array_equal(out, ref)
+    # the empty stretches give a zero median
+    assert np.all(out[1000 + window:1000 + 2 * window] == 0)
+
+
+def test_conf_fit_matches_dense(monkeypatch):
+    monkeypatch.setattr(foreground, '_lisa_bins', np.arange(foreground.f_min, 2e-3, foreground.df))
+    bins = foreground.lisa_bins()
+    window = 101
+    rng = np.random.default_rng(9)
+    f_gw = 10 ** rng.uniform(-4, np.log10(1.5e-3), 300000)
+    f_gw = f_gw[(f_gw < 4e-4) | (f_gw > 4.2e-4)]
+    power = 10 ** (-44 - 2 * (np.log10(f_gw) + 3) + rng.normal(0, 0.3, len(f_gw)))
+    occupied, summed = foreground.bin_power(f_gw, power)
+
+    # the original: groupby sum into the dense spectrum, which bincount
+    # reproduces up to round-off
+    dat = pd.DataFrame({'power': power, 'digits': np.digitize(f_gw, bins)})
+    total = dat.groupby('digits').power.sum()
+    power_foreground = np.zeros(len(bins))
+    power_foreground[np.array(total.index.astype(int))] = total
+    dense = foreground.total_power(occupied, summed)
+    np.testing.assert_allclose(dense.strain_2.values, power_foreground, rtol=1e-12, atol=0)
+    assert np.array_equal(dense.f_gw.values, bins)
+
+    # then its rolling median and a fit of the non-zero medians up to
+    # f_fit_max, on the same dense spectrum
+    power_dat_median = dense.rolling(window).median()[window:]
+    fit = power_dat_median.loc[(power_dat_median.strain_2 > 0) & (power_dat_median.f_gw <= foreground.f_fit_max)]
+    # the gap leaves zero medians to be skipped
+    assert len(fit) < len(power_dat_median.loc[power_dat_median.f_gw <= foreground.f_fit_max])
+    popt, pcov = curve_fit(foreground.conf_func, xdata=np.log10(fit.f_gw.values), ydata=np.log10(fit.strain_2.values))
+
+    np.testing.assert_allclose(foreground.conf_fit(occupied, summed, window), popt, rtol=1e-12, atol=0)
+
+
+def test_sparse_power_round_trip(monkeypatch):
+    monkeypatch.setattr(foreground, '_lisa_bins', np.arange(foreground.f_min, 1e-4, foreground.df))
+    rng = np.random.default_rng(10)
+    occupied, summed = foreground.bin_power(10 ** rng.uniform(-5, -4, 5000), rng.uniform(0, 1, 5000))
+    summed[::7] = 0
+    sparse = foreground.sparse_power(occupied, summed)
+    assert np.all(sparse.strain_2 > 0)
+    grid = foreground.power_grid()
+    assert grid.n_bins.iloc[0] == len(foreground.lisa_bins())
+    pd.testing.assert_frame_equal(foreground.total_power(sparse.bin.values, sparse.strain_2.values),
+                                  foreground.total_power(occupied, summed))
@@ -0,0 +1,101 @@
+#===================================================================================
+# postproc.galaxy_chunks descriptors and build_chunk on a small synthetic task
+# (a conv table and a FIRE catalogue in one metallicity bin).
+#===================================================================================
+
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import postproc as pp
+
+
+i_met = 5
+
+
+def make_task(path, compress=False, prefilter=False, n_conv=3000, n_fire=4000, mass=2e4):
+    '''
+    Writes FIRE.h5 and a COSMIC-like dat file to path and returns the
+    task argument list of make_galaxy.
+    '''
+    rng = np.random.default_rng(1)
+    FIRE = pd.DataFrame({'met': rng.uniform(pp.met_arr[i_met], pp.met_arr[i_met+1], n_fire) / pp.Z_sun,
+                         'age': rng.uniform(0, 13.7, n_fire), 'kern_len': rng.uniform(0, 1e-3, n_fire),
+                         'xGx': rng.normal(0, 5, n_fire), 'yGx': rng.normal(0, 5, n_fire),
+                         'zGx': rng.normal(0, 1, n_fire)})
+    FIRE.to_hdf(path / 'FIRE.h5', key='data')
+    mass_1 = rng.uniform(0.2, 1.2, n_conv)
+    conv = pd.DataFrame({'bin_num': np.arange(n_conv), 'mass_1': mass_1,
+                         'mass_2': mass_1 * rng.uniform(0.3, 1, n_conv), 'kstar_1': 11, 'kstar_2': 10,
+                         'porb': 1.0, 'sep': 10 ** rng.uniform(-1.3, 0.5, n_conv),
+                         'tphys': rng.uniform(10, 13000, n_conv), 'rad_1': 0.0, 'rad_2': 0.0})
+    conv.to_hdf(path / 'dat_test.h5', key='conv')
+    pd.DataFrame({'mass': [mass]}).to_hdf(path / 'dat_test.h5', key='mass_stars')
+    path = str(path) + '/'
+    return [path, path, path, 'dat_test.h5', i_met, 'test', 0.8, 0.4, False, 1, compress, prefilter,
+            'uniform', 7]
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    pp._conv.clear()
+
+
+def test_descriptors_are_small(tmp_path):
+    dat = make_task(tmp_path)
+    chunks = list(pp.galaxy_chunks(dat, Nsamp_split=100000))
+    assert [chunk_id for chunk_id, desc in chunks] == list(range(len(chunks)))
+    assert max(len(pickle.dumps(desc)) for chunk_id, desc in chunks) < 2000
+
+
+def test_integer_portion_covers_particles(tmp_path):
+    dat = make_task(tmp_path)
+    chunks = list(pp.galaxy_chunks(dat, Nsamp_split=100000))
+    n_int = int(chunks[0][1][2])
+    counts = pd.concat([pp.build_chunk(desc)[0] for chunk_id, desc in chunks[1:]]).FIRE_index.value_counts()
+    assert len(counts) == chunks[0][1][5]
+    assert np.all(counts.values == n_int)
+    for chunk_id, desc in chunks[1:]:
+        assert len(pp.build_chunk(desc)[0]) == desc[5]
+
+
+@pytest.mark.parametrize('compress, prefilter', [(False, False), (True, False), (False, True)])
+def test_build_chunk_is_reproducible(tmp_path, compress, prefilter):
+    dat = make_task(tmp_path, compress=compress, prefilter=prefilter)
+    chunk_id, desc = list(pp.galaxy_chunks(dat, Nsamp_split=100000))[-1]
+    first = pp.build_chunk(desc)
+    pp._conv.clear()
+    again = pp.build_chunk(desc)
+    pd.testing.assert_frame_equal(first[0], again[0])
+    assert first[-1].spawn_key == again[-1].spawn_key
+
+
+@pytest.mark.parametrize('prefilter', [False, True])
+def test_compressed_chunks_split_particles(tmp_path, prefilter):
+    dat = make_task(tmp_path, compress=True, prefilter=prefilter)
+    chunks = list(pp.galaxy_chunks(dat, Nsamp_split=3000))
+    assert len(chunks) > 1
+    seen = set()
+    for chunk_id, desc in chunks:
+        pop = pp.build_chunk(desc)[0]
+        assert len(pop) <= desc[5]
+        particles = set(pop.FIRE_index)
+        assert not particles & seen
+        seen |= particles
+
+
+def test_prefilter_has_no_bin_num_pw(tmp_path):
+    for prefilter in [False, True]:
+        dat = make_task(tmp_path, prefilter=prefilter)
+        LISA_band = pp.filter_population(pp.build_chunk(list(pp.galaxy_chunks(dat))[-1][1]))
+        assert len(LISA_band) > 0
+        assert ('bin_num_pw' in LISA_band.columns) != prefilter
+
+
+def test_prefilter_refuses_interfiles(tmp_path):
+    dat = make_task(tmp_path, prefilter=True)
+    dat[8] = True
+    with pytest.raises(ValueError):
+        pp.make_galaxy(dat)
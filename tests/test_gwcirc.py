@@ -0,0 +1,78 @@
+#===================================================================================
+# gwcirc against a legwork Source (without interpolation) for circular
+# binaries, for stationary and for evolving binaries.
+#===================================================================================
+
+import numpy as np
+import astropy.units as u
+import pytest
+from legwork import psd, source, utils
+
+import gwcirc
+
+
+t_obs = 4 * u.yr
+t_obs_s = t_obs.to(u.s).value
+sc_params = {"instrument": "LISA", "t_obs": t_obs, "approximate_R": True, "confusion_noise": None}
+
+# h_0 and chirp are the same power laws as in legwork, so they agree to
+# round-off; the evolving SNR differs by the order of the integration
+rtol_strain = 1e-12
+rtol_snr = 1e-6
+
+
+def lisa_psd(f):
+    return psd.power_spectral_density(f * u.Hz, t_obs=t_obs, approximate_R=True,
+                                      confusion_noise=None).to(u.Hz**(-1)).value
+
+
+def population(num, log_f_gw, seed):
+    rng = np.random.default_rng(seed)
+    m_1 = rng.uniform(0.2, 1.2, num)
+    m_2 = rng.uniform(0.2, 1.2, num)
+    f_gw = 10**rng.uniform(*log_f_gw, num)
+    dist = rng.uniform(0.1, 30, num)
+    return m_1, m_2, f_gw, dist
+
+
+def legwork_source(m_1, m_2, f_gw, dist, stat_tol):
+    return source.Source(m_1=m_1 * u.Msun, m_2=m_2 * u.Msun, ecc=np.zeros(len(m_1)),
+                         dist=dist * u.kpc, f_orb=f_gw/2 * u.Hz, stat_tol=stat_tol,
+                         interpolate_g=False, interpolate_sc=False, sc_params=sc_params)
+
+
+# stationary: low frequencies and the legwork default stat_tol; evolving:
+# higher frequencies and a stat_tol small enough that all of them evolve
+cases = {'stationary': ((-4, -3), 1e-2, True),
+         'evolving': ((-2.5, -1.3), 1e-6, False)}
+
+
+@pytest.mark.parametrize('case', cases)
+def test_against_legwork(case):
+    log_f_gw, stat_tol, stationary = cases[case]
+    m_1, m_2, f_gw, dist = population(200, log_f_gw, seed=21)
+    assert np.all(gwcirc.is_stationary(m_1, m_2, f_gw, t_obs_s, stat_tol) == stationary)
+    sources = legwork_source(m_1, m_2, f_gw, dist, stat_tol)
+
+    h_0 = u.Quantity(sources.get_h_0_n(harmonics=[2])).to('').value.flatten()
+    np.testing.assert_allclose(gwcirc.h_2(m_1, m_2, f_gw, dist), h_0, rtol=rtol_strain, atol=0)
+
+    chirp = utils.fn_dot(sources.m_c, sources.f_orb, sources.ecc, n=2).to(u.Hz / u.s).value
+    np.testing.assert_allclose(gwcirc.chirp_circ(m_1, m_2, f_gw), chirp, rtol=rtol_strain, atol=0)
+
+    snr = sources.get_snr(t_obs=t_obs, verbose=False)
+    np.testing.assert_allclose(gwcirc.SNR_circ(m_1, m_2, f_gw, dist, lisa_psd, t_obs=t_obs_s,
+                                               stat_tol=stat_tol),
+                               snr, rtol=rtol_snr, atol=0)
+
+
+def test_mixed_population():
+    # stationary and evolving binaries in the same call, SNRs of the
+    # evolving ones integrated in several blocks
+    m_1, m_2, f_gw, dist = population(300, (-4, -1.3), seed=4)
+    stat = gwcirc.is_stationary(m_1, m_2, f_gw, t_obs_s, 1e-2)
+    assert np.any(stat) and np.any(~stat)
+    snr = legwork_source(m_1, m_2, f_gw, dist, 1e-2).get_snr(t_obs=t_obs, verbose=False)
+    np.testing.assert_allclose(gwcirc.SNR_circ(m_1, m_2, f_gw, dist, lisa_psd, t_obs=t_obs_s,
+                                               stat_tol=1e-2, block=17),
+                               snr, rtol=rtol_snr, atol=0)
@@ -0,0 +1,75 @@
+#===================================================================================
+# jitter.sample_offsets: the support and radial moments of every profile,
+# per-system kernel scales and reproducibility from a seed.
+#===================================================================================
+
+import numpy as np
+import pytest
+from scipy.integrate import quad
+
+import jitter
+
+
+num = 400000
+
+
+def spline_moment(k):
+    '''
+    <q^k> of the cubic-spline radial profile, by quadrature of the
+    kernel itself rather than of jitter's CDF.
+    '''
+    def w(q):
+        return 1 - 6 * q ** 2 + 6 * q ** 3 if q <= 0.5 else 2 * (1 - q) ** 3
+    norm = quad(lambda q: q ** 2 * w(q), 0, 1, points=[0.5])[0]
+    return quad(lambda q: q ** (2 + k) * w(q), 0, 1, points=[0.5])[0] / norm
+
+
+# <r^2> and <r^4> in units of R
+moments = {'uniform': (3 / 5, 3 / 7),
+           'gaussian': (3 / 4, 15 / 16),
+           'cubic_spline': (spline_moment(2), spline_moment(4))}
+
+
+@pytest.mark.parametrize('profile', jitter.profiles)
+def test_radial_moments(profile):
+    R = 0.3
+    x, y, z = jitter.sample_offsets(R, num, profile, rng=np.random.default_rng(16))
+    q2 = (x ** 2 + y ** 2 + z ** 2) / R ** 2
+    m2, m4 = moments[profile]
+    # a few standard errors of the sample means
+    assert abs(np.mean(q2) - m2) < 5 * np.std(q2) / np.sqrt(num)
+    assert abs(np.mean(q2 ** 2) - m4) < 5 * np.std(q2 ** 2) / np.sqrt(num)
+    if profile == 'gaussian':
+        # P(chi^2 with 3 degrees of freedom < 4)
+        assert abs(np.mean(q2 <= 1) - 0.7385) < 0.005
+    else:
+        assert np.all(q2 <= 1 + 1e-12)
+    # isotropic
+    for c in [x, y, z]:
+        assert abs(np.mean(c / R)) < 5 * np.sqrt(m2 / 3 / num)
+
+
+@pytest.mark.parametrize('profile', jitter.profiles)
+def test_per_system_scale(profile):
+    rng = np.random.default_rng(17)
+    R = 10 ** rng.uniform(-4, -1, num)
+    x, y, z = jitter.sample_offsets(R, num, profile, rng=rng)
+    q2 = (x ** 2 + y ** 2 + z ** 2) / R ** 2
+    assert abs(np.mean(q2) - moments[profile][0]) < 5 * np.std(q2) / np.sqrt(num)
+    if profile != 'gaussian':
+        assert np.all(q2 <= 1 + 1e-12)
+
+
+@pytest.mark.parametrize('profile', jitter.profiles)
+def test_reproducible(profile):
+    R = np.full(1000, 0.01)
+    first = jitter.sample_offsets(R, 1000, profile, rng=np.random.default_rng(18))
+    again = jitter.sample_offsets(R, 1000, profile, rng=np.random.default_rng(18))
+    other = jitter.sample_offsets(R, 1000, profile, rng=np.random.default_rng(19))
+    assert all(np.array_equal(a, b) for a, b in zip(first, again))
+    assert not np.array_equal(first[0], other[0])
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        jitter.sample_offsets(1.0, 10, 'top_hat', rng=np.random.default_rng(0))
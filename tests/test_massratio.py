@@ -0,0 +1,46 @@
+#===================================================================================
+# massratio.py: the integrated singles-to-binaries mass ratios against Monte
+# Carlo samples of the same model and against the ratios tabulated in
+# functions.py from a COSMIC sample, and the json cache of the means.
+#===================================================================================
+
+import os
+
+import numpy as np
+import pytest
+
+import functions
+import massratio
+
+
+@pytest.fixture(autouse=True)
+def fresh_means(monkeypatch):
+    monkeypatch.setattr(massratio, '_means', {})
+
+
+@pytest.mark.parametrize('binfrac', [0.5, 0.3, 0.1677])
+def test_matches_monte_carlo(binfrac):
+    rng = np.random.default_rng(15)
+    samples = [massratio.monte_carlo_ratio(binfrac, 100000, rng=rng) for k in range(12)]
+    mean, err = np.mean(samples), np.std(samples) / np.sqrt(len(samples))
+    assert abs(mean - massratio.mass_ratio(binfrac)) < 4 * err
+
+
+def test_matches_tabulated_ratios():
+    # the table carries the scatter of a single COSMIC sample and is
+    # rounded to 0.01
+    np.testing.assert_allclose(massratio.mass_ratio(functions.binfracs), functions.ratios, rtol=0, atol=0.011)
+    assert abs(massratio.mass_ratio(0.5) - functions.ratio_05) < 0.011
+
+
+def test_cache_round_trip(tmp_path, monkeypatch):
+    settings = massratio.sampler_settings(m1_min=0.1)
+    ratios = massratio.mass_ratio(functions.binfracs, settings, cache_dir=str(tmp_path))
+    cache = tmp_path / 'massratio_{}.json'.format(massratio.key(settings))
+    assert os.listdir(str(tmp_path)) == [cache.name]
+    # a new process only has the file
+    monkeypatch.setattr(massratio, '_means', {})
+    monkeypatch.setattr(massratio, 'integrate_means', None)
+    assert np.array_equal(massratio.mass_ratio(functions.binfracs, settings, cache_dir=str(tmp_path)), ratios)
+    # other settings have their own file
+    assert massratio.key(massratio.sampler_settings()) != massratio.key(settings)
@@ -0,0 +1,67 @@
+#===================================================================================
+# Reads of the partitioned parquet backend: postproc.read_Lband_model and the
+# pieces of lbandio.Lband_pieces return the rows of lbandio.read_Lband_dataset,
+# and every parquet file is memory-mapped.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+import lbandio
+import postproc as pp
+
+
+def write_dataset(path):
+    '''
+    Writes two chunks of two tasks of label 10_10 (both binary
+    fraction models) and returns the rows of the FZ model.
+    '''
+    rng = np.random.default_rng(4)
+    root = str(path / 'Lband_dataset')
+    FZ = []
+    for i in [2, 7]:
+        for binfrac in [pp.binfracs[i], 0.5]:
+            for chunk_id in range(2):
+                Lband = pd.DataFrame({'met': rng.uniform(0, 1.5, 300), 'f_gw': 10 ** rng.uniform(-4, -2, 300),
+                                      'weight': rng.integers(1, 5, 300)})
+                lbandio.write_Lband_parquet(Lband, root, '10_10', binfrac, pp.met_arr[i+1], chunk_id)
+                if binfrac != 0.5:
+                    FZ.append(Lband)
+    return pd.concat(FZ, ignore_index=True)
+
+
+@pytest.fixture
+def memory_maps(monkeypatch):
+    '''
+    Records the memory_map argument of every pq.read_table call.
+    '''
+    calls = []
+    read_table = pq.read_table
+    def recording(*args, **kwargs):
+        calls.append(kwargs.get('memory_map', False))
+        return read_table(*args, **kwargs)
+    monkeypatch.setattr(pq, 'read_table', recording)
+    return calls
+
+
+def test_read_Lband_model(tmp_path, memory_maps):
+    FZ = write_dataset(tmp_path)
+    path = str(tmp_path) + '/'
+    Lband = pp.read_Lband_model(path, ['10_10'], True, columns=['met', 'f_gw'], backend='parquet')
+    pd.testing.assert_frame_equal(Lband[['met', 'f_gw', 'weight']], FZ)
+    dataset = lbandio.read_Lband_dataset(path + 'Lband_dataset', label='10_10', model='FZ')
+    assert np.isclose(dataset.weight.sum(), Lband.weight.sum())
+    assert memory_maps and all(memory_maps)
+
+
+def test_pieces(tmp_path, memory_maps):
+    FZ = write_dataset(tmp_path)
+    files = pp.Lband_model_files(str(tmp_path) + '/', ['10_10'], True, backend='parquet')
+    pieces = lbandio.Lband_pieces(files, 128)
+    assert max(stop - start for filename, start, stop in pieces) == 128
+    Lband = pd.concat([lbandio.read_Lband_piece(piece) for piece in pieces], ignore_index=True)
+    pd.testing.assert_frame_equal(Lband, FZ)
+    assert all(memory_maps)
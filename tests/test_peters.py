@@ -0,0 +1,96 @@
+#===================================================================================
+# peters.evolve_population against the separate helpers of postproc
+# (merging_pop, RLOF_pop and evolve after the age cut of filter_population).
+#===================================================================================
+
+import numpy as np
+import pytest
+
+import peters
+import postproc as pp
+from population import Population
+
+
+# the numba loop uses its own pow and log routines; about 1e-14 is observed
+rtol_numba = 5e-13
+
+
+def random_population(num, seed=10):
+    '''
+    Formed, unformed, merged, Roche-lobe overflowing and detached
+    systems, plus systems with a NaN separation or secondary radius,
+    which are neither merged nor detached (UNDEFINED).
+    '''
+    rng = np.random.default_rng(seed)
+    mass_1 = rng.uniform(0.2, 1.3, num)
+    mass_2 = rng.uniform(0.15, 1.0, num) * mass_1
+    tphys = rng.uniform(10, 13000, num)
+    pop = Population({'id': np.arange(num), 'mass_1': mass_1, 'mass_2': mass_2,
+                      'sep': 10 ** rng.uniform(-4, 1, num),
+                      'rad_1': pp.rad_WD(mass_1), 'rad_2': pp.rad_WD(mass_2),
+                      'tphys': tphys, 'age': rng.uniform(0, 13.7, num)})
+    pop['sep'][rng.choice(num, num // 50, replace=False)] = np.nan
+    pop['rad_2'][rng.choice(num, num // 50, replace=False)] = np.nan
+    return pop
+
+
+def helper_status(pop):
+    '''
+    Status of every system from the helpers, and the helpers' evolved
+    detached population.
+    '''
+    pop = pop.subset(slice(None))
+    status = np.full(len(pop), peters.UNDEFINED, dtype=np.int8)
+    status[~(pop.tphys <= pop.age * 1000)] = peters.UNFORMED
+    pop.mask(pop.tphys <= pop.age * 1000)
+    pop, pop_merge = pp.merging_pop(pop)
+    status[pop_merge.id] = peters.MERGED
+    pop, pop_RLOF = pp.RLOF_pop(pop)
+    status[pop_RLOF.id] = peters.RLOF
+    status[pop.id] = peters.ALIVE
+    return status, pp.evolve(pop)
+
+
+@pytest.fixture(scope='module')
+def reference():
+    pop = random_population(20000)
+    return pop, helper_status(pop)
+
+
+def kernel(pop, use_numba):
+    return peters.evolve_population(pop.mass_1, pop.mass_2, pop.sep, pop.rad_2, pop.tphys, pop.age,
+                                    use_numba=use_numba)
+
+
+def test_all_classes_covered(reference):
+    pop, (status, alive) = reference
+    for cls in [peters.UNFORMED, peters.MERGED, peters.RLOF, peters.ALIVE, peters.UNDEFINED]:
+        assert np.any(status == cls)
+
+
+def test_numpy_identical(reference):
+    pop, (status_ref, alive) = reference
+    status, t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw = kernel(pop, use_numba=False)
+    assert np.array_equal(status, status_ref)
+    rows = alive.id
+    for name, arr in [('t_delay', t_delay), ('t_RLOF', t_RLOF), ('t_evol', t_evol),
+                      ('sep_f', sep_f), ('porb_f', porb_f), ('f_gw', f_gw)]:
+        assert np.array_equal(arr[rows], alive[name], equal_nan=True), name
+
+
+@pytest.mark.skipif(peters.numba is None, reason='numba is not installed')
+def test_numba_close(reference):
+    pop, (status_ref, alive) = reference
+    status, t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw = kernel(pop, use_numba=True)
+    assert np.array_equal(status, status_ref)
+    rows = alive.id
+    for name, arr in [('t_delay', t_delay), ('t_RLOF', t_RLOF), ('t_evol', t_evol),
+                      ('sep_f', sep_f), ('porb_f', porb_f), ('f_gw', f_gw)]:
+        np.testing.assert_allclose(arr[rows], alive[name], rtol=rtol_numba, atol=0, err_msg=name)
+
+
+def test_merged_sep_is_nan():
+    pop = random_population(2000, seed=3)
+    status, t_delay, t_RLOF, t_evol, sep_f, porb_f, f_gw = kernel(pop, use_numba=False)
+    formed = pop.tphys <= pop.age * 1000
+    assert np.all(np.isnan(sep_f[formed & (status == peters.MERGED)]))
@@ -0,0 +1,109 @@
+#===================================================================================
+# functions.WD_Cooling and photometry against the original cooling, which
+# evaluated both Mestel branches of every WD, and ZTF_df against the original
+# selection (mag_bol, then WD_Cooling and T_eff again on the selected rows)
+# for a fixed seed.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import functions
+import postproc as pp
+
+
+i = 5
+
+
+def old_WD_Cooling(data, i):
+    def L_WD(A, b, x, M, Z, t):
+        return (b * M * Z ** (0.4)) / (A * (t + 0.1)) ** x
+
+    def b_old(A):
+        return 300 * (9000 * A) ** (5.3)
+
+    A1 = functions.A_val(data.kstar_1.values)
+    A2 = functions.A_val(data.kstar_2.values)
+    M1 = data.mass_1.values
+    M2 = data.mass_2.values
+    Z = functions.met_arr[i+1] * np.ones(len(data))
+    t1 = data.t_evol_1.values
+    t2 = data.t_evol_2.values
+    L1_young = L_WD(A1, 300, 1.18, M1, Z, t1)
+    L1 = L_WD(A1, b_old(A1), 6.48, M1, Z, t1)
+    L2_young = L_WD(A2, 300, 1.18, M2, Z, t2)
+    L2 = L_WD(A2, b_old(A2), 6.48, M2, Z, t2)
+    L1[t1 < 9000.0] = L1_young[t1 < 9000.0]
+    L2[t2 < 9000.0] = L2_young[t2 < 9000.0]
+    return L1 * functions.L_sol, L2 * functions.L_sol
+
+
+def old_mag_bol(data, i):
+    L1, L2 = old_WD_Cooling(data, i)
+    d = data.dist_sun.values * 1000
+    m1_bol = 4.8 - 2.5 * np.log10(L1 / functions.L_sol) + 5 * np.log10(d / 10)
+    m2_bol = 4.8 - 2.5 * np.log10(L2 / functions.L_sol) + 5 * np.log10(d / 10)
+    return -2.5 * np.log10(10 ** (-0.4 * m1_bol) + 10 ** (-0.4 * m2_bol))
+
+
+def old_ZTF_df(data_i, m_lim, i):
+    m_tot = old_mag_bol(data_i, i)
+    data = data_i[(m_tot <= m_lim)&(data_i.porb_f.values <= 10)]
+    L1, L2 = old_WD_Cooling(data, i)
+    inc = np.arccos(np.random.uniform(0, 1, len(data)))
+    T1, T2 = functions.T_eff(L1, L2, data)
+    df = pd.DataFrame()
+    df['bin_num'] = data.bin_num
+    df['t_evol_1'] = data.t_evol_1.values
+    df['t_evol_2'] = data.t_evol_2.values
+    df['m1'] = data.mass_1.values
+    df['m2'] = data.mass_2.values
+    df['porb'] = data.porb_f.values
+    df['t_evol'] = data.t_evol.values
+    df['teff_1'] = T1
+    df['teff_2'] = T2
+    df['dist'] = data.dist_sun.values
+    df['rad1'] = data.rad_1.values
+    df['rad2'] = data.rad_2.values
+    df['inc'] = inc
+    return df
+
+
+@pytest.fixture
+def population():
+    rng = np.random.default_rng(14)
+    n = 20000
+    mass_1 = rng.uniform(0.2, 1.3, n)
+    mass_2 = rng.uniform(0.15, 1.0, n) * mass_1
+    # cooling ages on both sides of the 9000 Myr branch switch
+    t_evol = np.concatenate([rng.uniform(0, 13000, n - 200), 9000 + rng.uniform(-1e-6, 1e-6, 200)])
+    return pd.DataFrame({'bin_num': np.arange(n), 'mass_1': mass_1, 'mass_2': mass_2,
+                         'rad_1': pp.rad_WD(mass_1), 'rad_2': pp.rad_WD(mass_2),
+                         'kstar_1': rng.choice([10, 11, 12], n), 'kstar_2': rng.choice([10, 11, 12], n),
+                         't_evol_1': t_evol, 't_evol_2': rng.permutation(t_evol),
+                         't_evol': rng.uniform(0, 13000, n), 'dist_sun': 10 ** rng.uniform(-2, 1.5, n),
+                         'porb_f': 10 ** rng.uniform(-1.5, 1.5, n)}, index=rng.permutation(n))
+
+
+def test_cooling_is_unchanged(population):
+    L1, L2 = functions.WD_Cooling(population, i)
+    ref_L1, ref_L2 = old_WD_Cooling(population, i)
+    assert np.array_equal(L1, ref_L1)
+    assert np.array_equal(L2, ref_L2)
+    np.testing.assert_allclose(functions.mag_bol(population, i), old_mag_bol(population, i), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('m_lim', [18, 20, 23])
+def test_ZTF_selection_is_unchanged(population, m_lim):
+    np.random.seed(3)
+    ref = old_ZTF_df(population, m_lim, i)
+    assert 0 < len(ref) < len(population)
+    np.random.seed(3)
+    df = functions.ZTF_df(population, m_lim, i)
+    assert np.array_equal(df.bin_num.values, ref.bin_num.values)
+    pd.testing.assert_frame_equal(df, ref, check_exact=False, rtol=1e-13)
+    # the photometry computed once for the magnitude cut gives the same
+    np.random.seed(3)
+    pd.testing.assert_frame_equal(functions.ZTF_df(population, m_lim, i, phot=functions.photometry(population, i)),
+                                  df)
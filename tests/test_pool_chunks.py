@@ -0,0 +1,83 @@
+#===================================================================================
+# postproc.pool_chunks: chunks whose worker is killed (as by the OOM killer)
+# are requeued in more pieces on a respawned pool, and results the caller
+# holds back count against the chunks in flight.
+#===================================================================================
+
+import os
+import time
+import signal
+
+import pytest
+
+import postproc as pp
+
+
+def fake_filter(chunk, n_pieces=1, retry_factor=4, min_rows=10000, verbose=False):
+    '''
+    Stands in for filter_chunk: the 'killer' chunk kills its worker
+    unless it is split in pieces, or always if it is 'always'.
+    '''
+    key, desc = chunk
+    if key == 'slow':
+        time.sleep(2)
+    if (key == 'killer' and n_pieces == 1) or key == 'always':
+        os.kill(os.getpid(), signal.SIGKILL)
+    return key, desc[5], n_pieces
+
+
+def make_chunks(keys, rows=40000):
+    '''
+    (key, descriptor) chunks as galaxy_chunks yields them; only the
+    size bound is used.
+    '''
+    return [(key, [None, key, 1.0, 0, rows, rows]) for key in keys]
+
+
+@pytest.fixture(autouse=True)
+def fake(monkeypatch):
+    monkeypatch.setattr(pp, 'filter_chunk', fake_filter)
+
+
+def test_no_deaths():
+    keys = list(range(10))
+    out = list(pp.pool_chunks(make_chunks(keys), 2, 4))
+    assert [key for key, rows, n_pieces in out] == keys
+    assert all(n_pieces == 1 and rows == 40000 for key, rows, n_pieces in out)
+
+
+def test_killed_chunk_is_split_ordered():
+    keys = [0, 1, 'killer', 3, 4, 5]
+    out = list(pp.pool_chunks(make_chunks(keys), 2, 4))
+    assert [key for key, rows, n_pieces in out] == keys
+    assert dict((key, n_pieces) for key, rows, n_pieces in out)['killer'] == 4
+
+
+def test_killed_chunk_is_split_unordered():
+    keys = [0, 1, 'killer', 3, 4, 5]
+    out = list(pp.pool_chunks(make_chunks(keys), 2, 4, ordered=False))
+    assert sorted(map(str, (key for key, rows, n_pieces in out))) == sorted(map(str, keys))
+    assert dict((key, n_pieces) for key, rows, n_pieces in out)['killer'] == 4
+
+
+def test_gives_up():
+    with pytest.raises(RuntimeError):
+        list(pp.pool_chunks(make_chunks(['always'], rows=100), 2, 4, max_deaths=2))
+
+
+def test_held_results_are_bounded():
+    # the consumer writes results in submission order, as
+    # save_full_galaxy does, while the first chunk is slow
+    keys = ['slow'] + list(range(1, 40))
+    waiting = {}
+    written = []
+    largest = 0
+    for key, rows, n_pieces in pp.pool_chunks(make_chunks(keys), 2, 4, ordered=False, 
+                                              held=lambda: len(waiting)):
+        waiting[key] = rows
+        largest = max(largest, len(waiting))
+        while len(written) < len(keys) and keys[len(written)] in waiting:
+            waiting.pop(keys[len(written)])
+            written.append(keys[len(written)])
+    assert written == keys
+    assert largest <= 4
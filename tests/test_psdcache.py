@@ -0,0 +1,82 @@
+#===================================================================================
+# psdcache.py tables against legwork's psd.power_spectral_density, and with a
+# confusion fit against the direct sum of legwork's PSD and the fitted
+# confusion noise that postproc.cosmic_confusion replaces, over the whole
+# table, f_lo to f_hi.
+#===================================================================================
+
+import numpy as np
+import pytest
+import astropy.units as u
+from legwork import psd
+
+import foreground
+import postproc as pp
+import psdcache
+
+
+rtol = 1e-6
+t_obs = 4 * u.yr
+
+# a Galactic foreground above the LISA noise between about 0.1 and 3 mHz:
+# log10 h^2 = -44 - 2 (x + 3) - 0.5 (x + 3)^2 with x = log10 f
+popt = np.array([-54.5, -5.0, -0.5, 0.0, 0.0])
+
+
+@pytest.fixture
+def f():
+    '''
+    Random frequencies over the table, so most are between grid points,
+    plus both ends.
+    '''
+    rng = np.random.default_rng(5)
+    x = rng.uniform(np.log10(psdcache.f_lo), np.log10(psdcache.f_hi), 200000)
+    return np.concatenate([[psdcache.f_lo, psdcache.f_hi], 10**x])
+
+
+def direct_confusion(f):
+    '''
+    LISA PSD without legwork's confusion noise plus the confusion noise
+    of popt over t_obs, evaluated directly.
+    '''
+    S = psd.power_spectral_density(f * u.Hz, t_obs=t_obs, confusion_noise=None).to(u.Hz**(-1)).value
+    return S + 10**foreground.conf_func(np.log10(f), *popt) * t_obs.to(u.s).value
+
+
+@pytest.mark.parametrize('include_confusion_noise, confusion_noise', [(False, None), (True, 'robson19')])
+def test_table_matches_legwork(f, include_confusion_noise, confusion_noise):
+    params = psdcache.instrument_params(t_obs=t_obs, include_confusion_noise=include_confusion_noise)
+    S = psdcache.lisa_psd(f, params=params)
+    exact = psd.power_spectral_density(f * u.Hz, t_obs=t_obs,
+                                       confusion_noise=confusion_noise).to(u.Hz**(-1)).value
+    np.testing.assert_allclose(S, exact, rtol=rtol, atol=0)
+    assert psdcache.table(params)[2] < rtol
+
+
+def test_confusion_matches_direct(f):
+    exact = direct_confusion(f)
+    # the confusion noise dominates part of the band
+    assert np.any(exact > 10 * psd.power_spectral_density(f * u.Hz, t_obs=t_obs,
+                                                          confusion_noise=None).to(u.Hz**(-1)).value)
+    np.testing.assert_allclose(psdcache.lisa_psd(f, popt), exact, rtol=rtol, atol=0)
+    np.testing.assert_allclose(pp.cosmic_confusion_psd(popt)(f), exact, rtol=rtol, atol=0)
+
+
+def test_cosmic_confusion_as_legwork_custom_psd(f):
+    S = psd.power_spectral_density(f * u.Hz, instrument='custom', custom_psd=pp.cosmic_confusion(popt),
+                                   t_obs=t_obs, L=2.5e9 * u.m, approximate_R=True, confusion_noise=None)
+    np.testing.assert_allclose(S.to(u.Hz**(-1)).value, direct_confusion(f), rtol=rtol, atol=0)
+
+
+def test_disk_cache_round_trip(tmp_path, monkeypatch):
+    params = psdcache.instrument_params(t_obs=t_obs)
+    monkeypatch.setattr(psdcache, '_tables', {})
+    built = psdcache.table(params, popt, cache_dir=str(tmp_path))
+    assert [p.name for p in tmp_path.iterdir()] == ['psd_{}.npz'.format(psdcache.key(params, popt))]
+    # a new process only has the file
+    monkeypatch.setattr(psdcache, '_tables', {})
+    monkeypatch.setattr(psdcache, 'build_table', None)
+    loaded = psdcache.table(params, popt, cache_dir=str(tmp_path))
+    assert np.array_equal(loaded[0], built[0])
+    assert np.array_equal(loaded[1], built[1])
+    assert loaded[2] == built[2]
@@ -0,0 +1,62 @@
+#===================================================================================
+# reduce_datfiles.reduce_data read in small slices against the whole-file
+# groupby('bin_num').first() reduction, for fixed-format and table bpp.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import reduce_datfiles
+
+
+def random_bpp(num=400, seed=4):
+    '''
+    bpp-like rows: a few rows per binary starting at tphys 0, with
+    evol_types from 1 to 10, some NaN separations and one binary
+    whose history does not start with evol_type 1.
+    '''
+    rng = np.random.default_rng(seed)
+    n_rows = rng.integers(2, 9, num)
+    bin_num = np.repeat(np.arange(num) * 3, n_rows)
+    first = np.concatenate([[0], np.cumsum(n_rows)[:-1]])
+    tphys = rng.uniform(0, 1e4, len(bin_num))
+    tphys[first] = 0
+    tphys = tphys[np.lexsort([tphys, bin_num])]
+    evol_type = rng.integers(2, 11, len(bin_num)).astype(float)
+    evol_type[first] = 1
+    evol_type[first[5]] = 2
+    sep = rng.uniform(1, 100, len(bin_num))
+    sep[rng.choice(len(sep), 50, replace=False)] = np.nan
+    return pd.DataFrame({'tphys': tphys, 'mass_1': rng.uniform(0.5, 8, len(bin_num)),
+                         'kstar_1': rng.choice([1., 10., 11., 12.], len(bin_num)),
+                         'kstar_2': rng.choice([1., 10., 11., 12.], len(bin_num)),
+                         'sep': sep, 'evol_type': evol_type, 'bin_num': bin_num})
+
+
+def whole_file(bpp, label):
+    init = bpp.groupby('bin_num').first()
+    RLOFsep = bpp.loc[bpp.evol_type==3].groupby('bin_num').first()
+    CEsep = bpp.loc[bpp.evol_type==7].groupby('bin_num').first()
+    newbpp = pd.concat([init, RLOFsep, CEsep]).sort_values(by=['bin_num', 'tphys'])
+    if label == '11_11':
+        conv = bpp.loc[(bpp.kstar_1==11)&(bpp.kstar_2==11)].groupby('bin_num').first()
+    else:
+        conv = bpp.loc[(bpp.kstar_1==12)&(bpp.kstar_2.isin([10,11,12]))].groupby('bin_num').first()
+    return newbpp, conv
+
+
+@pytest.mark.parametrize('label', ['11_11', '12'])
+@pytest.mark.parametrize('fmt', ['fixed', 'table'])
+def test_slices_match_whole_file(tmp_path, fmt, label):
+    bpp = random_bpp()
+    old, new = str(tmp_path / 'old') + '/', str(tmp_path / 'new') + '/'
+    for path in [old, new]:
+        (tmp_path / path.strip('/').split('/')[-1]).mkdir()
+    data_columns = ['kstar_1', 'kstar_2'] if fmt == 'table' else None
+    bpp.to_hdf(old + 'dat.h5', key='bpp', format=fmt, data_columns=data_columns)
+    pd.DataFrame({'mass': [1e4]}).to_hdf(old + 'dat.h5', key='mass_stars')
+    reduce_datfiles.reduce_data(old, new, 'dat.h5', label, chunksize=37)
+    newbpp, conv = whole_file(bpp, label)
+    pd.testing.assert_frame_equal(pd.read_hdf(new + 'new_dat.h5', key='bpp'), newbpp)
+    pd.testing.assert_frame_equal(pd.read_hdf(new + 'reduced_dat.h5', key='conv'), conv)
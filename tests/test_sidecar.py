@@ -0,0 +1,47 @@
+#===================================================================================
+# sidecar.py dat sidecars kept in a cache directory, away from the inputs,
+# and Lband histograms of compact (float32) rows.
+#===================================================================================
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import sidecar
+
+
+def test_dat_meta_in_cache_dir(tmp_path):
+    inputs = tmp_path / 'dat'
+    inputs.mkdir()
+    filename = str(inputs / 'dat_test.h5')
+    pd.DataFrame({'mass_1': np.linspace(0.2, 1, 10)}).to_hdf(filename, key='conv')
+    pd.DataFrame({'mass': [1e4, 2e4]}).to_hdf(filename, key='mass_stars')
+    os.chmod(inputs, 0o555)
+    try:
+        cache_dir = str(tmp_path / 'meta_cache')
+        meta = sidecar.dat_meta(filename, cache_dir=cache_dir)
+        assert os.listdir(inputs) == ['dat_test.h5']
+        assert os.listdir(cache_dir) == ['dat_test.h5.meta.json']
+        assert meta['n_rows']['conv'] == 10 and meta['mass_binaries'] == 2e4
+        assert sidecar.read_meta(filename, cache_dir) == meta
+        assert sidecar.read_meta(filename) is None
+    finally:
+        os.chmod(inputs, 0o755)
+
+
+def test_float32_met_on_bin_edges():
+    # float32 met values next to the met_bins edges (in units of
+    # Z_sun), some of which float32 arithmetic puts in the wrong bin
+    edges = sidecar.met_bins
+    met = np.concatenate([np.float32(e / sidecar.Z_sun) + np.arange(-3, 4) * np.spacing(np.float32(e / sidecar.Z_sun))
+                          for e in edges[1:-1]]).astype('float32')
+    assert np.any(np.histogram(met * sidecar.Z_sun, bins=edges)[0] != 
+                  np.histogram(met.astype('float64') * sidecar.Z_sun, bins=edges)[0])
+    f_gw = np.full(len(met), 1e-3, dtype='float64')
+    compact = sidecar.add_Lband_rows(sidecar.empty_Lband_meta(), pd.DataFrame({'met': met, 'f_gw': f_gw}))
+    full = sidecar.add_Lband_rows(sidecar.empty_Lband_meta(), 
+                                  pd.DataFrame({'met': met.astype('float64'), 'f_gw': f_gw}))
+    assert compact['met_hist']['counts'] == full['met_hist']['counts']
+    assert compact['met_hist']['counts'] == np.histogram(met.astype('float64') * sidecar.Z_sun, 
+                                                         bins=edges)[0].tolist()
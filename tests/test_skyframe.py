@@ -0,0 +1,77 @@
+#===================================================================================
+# skyframe.ecliptic_colat_lon against astropy's SkyCoord.transform_to: sky
+# positions agree to a micro-arcsecond for random Galactic positions, at the
+# ecliptic poles and on both sides of longitude 0 / 360.
+#===================================================================================
+
+import numpy as np
+import pytest
+
+pytest.importorskip('astropy.coordinates')
+
+import skyframe
+
+
+uas = np.pi / 180 / 3600 * 1e-6  # rad
+
+
+def unit_vectors(colat, lon):
+    return np.vstack([np.sin(colat) * np.cos(lon), np.sin(colat) * np.sin(lon), np.cos(colat)])
+
+
+def separation(colat_1, lon_1, colat_2, lon_2):
+    '''
+    Angle between two sets of sky positions, well defined at the
+    poles and across the longitude wrap.
+    '''
+    u_1 = unit_vectors(colat_1, lon_1)
+    u_2 = unit_vectors(colat_2, lon_2)
+    return np.arctan2(np.linalg.norm(np.cross(u_1.T, u_2.T), axis=1), np.sum(u_1 * u_2, axis=0))
+
+
+def from_ecliptic(colat, lon, dist):
+    '''
+    Galactocentric X, Y, Z of ecliptic positions (dist in kpc), by
+    inverting the rotation of skyframe.
+    '''
+    R, offset = skyframe.galactocentric_to_ecliptic()
+    return np.linalg.solve(R, dist * unit_vectors(colat, lon) - offset[:, np.newaxis])
+
+
+def check(X, Y, Z):
+    colat, lon = skyframe.ecliptic_colat_lon(X, Y, Z)
+    ref_colat, ref_lon = skyframe.astropy_colat_lon(X, Y, Z)
+    assert np.all((lon >= 0) & (lon < 2 * np.pi))
+    assert np.max(separation(colat, lon, ref_colat, ref_lon)) < uas
+    return colat, lon, ref_colat, ref_lon
+
+
+def test_random_positions():
+    rng = np.random.default_rng(11)
+    n = 20000
+    X, Y, Z = rng.normal(0, 5, n), rng.normal(0, 5, n), rng.normal(0, 1, n)
+    colat, lon, ref_colat, ref_lon = check(X, Y, Z)
+    assert np.max(np.abs(colat - ref_colat)) < uas
+
+
+def test_poles():
+    rng = np.random.default_rng(12)
+    dist = 10 ** rng.uniform(-1, 1.5, 200)
+    for colat in [0, np.pi]:
+        X, Y, Z = from_ecliptic(np.full(200, colat), rng.uniform(0, 2 * np.pi, 200), dist)
+        out_colat = check(X, Y, Z)[0]
+        assert np.max(np.abs(out_colat - colat)) < uas
+
+
+def test_longitude_wrap():
+    rng = np.random.default_rng(13)
+    n = 400
+    # just below and just above longitude 0
+    lon = np.concatenate([-10 ** rng.uniform(-12, -6, n // 2), 10 ** rng.uniform(-12, -6, n // 2)])
+    colat = rng.uniform(0.1, np.pi - 0.1, n)
+    X, Y, Z = from_ecliptic(colat, lon, 10 ** rng.uniform(-1, 1.5, n))
+    colat, out_lon, ref_colat, ref_lon = check(X, Y, Z)
+    # both sides land in [0, 2 pi) and agree in longitude across the wrap
+    dlon = np.mod(out_lon - ref_lon + np.pi, 2 * np.pi) - np.pi
+    assert np.max(np.abs(dlon * np.sin(colat))) < uas
+    assert np.all((out_lon < 1e-5) | (out_lon > 2 * np.pi - 1e-5))
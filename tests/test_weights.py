@@ -0,0 +1,40 @@
+#===================================================================================
+# The weight column of compressed Lband files: rows read together with
+# uncompressed ones, and counts and averages equal to those of the expanded
+# (one row per system) population.
+#===================================================================================
+
+import numpy as np
+import pandas as pd
+
+import lbandio
+import visualization
+
+
+def expanded_and_compressed(rng, n=2000):
+    met = rng.uniform(0, 1.5, n)
+    weight = rng.integers(1, 5, n)
+    return pd.DataFrame({'met': np.repeat(met, weight)}), pd.DataFrame({'met': met, 'weight': weight})
+
+
+def test_read_mixed_files(tmp_path):
+    rng = np.random.default_rng(2)
+    expanded, compressed = expanded_and_compressed(rng)
+    plain = pd.DataFrame({'met': rng.uniform(0, 1.5, 500)})
+    lbandio.write_Lband(compressed, str(tmp_path / 'compressed.hdf'))
+    lbandio.write_Lband(plain, str(tmp_path / 'plain.hdf'))
+    Lband = lbandio.read_Lband_weighted([str(tmp_path / 'plain.hdf'), str(tmp_path / 'compressed.hdf')],
+                                        columns=['met'])
+    assert np.array_equal(Lband.weight.values, np.concatenate([np.ones(len(plain)), compressed.weight.values]))
+    bins = np.linspace(0, 1.5, 30)
+    counts, _ = np.histogram(Lband.met, bins=bins, weights=Lband.weight)
+    exact, _ = np.histogram(np.concatenate([plain.met.values, expanded.met.values]), bins=bins)
+    assert np.array_equal(counts, exact)
+
+
+def test_weighted_mean_std():
+    rng = np.random.default_rng(3)
+    expanded, compressed = expanded_and_compressed(rng)
+    avg, std = visualization.weighted_mean_std(compressed.met.values, compressed.weight.values)
+    assert np.isclose(avg, np.mean(expanded.met.values), rtol=1e-12)
+    assert np.isclose(std, np.std(expanded.met.values), rtol=1e-12)
@@ -1,19 +1,18 @@
 from utils import get_binfrac_of_Z, get_FeH_from_Z
+import psdcache
 import astropy.units as u
 import matplotlib.pyplot as plt
-import legwork.visualisation as vis
-from legwork import psd, utils
 from matplotlib.colors import TwoSlopeNorm
 from matplotlib import rcParams
 from matplotlib.lines import Line2D
 import matplotlib.colors as col
 import tqdm
-import seaborn as sns
 import pandas as pd
 import numpy as np
-from astropy import constants as const
-import astropy.coordinates as coords
-from astropy.time import Time
+import constants
+
+# legwork (utils.chirp_mass) and seaborn are imported by the plots that use
+# them, so importing this module stays quick
 
 rcParams['font.family'] = 'serif'
 rcParams['font.size'] = 14
@@ -26,20 +25,15 @@ met_arr = np.logspace(np.log10(1e-4), np.log10(0.03), 15)
 met_arr = np.round(met_arr, 8)
 met_arr = np.append(0.0, met_arr)
 
-G = const.G.value
-c = const.c.value  # speed of light in m s^-1
-M_sol = const.M_sun.value  # sun's mass in kg
-R_sol = const.R_sun.value  # sun's radius in metres
-sec_Myr = u.Myr.to('s')  # seconds in a million years
-m_kpc = u.kpc.to('m')  # metres in a kiloparsec
-L_sol = const.L_sun.value  # solar luminosity in Watts
-Z_sun = 0.02  # solar metallicity
-sun = coords.get_sun(Time("2021-04-23T00:00:00", scale='utc'))
-sun_g = sun.transform_to(coords.Galactocentric)
-sun_yGx = sun_g.galcen_distance.to('kpc').value
-sun_zGx = sun_g.z.to('kpc').value
-M_astro = 7070  # FIRE star particle mass in solar masses
-mag_lim = 23  # chosen bolometric magnitude limit
+# the Sun's position (sun_g, sun_yGx, sun_zGx) is computed on first use,
+# see constants.py
+from constants import Z_sun
+
+
+def __getattr__(name):
+    if name in constants.lazy:
+        return getattr(constants, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 
@@ -115,7 +109,7 @@ def plot_FIREpos(FIRE_path):
     Z = FIRE.zGx
     fig, ax = plt.subplots(figsize=(10, 8))
     plt.hist2d(X, Y, norm=col.LogNorm(), bins=500);
-    plt.scatter(0, sun_yGx, edgecolor='xkcd:light pink', facecolor='xkcd:bright pink', s=90, label='Sun')
+    plt.scatter(0, constants.sun_yGx, edgecolor='xkcd:light pink', facecolor='xkcd:bright pink', s=90, label='Sun')
     cb = plt.colorbar()
     cb.ax.set_ylabel('LogNormed Density')
     plt.legend(fontsize=20, markerscale=2)
@@ -281,6 +275,8 @@ def make_numLISAplot(numsFZ, numsF50, FIREmin=0.00015, FIREmax=13.346, Z_sun=0.0
     return 
 
 def make_Mc_fgw_plot(pathtodat, model):
+    import seaborn as sns
+    from legwork import utils
     resolved_dat = pd.read_hdf(pathtodat+'resolved_DWDs_{}.hdf'.format(model), key='resolved')
     
     resolved_dat = resolved_dat.loc[resolved_dat.resolved_chirp == 1.0]
@@ -461,6 +457,8 @@ def make_Mc_fgw_plot(pathtodat, model):
     return
 
 def make_Mc_dist_plot_total(pathtodat):
+    import seaborn as sns
+    from legwork import utils
     resolved_dat_FZ = pd.read_hdf(pathtodat+'resolved_DWDs_{}.hdf'.format('FZ'), key='resolved')
     resolved_dat_FZ = resolved_dat_FZ.loc[resolved_dat_FZ.resolved_chirp == 1.0]
     
@@ -514,6 +512,8 @@ def make_Mc_dist_plot_total(pathtodat):
     return
 
 def make_Mc_f_gw_plot_total(pathtodat):
+    import seaborn as sns
+    from legwork import utils
     resolved_dat_FZ = pd.read_hdf(pathtodat+'resolved_DWDs_{}.hdf'.format('FZ'), key='resolved')
     resolved_dat_FZ = resolved_dat_FZ.loc[resolved_dat_FZ.resolved_chirp == 1.0]
     
@@ -565,9 +565,20 @@ def make_Mc_f_gw_plot_total(pathtodat):
         
     return
 
+def weighted_mean_std(values, weights=None):
+    '''
+    Mean and standard deviation of values, each counted weights
+    times (once if weights is None).
+    '''
+    avg = np.average(values, weights=weights)
+    return avg, np.sqrt(np.average((values - avg)**2, weights=weights))
+
+
 def plot_intersep(Heinter, COHeinter, COinter, ONeinter, whichsep, FIREmin=0.000149, FIREmax=13.3456):
     '''
-    whichsep must be either "CEsep" or "RLOFsep"
+    whichsep must be either "CEsep" or "RLOFsep". Systems are
+    weighted by the weight column of the tables (see
+    postproc.get_interactionsep) when there is one.
     '''
     num = 30
     met_bins = np.logspace(np.log10(FIREmin), np.log10(FIREmax), num)#*Z_sun
@@ -588,32 +599,36 @@ def plot_intersep(Heinter, COHeinter, COinter, ONeinter, whichsep, FIREmin=0.000
 
         Hebin = Heinter.loc[(Heinter.met>=meti)&(Heinter.met<=metf)]
         if len(Hebin) != 0:
-            Heavgs.append(np.mean(Hebin[whichsep].values))
-            Hecovs.append(np.std(Hebin[whichsep].values))
+            avg, std = weighted_mean_std(Hebin[whichsep].values, Hebin.weight.values if 'weight' in Hebin else None)
+            Heavgs.append(avg)
+            Hecovs.append(std)
         else:
             Heavgs.append(0.)
             Hecovs.append(0.)
 
         COHebin = COHeinter.loc[(COHeinter.met>=meti)&(COHeinter.met<=metf)]
         if len(COHebin) != 0:
-            COHeavgs.append(np.mean(COHebin[whichsep].values))
-            COHecovs.append(np.std(COHebin[whichsep].values))
+            avg, std = weighted_mean_std(COHebin[whichsep].values, COHebin.weight.values if 'weight' in COHebin else None)
+            COHeavgs.append(avg)
+            COHecovs.append(std)
         else:
             COHeavgs.append(0.)
             COHecovs.append(0.)
 
         CObin = COinter.loc[(COinter.met>=meti)&(COinter.met<=metf)]
         if len(CObin) != 0:
-            COavgs.append(np.mean(CObin[whichsep].values))
-            COcovs.append(np.std(CObin[whichsep].values))
+            avg, std = weighted_mean_std(CObin[whichsep].values, CObin.weight.values if 'weight' in CObin else None)
+            COavgs.append(avg)
+            COcovs.append(std)
         else:
             COavgs.append(0.)
             COcovs.append(0.)
 
         ONebin = ONeinter.loc[(ONeinter.met>=meti)&(ONeinter.met<=metf)]
         if len(ONebin) != 0:
-            ONeavgs.append(np.mean(ONebin[whichsep].values))
-            ONecovs.append(np.std(ONebin[whichsep].values))
+            avg, std = weighted_mean_std(ONebin[whichsep].values, ONebin.weight.values if 'weight' in ONebin else None)
+            ONeavgs.append(avg)
+            ONecovs.append(std)
         else:
             ONeavgs.append(0.)
             ONecovs.append(0.)
@@ -816,18 +831,6 @@ def plot_intersep(Heinter, COHeinter, COinter, ONeinter, whichsep, FIREmin=0.000
 def plot_LISAcurves(pathtodat, model):
     from legwork.visualisation import plot_sensitivity_curve
     
-    def func(x, a, b, c, d, e):
-        return a + b*x + c*x**2 + d*x**3 + e*x**4
-    
-    def cosmic_confusion(f, L, t_obs=4 * u.yr, approximate_R=True, include_confusion_noise=False):
-        lisa_psd_no_conf = psd.power_spectral_density(f, include_confusion_noise=False, t_obs=4 * u.yr)
-        conf = 10**func(x=np.log10(f.value), 
-                        a=popt[0], b=popt[1], 
-                        c=popt[2], d=popt[3], e=popt[4]) * t_obs.to(u.s)
-    
-        psd_plus_conf = conf + lisa_psd_no_conf
-        return psd_plus_conf.to(u.Hz**(-1))
-    
     resolved = pd.read_hdf(pathtodat+'resolved_DWDs_{}.hdf'.format(model), key='resolved')
     popt = pd.read_hdf(pathtodat+'resolved_DWDs_{}.hdf'.format(model), key='conf_fit')
     popt = popt.values.flatten()
@@ -840,13 +843,9 @@ def plot_LISAcurves(pathtodat, model):
     t_obs = 4 * u.yr
     
     
-    psd_conf = psd.power_spectral_density(f=np.linspace(1e-4, 1e-1, 1000000) * u.Hz, 
-                                         instrument="custom", 
-                                         custom_function=cosmic_confusion, 
-                                         t_obs=t_obs, 
-                                         L=None, 
-                                         approximate_R=True, 
-                                         include_confusion_noise=False)
+    psd_conf = psdcache.lisa_psd(np.linspace(1e-4, 1e-1, 1000000), popt, 
+                                 params=psdcache.instrument_params(t_obs=t_obs), 
+                                 cache_dir=pathtodat + 'psd_cache/') * u.Hz**(-1)
     
     
     Heasd = ((1/4 * t_obs)**(1/2) * resolved_HeHe.h_0.values).to(u.Hz**(-1/2))